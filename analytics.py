@@ -3,16 +3,8 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-from get_stats import (
-    # Anciennes fonctions
-    get_feedback_stats, get_user_stats, get_conversation_stats,
-    get_daily_activity, get_connected_users, get_all_feedbacks,
-    # Nouvelles fonctions
-    get_total_users, get_total_documents, get_documents_by_type,
-    get_users_connected_now, get_users_connected_today, get_active_users_now,
-    get_total_conversations, get_conversations_by_day, get_conversations_by_weekday,
-    get_user_types
-)
+from get_stats import (get_all_feedbacks, get_active_users_now, get_users_connected_today,
+                       get_dashboard_snapshot)
 from auth import logout_user,create_users_table
 
 create_users_table()
@@ -55,17 +47,18 @@ with col2:
 
 st.divider()
 
-# --- Récupération des données ---
-total_users = get_total_users()
-total_documents = get_total_documents()
-users_connected_now = get_users_connected_now()
-total_conversations = get_total_conversations()
-feedback_stats = get_feedback_stats()
-user_stats = get_user_stats()
-user_types = get_user_types()
-documents_by_type = get_documents_by_type()
-conversations_by_day = get_conversations_by_day()
-conversations_by_weekday = get_conversations_by_weekday()
+# --- Récupération des données (une seule requête) ---
+snapshot = get_dashboard_snapshot(window=30)
+total_users = snapshot.total_users
+total_documents = snapshot.total_documents
+users_connected_now = snapshot.users_connected_now
+total_conversations = snapshot.total_conversations
+feedback_stats = snapshot.feedback_stats
+user_stats = snapshot.user_stats
+user_types = snapshot.user_types
+documents_by_type = snapshot.documents_by_type
+conversations_by_day = snapshot.conversations_by_day
+conversations_by_weekday = snapshot.conversations_by_weekday
 
 # === 1. MÉTRIQUES PRINCIPALES ===
 st.subheader("📈 Métriques Principales")
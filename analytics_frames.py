@@ -0,0 +1,234 @@
+"""
+Couche de données du tableau de bord seaborn/matplotlib.
+
+- Les statistiques sont chargées en DataFrames colonnaires directement depuis
+  SQL (`pandas.read_sql_query`), sans passer par des listes de tuples.
+- Les séries dérivées (satisfaction, moyennes, ancienneté de l'activité) sont
+  calculées de façon vectorisée.
+- Frames et figures sont mis en cache par version des données : tant que les
+  tables ne changent pas, un rerun Streamlit ne relance ni requête lourde ni
+  rendu matplotlib, les figures étant servies en octets PNG/SVG.
+"""
+
+import io
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import pandas as pd
+from matplotlib.figure import Figure
+
+from dashboard_snapshot import JOURS
+from get_stats import DB_PATH
+
+FIGURE_CACHE_SIZE = 64
+JOUR_ORDER = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
+
+# Empreinte bon marché de l'état des tables (la date couvre la fenêtre glissante)
+DATA_VERSION_SQL = """
+    SELECT
+        (SELECT COALESCE(MAX(id), 0) || '.' || COUNT(*) FROM conversations) || ':' ||
+        (SELECT COALESCE(MAX(id), 0) || '.' || COALESCE(MAX(timestamp), '') FROM message_feedback) || ':' ||
+        (SELECT COALESCE(group_concat(role || '=' || n), '') FROM (
+            SELECT role, COUNT(*) as n FROM users GROUP BY role ORDER BY role
+        )) || ':' ||
+        (SELECT COALESCE(SUM(is_active), 0) FROM user_sessions) || ':' ||
+        date('now')
+"""
+
+SCALARS_SQL = """
+    SELECT
+        (SELECT COUNT(*) FROM users) as total_users,
+        (SELECT COUNT(DISTINCT matricule) FROM user_sessions WHERE is_active = 1) as users_connected_now,
+        (SELECT COUNT(DISTINCT conv_name || '_' || matricule) FROM conversations) as total_conversations,
+        (SELECT COUNT(*) FROM message_feedback WHERE feedback_type = 'positive') as positive,
+        (SELECT COUNT(*) FROM message_feedback WHERE feedback_type = 'negative') as negative
+"""
+
+USER_TYPES_SQL = "SELECT role, COUNT(*) as count FROM users GROUP BY role"
+
+USERS_SQL = """
+    WITH feedback_per_user AS (
+        SELECT
+            matricule,
+            COUNT(CASE WHEN feedback_type = 'positive' THEN 1 END) as positive_feedbacks,
+            COUNT(CASE WHEN feedback_type = 'negative' THEN 1 END) as negative_feedbacks
+        FROM message_feedback
+        GROUP BY matricule
+    )
+    SELECT
+        c.matricule,
+        COUNT(CASE WHEN c.role = 'user' THEN 1 END) as total_questions,
+        COUNT(CASE WHEN c.role = 'assistant' THEN 1 END) as total_responses,
+        COUNT(DISTINCT c.conv_name) as total_conversations,
+        MIN(c.timestamp) as first_activity,
+        MAX(c.timestamp) as last_activity,
+        COALESCE(f.positive_feedbacks, 0) as positive_feedbacks,
+        COALESCE(f.negative_feedbacks, 0) as negative_feedbacks
+    FROM conversations c
+    LEFT JOIN feedback_per_user f ON f.matricule = c.matricule
+    GROUP BY c.matricule
+"""
+
+BY_DAY_SQL = """
+    SELECT
+        DATE(timestamp) as date,
+        COUNT(DISTINCT conv_name || '_' || matricule) as conv_count,
+        CAST(strftime('%w', DATE(timestamp)) AS INTEGER) as day_num
+    FROM conversations
+    WHERE timestamp >= date('now', :window)
+    GROUP BY DATE(timestamp)
+    ORDER BY date ASC
+"""
+
+BY_WEEKDAY_SQL = """
+    SELECT
+        CAST(strftime('%w', DATE(timestamp)) AS INTEGER) as day_num,
+        CAST(COUNT(DISTINCT DATE(timestamp) || '_' || conv_name || '_' || matricule) AS FLOAT) /
+        COUNT(DISTINCT DATE(timestamp)) as avg_convs
+    FROM conversations
+    GROUP BY strftime('%w', DATE(timestamp))
+"""
+
+FEEDBACKS_SQL = """
+    SELECT matricule, conversation_name, message_index, feedback_type, timestamp
+    FROM message_feedback
+    ORDER BY timestamp DESC
+"""
+
+
+@dataclass
+class AnalyticsFrames:
+    """Données du tableau de bord pour une version donnée des tables"""
+
+    version: str
+    window: int
+    total_users: int = 0
+    users_connected_now: int = 0
+    total_conversations: int = 0
+    feedback: dict = field(default_factory=lambda: {"positive": 0, "negative": 0})
+    user_types: pd.Series = None
+    users: pd.DataFrame = None
+    by_day: pd.DataFrame = None
+    by_weekday: pd.DataFrame = None
+    feedbacks: pd.DataFrame = None
+
+    @property
+    def total_feedbacks(self) -> int:
+        return self.feedback["positive"] + self.feedback["negative"]
+
+    @property
+    def satisfaction_rate(self) -> float:
+        return self.feedback["positive"] / self.total_feedbacks * 100 if self.total_feedbacks else 0
+
+
+_lock = threading.Lock()
+_frames = {}
+_figures = OrderedDict()
+
+
+@contextmanager
+def _connect():
+    # Connexion sans row_factory : read_sql_query construit les colonnes directement
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def data_version() -> str:
+    with _connect() as conn:
+        return conn.execute(DATA_VERSION_SQL).fetchone()[0]
+
+
+def _derive_users(users: pd.DataFrame) -> pd.DataFrame:
+    users["total_feedbacks"] = users["positive_feedbacks"] + users["negative_feedbacks"]
+    users["satisfaction_rate"] = (
+        users["positive_feedbacks"] * 100 / users["total_feedbacks"].where(users["total_feedbacks"] > 0)
+    ).fillna(0)
+    users["avg_questions_per_conv"] = (
+        users["total_questions"] / users["total_conversations"].where(users["total_conversations"] > 0)
+    ).round(1)
+    last_activity = pd.to_datetime(users["last_activity"], errors="coerce")
+    users["days_since_activity"] = (pd.Timestamp.now().normalize() - last_activity.dt.normalize()).dt.days
+    return users
+
+
+def _derive_by_day(by_day: pd.DataFrame) -> pd.DataFrame:
+    by_day["date"] = pd.to_datetime(by_day["date"])
+    by_day["day_name"] = by_day["day_num"].map(JOURS)
+    return by_day
+
+
+def _derive_by_weekday(by_weekday: pd.DataFrame) -> pd.DataFrame:
+    by_weekday["day_name"] = pd.Categorical(by_weekday["day_num"].map(JOURS), categories=JOUR_ORDER,
+                                            ordered=True)
+    return by_weekday.sort_values("day_name").reset_index(drop=True)
+
+
+def load_frames(window=30) -> AnalyticsFrames:
+    """Charge (ou reprend du cache) les frames de la version courante des données"""
+    version = data_version()
+    key = (version, window)
+    with _lock:
+        if key in _frames:
+            return _frames[key]
+
+    with _connect() as conn:
+        total_users, users_connected_now, total_conversations, positive, negative = \
+            conn.execute(SCALARS_SQL).fetchone()
+        user_types = pd.read_sql_query(USER_TYPES_SQL, conn, index_col="role")["count"]
+        users = pd.read_sql_query(USERS_SQL, conn)
+        by_day = pd.read_sql_query(BY_DAY_SQL, conn, params={"window": f"-{int(window)} days"})
+        by_weekday = pd.read_sql_query(BY_WEEKDAY_SQL, conn)
+        feedbacks = pd.read_sql_query(FEEDBACKS_SQL, conn)
+
+    frames = AnalyticsFrames(
+        version=version,
+        window=window,
+        total_users=total_users,
+        users_connected_now=users_connected_now,
+        total_conversations=total_conversations,
+        feedback={"positive": positive, "negative": negative},
+        user_types=user_types,
+        users=_derive_users(users),
+        by_day=_derive_by_day(by_day),
+        by_weekday=_derive_by_weekday(by_weekday),
+        feedbacks=feedbacks
+    )
+
+    with _lock:
+        # Seule la version courante est utile : les précédentes sont abandonnées
+        _frames.clear()
+        _frames[key] = frames
+    return frames
+
+
+def render_figure(name, version, draw, fmt="png", figsize=(8, 6), dpi=100) -> bytes:
+    """
+    Retourne la figure `name` rendue en octets (PNG ou SVG).
+    `draw(fig, ax)` n'est appelé que si la figure n'est pas en cache pour `version`.
+    """
+    key = (name, version, fmt, figsize, dpi)
+    with _lock:
+        if key in _figures:
+            _figures.move_to_end(key)
+            return _figures[key]
+
+    # Figure autonome (hors pyplot) : pas d'état global à nettoyer entre deux reruns
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    draw(fig, ax)
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, dpi=dpi)
+    data = buffer.getvalue()
+
+    with _lock:
+        _figures[key] = data
+        while len(_figures) > FIGURE_CACHE_SIZE:
+            _figures.popitem(last=False)
+    return data
@@ -1,13 +1,28 @@
 import sqlite3
 import streamlit as st
-import hashlib
 from datetime import datetime
+from credentials import hash_password, check_password, needs_rehash
+from scheduler import scheduler
+from session_store import SessionStore, SQLiteSessionBackend
+from user_directory import SQLiteUserDirectory
 
 DB_PATH = "users.db"
 
 def get_connection():
     return sqlite3.connect(DB_PATH, check_same_thread=False)
 
+# Sessions côté serveur, persistées dans la même base SQLite
+session_store = SessionStore(SQLiteSessionBackend(DB_PATH))
+
+# Flush et expiration des sessions : propres à chaque processus (store en mémoire)
+scheduler.register("session_flush", session_store.flush, interval=session_store.flush_interval,
+                   leader_only=False)
+scheduler.register("session_expiry", session_store.expire_idle, interval=60, leader_only=False)
+scheduler.start()
+
+# Annuaire des utilisateurs (recherche, pagination et suppression groupée en SQL)
+user_directory = SQLiteUserDirectory(DB_PATH)
+
 def create_users_table():
     conn = get_connection()
     conn.execute("""
@@ -36,11 +51,7 @@ def create_users_table():
     conn.commit()
     conn.close()
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(password: str, hashed: str) -> bool:
-    return hash_password(password) == hashed
+    user_directory.ensure_indexes()
 
 def register_user(matricule, nom, prenom, email, password, role):
     conn = get_connection()
@@ -51,26 +62,9 @@ def register_user(matricule, nom, prenom, email, password, role):
     conn.commit()
     conn.close()
 
-def update_session_activity(matricule):
-    """Met à jour l'activité de la session (appelé automatiquement)"""
-    conn = get_connection()
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    # Vérifier si une session existe
-    cursor = conn.execute(
-        "SELECT matricule FROM user_sessions WHERE matricule = ? AND is_active = 1",
-        (matricule,)
-    )
-
-    if cursor.fetchone():
-        # Mettre à jour l'activité
-        conn.execute(
-            "UPDATE user_sessions SET last_activity = ? WHERE matricule = ?",
-            (now, matricule)
-        )
-
-    conn.commit()
-    conn.close()
+def update_session_activity(matricule=None):
+    """Met à jour l'activité de la session (en mémoire, écrite en base par lots)"""
+    session_store.touch(st.session_state.get("session_token"))
 
 def login_user(matricule, password):
     conn = get_connection()
@@ -78,9 +72,16 @@ def login_user(matricule, password):
                           (matricule,))
     row = cursor.fetchone()
 
-    if row and verify_password(password, row[4]):
+    # Compte inconnu : vérification sur un hash factice, même durée de réponse
+    verified = check_password(password, row[4] if row else None)
+    if row and verified:
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+        # Migration transparente des anciens hash vers scrypt
+        if needs_rehash(row[4]):
+            conn.execute("UPDATE users SET password = ? WHERE matricule = ?",
+                         (hash_password(password), row[0]))
+
         # Vérifier si une session active existe déjà
         existing = conn.execute(
             "SELECT matricule FROM user_sessions WHERE matricule = ?",
@@ -109,6 +110,9 @@ def login_user(matricule, password):
         st.session_state.prenom = row[2]
         st.session_state.email = row[3]
         st.session_state.role = row[5]
+        st.session_state.session_token = session_store.create({
+            "matricule": row[0], "nom": row[1], "prenom": row[2], "email": row[3], "role": row[5]
+        })
 
         conn.close()
         return True
@@ -129,5 +133,7 @@ def logout_user():
         conn.commit()
         conn.close()
 
-    for key in ["logged_in", "matricule", "nom", "prenom", "email", "role"]:
+    session_store.revoke(st.session_state.get("session_token"))
+
+    for key in ["logged_in", "matricule", "nom", "prenom", "email", "role", "session_token"]:
         st.session_state.pop(key, None)
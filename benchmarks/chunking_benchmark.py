@@ -0,0 +1,104 @@
+"""
+Benchmark du découpage : structure (`chunking.StructureChunker`) contre
+découpage récursif à 520 caractères.
+
+Pour chaque découpeur : nombre et taille des chunks, tokens à embedder (coût
+d'indexation) et, si des questions sont disponibles, taux de succès de la
+recherche (top-k dont le contexte couvre au moins `--min-support` de la
+réponse attendue) et tokens de contexte par question.
+
+    python -m benchmarks.chunking_benchmark docs/convention.pdf docs/reglement.pdf
+    python -m benchmarks.chunking_benchmark docs/*.pdf --questions questions.csv --k 3
+
+Le CSV de questions a deux colonnes : question, answer. Sans CSV, les paires
+question/réponse de l'historique sont utilisées.
+"""
+
+import argparse
+import csv
+
+import numpy as np
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+
+from benchmarks.common import answer_support, print_table, summarize
+from chat_db import get_qa_pairs
+from chunking import get_text_splitter
+from embeddings_backend import bind_collection_embeddings, embed_queries
+from src.vectorstore import get_vector_store
+from tokens import count_tokens
+
+CHUNKERS = ("recursive", "structure")
+
+
+def load_pages(path):
+    if path.lower().endswith(".pdf"):
+        return PyPDFLoader(path).load()
+    with open(path, encoding="utf-8") as f:
+        return [Document(page_content=f.read(), metadata={"source": path})]
+
+
+def load_questions(path, limit):
+    if not path:
+        return get_qa_pairs(limit)
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return [(row["question"], row["answer"]) for row in csv.DictReader(f)][:limit]
+
+
+def _normalize(vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-9)
+
+
+def run(paths, questions_path=None, limit=200, k=5, min_support=0.5, price_per_million=0.10):
+    documents = [load_pages(path) for path in paths]
+    questions = load_questions(questions_path, limit)
+    embeddings = bind_collection_embeddings(get_vector_store()).embeddings
+    question_vectors = _normalize(embed_queries(embeddings, [q for q, _ in questions])) if questions else None
+
+    rows = []
+    for name in CHUNKERS:
+        splitter = get_text_splitter(name)
+        chunks = [chunk for pages in documents for chunk in splitter.split_documents(pages)]
+        texts = [chunk.page_content for chunk in chunks]
+        sizes = [len(text) for text in texts]
+        embed_tokens = sum(count_tokens(text) for text in texts)
+
+        hit_rate, context_tokens = "-", "-"
+        if questions and texts:
+            scores = question_vectors @ _normalize(embeddings.embed_documents(texts)).T
+            hits, tokens = 0, []
+            for (_, answer), row in zip(questions, scores):
+                context = "\n\n".join(texts[i] for i in np.argsort(-row)[:k])
+                hits += answer_support(context, answer) >= min_support
+                tokens.append(count_tokens(context))
+            hit_rate = f"{hits / len(questions):.1%}"
+            context_tokens = f"{summarize(tokens)[0]:.0f}"
+
+        mean_size, median_size = summarize(sizes)
+        rows.append([
+            name,
+            len(chunks),
+            f"{mean_size:.0f} / {median_size:.0f}",
+            embed_tokens,
+            f"${embed_tokens / 1_000_000 * price_per_million:.4f}",
+            hit_rate,
+            context_tokens,
+        ])
+
+    print(f"\n{len(paths)} document(s), {len(questions)} question(s), top-{k}\n")
+    print_table(["Découpeur", "Chunks", "Caractères moy./méd.", "Tokens embeddés", "Coût indexation",
+                 f"Succès (support ≥ {min_support:.0%})", "Tokens contexte"], rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark du découpage des documents")
+    parser.add_argument("paths", nargs="+", help="Fichiers PDF ou texte")
+    parser.add_argument("--questions", help="CSV question,answer (par défaut : historique des conversations)")
+    parser.add_argument("--limit", type=int, default=200, help="Nombre maximal de questions")
+    parser.add_argument("--k", type=int, default=5, help="Chunks récupérés par question")
+    parser.add_argument("--min-support", type=float, default=0.5, help="Support minimal pour compter un succès")
+    parser.add_argument("--price-per-million", type=float, default=0.10,
+                        help="Prix de l'embedding par million de tokens (USD)")
+    args = parser.parse_args()
+    run(args.paths, args.questions, args.limit, args.k, args.min_support, args.price_per_million)
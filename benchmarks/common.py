@@ -0,0 +1,35 @@
+"""
+Outils communs aux benchmarks de la chaîne RAG (à lancer depuis la racine du projet).
+"""
+
+import re
+import statistics
+
+_WORD = re.compile(r"\w{4,}", re.UNICODE)
+
+
+def answer_support(context: str, answer: str) -> float:
+    """
+    Part des mots significatifs de la réponse de référence présents dans le
+    contexte : indicateur de la qualité du contexte fourni au modèle.
+    """
+    answer_words = {w.lower() for w in _WORD.findall(answer)}
+    if not answer_words:
+        return 0.0
+    context_words = {w.lower() for w in _WORD.findall(context)}
+    return len(answer_words & context_words) / len(answer_words)
+
+
+def summarize(values):
+    """(moyenne, médiane) d'une série, 0 si vide"""
+    if not values:
+        return 0.0, 0.0
+    return statistics.mean(values), statistics.median(values)
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(str(v).ljust(w) for v, w in zip(row, widths)))
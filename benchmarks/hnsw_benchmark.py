@@ -0,0 +1,113 @@
+"""
+Benchmark des paramètres HNSW (M, ef de construction, ef de recherche) :
+rappel contre latence, sur les vecteurs réels d'une collection Chroma.
+
+Les requêtes sont des vecteurs de la collection retirés de l'index construit
+(comme des questions proches de passages existants) ; la vérité terrain est
+la recherche exacte. Pour chaque combinaison : temps de construction, rappel
+top-k et latence par requête (un thread, comme une recherche de l'application).
+La configuration recommandée est la plus rapide qui atteint --target-recall ;
+elle s'applique par une compaction (`vectorstore_maintenance compact`).
+
+    python -m benchmarks.hnsw_benchmark --collection documents
+    python -m benchmarks.hnsw_benchmark --collection documents --M 16 32 --search-ef 32 64 128 256
+"""
+
+import argparse
+import random
+import time
+
+import hnswlib
+import numpy as np
+
+from benchmarks.common import print_table, summarize
+from vectorstore_maintenance import get_client, hnsw_params, iter_chunks
+
+
+def load_vectors(collection_name, limit=None):
+    collection = get_client().get_collection(collection_name)
+    vectors = []
+    for _, page in iter_chunks(collection, include=("embeddings",)):
+        vectors.extend(page["embeddings"])
+        if limit and len(vectors) >= limit:
+            break
+    vectors = np.asarray(vectors[:limit] if limit else vectors, dtype=np.float32)
+    return vectors, hnsw_params(collection)["hnsw:space"]
+
+
+def exact_neighbors(data, queries, k, space):
+    """Top-k exact (indices dans `data`) pour chaque requête"""
+    if space == "cosine":
+        data = data / np.linalg.norm(data, axis=1, keepdims=True)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    if space == "l2":
+        scores = (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ data.T + (data ** 2).sum(axis=1)[None, :]
+    else:
+        scores = -(queries @ data.T)
+    top = np.argpartition(scores, k, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+
+def run(collection_name, limit, query_count, k, m_values, construction_values, search_values, target_recall):
+    vectors, space = load_vectors(collection_name, limit)
+    if len(vectors) <= query_count + k:
+        print(f"⚠️ Trop peu de vecteurs ({len(vectors)}) pour {query_count} requêtes")
+        return
+    order = list(range(len(vectors)))
+    random.Random(0).shuffle(order)
+    queries, data = vectors[order[:query_count]], vectors[order[query_count:]]
+    print(f"📚 {len(data)} vecteurs indexés, {len(queries)} requêtes, dimension {vectors.shape[1]}, espace {space}")
+    truth = exact_neighbors(data, queries, k, space)
+
+    rows, results = [], []
+    for m in m_values:
+        for construction_ef in construction_values:
+            index = hnswlib.Index(space=space, dim=data.shape[1])
+            start = time.perf_counter()
+            index.init_index(max_elements=len(data), ef_construction=construction_ef, M=m)
+            index.add_items(data, np.arange(len(data)))
+            build_time = time.perf_counter() - start
+            index.set_num_threads(1)
+
+            for search_ef in search_values:
+                index.set_ef(max(search_ef, k))
+                durations, recalls = [], []
+                for query, expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    labels, _ = index.knn_query(query, k=k)
+                    durations.append((time.perf_counter() - start) * 1000)
+                    recalls.append(len(expected & set(labels[0])) / k)
+                mean_ms, median_ms = summarize(durations)
+                recall = summarize(recalls)[0]
+                results.append((m, construction_ef, search_ef, recall, mean_ms))
+                rows.append([m, construction_ef, search_ef, f"{build_time:.1f} s", f"{recall:.1%}",
+                             f"{mean_ms:.2f} / {median_ms:.2f} ms"])
+                print(f"   M={m} ef_construction={construction_ef} ef={search_ef} : rappel {recall:.1%}")
+
+    print()
+    print_table(["M", "ef construction", "ef recherche", "Construction", f"Rappel@{k}", "Latence moy./méd."], rows)
+
+    eligible = [r for r in results if r[3] >= target_recall]
+    if eligible:
+        m, construction_ef, search_ef, recall, mean_ms = min(eligible, key=lambda r: r[4])
+        print(f"\n✅ Recommandé (rappel ≥ {target_recall:.0%}) : M={m}, ef_construction={construction_ef}, "
+              f"ef={search_ef} ({recall:.1%}, {mean_ms:.2f} ms)")
+        print(f"   python -m vectorstore_maintenance compact --collection {collection_name} "
+              f"--M {m} --construction-ef {construction_ef} --search-ef {search_ef}")
+    else:
+        print(f"\n⚠️ Aucune configuration n'atteint un rappel de {target_recall:.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark des paramètres HNSW (rappel / latence)")
+    parser.add_argument("--collection", required=True, help="Nom de la collection Chroma")
+    parser.add_argument("--limit", type=int, default=20000, help="Nombre maximal de vecteurs chargés")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--M", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 32, 64, 128])
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    args = parser.parse_args()
+    run(args.collection, args.limit, args.queries, args.k, args.M, args.construction_ef,
+        args.search_ef, args.target_recall)
@@ -0,0 +1,107 @@
+"""
+Benchmark de l'OCR : pages brutes à 300 dpi contre pages prétraitées
+(`ocr_preprocess` : sonde, pages blanches ignorées, dpi adaptatif,
+redressement, binarisation, rognage), avec le moteur OCR choisi
+(`ocr_engine` : API tesserocr persistante ou sous-processus pytesseract).
+
+Pour chaque variante : temps d'OCR total et par page, pages ignorées et,
+si une transcription de référence `<nom>.txt` accompagne le PDF, exactitude
+au caractère (1 - distance d'édition / longueur de la référence, espaces
+normalisés ; avec --pages, la référence ne doit couvrir que ces pages).
+Le cache OCR n'est pas utilisé.
+
+    python -m benchmarks.ocr_benchmark samples/ocr/
+    python -m benchmarks.ocr_benchmark scan1.pdf scan2.pdf --pages 3
+    python -m benchmarks.ocr_benchmark samples/ocr/ --engine pytesseract --engine tesserocr
+"""
+
+import argparse
+import difflib
+import glob
+import os
+import time
+
+from pypdf import PdfReader
+
+from benchmarks.common import print_table, summarize
+from document_pipeline import ocr_page, page_renderer
+from ocr_engine import get_ocr_engine
+
+VARIANTS = (("brut 300 dpi", False), ("prétraité", True))
+
+
+def _normalize(text):
+    return " ".join(text.split())
+
+
+def char_accuracy(reference, hypothesis) -> float:
+    """1 - (distance d'édition approchée par difflib) / longueur de la référence"""
+    reference, hypothesis = _normalize(reference), _normalize(hypothesis)
+    if not reference:
+        return 1.0 if not hypothesis else 0.0
+    matcher = difflib.SequenceMatcher(None, reference, hypothesis, autojunk=False)
+    edits = sum(max(i2 - i1, j2 - j1) for op, i1, i2, j1, j2 in matcher.get_opcodes() if op != "equal")
+    return max(0.0, 1 - edits / len(reference))
+
+
+def collect(paths):
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "*.pdf"))) if os.path.isdir(path) else [path])
+    return files
+
+
+def run(paths, max_pages=None, engines=("auto",)):
+    files = collect(paths)
+    samples = []
+    for path in files:
+        with open(path, "rb") as f:
+            data = f.read()
+        page_count = len(PdfReader(path).pages)
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        reference = None
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as f:
+                reference = f.read()
+        samples.append((path, data, range(min(page_count, max_pages or page_count)), reference))
+
+    rows = []
+    for (variant, preprocess), engine_name in [(v, e) for e in engines for v in VARIANTS]:
+        engine = get_ocr_engine(engine_name)
+        name = f"{engine.name} · {variant}"
+        durations, accuracies, skipped = [], [], 0
+        for path, data, pages, reference in samples:
+            texts = []
+            with page_renderer(data) as render:
+                for page_num in pages:
+                    start = time.perf_counter()
+                    text = ocr_page(render, page_num, preprocess=preprocess, engine=engine)
+                    durations.append(time.perf_counter() - start)
+                    skipped += not text.strip()
+                    texts.append(text)
+            if reference is not None:
+                accuracies.append(char_accuracy(reference, "\n".join(texts)))
+            print(f"   {name} · {os.path.basename(path)} : {len(pages)} page(s)")
+
+        mean_time, median_time = summarize(durations)
+        rows.append([
+            name,
+            len(durations),
+            f"{sum(durations):.1f} s",
+            f"{mean_time:.2f} / {median_time:.2f} s",
+            skipped,
+            f"{summarize(accuracies)[0]:.1%}" if accuracies else "-",
+        ])
+
+    print(f"\n{len(samples)} document(s), {sum(r is not None for *_, r in samples)} avec référence\n")
+    print_table(["Variante", "Pages", "Temps total", "Par page moy./méd.", "Pages vides", "Exactitude"], rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark du prétraitement OCR")
+    parser.add_argument("paths", nargs="+", help="PDF scannés ou répertoires (références <nom>.txt facultatives)")
+    parser.add_argument("--pages", type=int, help="Nombre maximal de pages par document")
+    parser.add_argument("--engine", action="append", choices=["auto", "tesserocr", "pytesseract"],
+                        help="Moteur(s) OCR à comparer (par défaut : auto)")
+    args = parser.parse_args()
+    run(args.paths, args.pages, args.engine or ("auto",))
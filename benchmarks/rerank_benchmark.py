@@ -0,0 +1,89 @@
+"""
+Benchmark du reclassement (et de la compression de contexte) sur les logs de questions/réponses.
+
+Rejoue des questions de `conversations` avec le retriever de base (k=5, seuil
+0.5) puis avec chaque reranker, et compare la taille du contexte (tokens
+envoyés au prompt) au taux de support de la réponse enregistrée (part des mots
+de la réponse présents dans le contexte). `--compress` ajoute, pour chaque
+configuration, une variante passée par `compression.ContextCompressor`.
+
+    python -m benchmarks.rerank_benchmark --limit 200 --positive-only --compress
+"""
+
+import argparse
+import time
+
+from benchmarks.common import answer_support, print_table, summarize
+from chat_db import get_qa_pairs
+from compression import ContextCompressor
+from embeddings_backend import bind_collection_embeddings, embed_queries
+from rerank import RERANKERS
+from retrieval import CachedRetriever
+from src.utils import format_docs
+from src.vectorstore import get_vector_store
+from tokens import count_tokens
+
+
+def run(limit=200, positive_only=False, rerankers=("gap", "cross-encoder"), fetch_k=20, compress=False):
+    pairs = get_qa_pairs(limit, positive_only)
+    if not pairs:
+        print("Aucune paire question/réponse dans l'historique")
+        return
+
+    vector_store = bind_collection_embeddings(get_vector_store())
+    # Embeddings calculés une fois : seule l'étape de sélection varie entre configurations
+    embeddings = embed_queries(vector_store.embeddings, [question for question, _ in pairs])
+
+    configurations = {"base (k=5)": CachedRetriever(vector_store, department=None, cache=None)}
+    for name in rerankers:
+        configurations[f"{name} (fetch {fetch_k})"] = CachedRetriever(
+            vector_store, department=None, cache=None, reranker=RERANKERS[name](), fetch_k=fetch_k
+        )
+    variants = [(label, retriever, None) for label, retriever in configurations.items()]
+    if compress:
+        compressor = ContextCompressor(vector_store.embeddings)
+        variants += [(f"{label} + compression", retriever, compressor)
+                     for label, retriever in configurations.items()]
+
+    rows = []
+    baseline_tokens = None
+    for label, retriever, compressor in variants:
+        tokens, support, chunks = [], [], []
+        start = time.perf_counter()
+        for (question, answer), embedding in zip(pairs, embeddings):
+            docs = retriever.retrieve(question, embedding)
+            if compressor is not None:
+                docs = compressor.compress(question, docs, embedding)
+            context = format_docs(docs)
+            tokens.append(count_tokens(context))
+            support.append(answer_support(context, answer))
+            chunks.append(len(docs))
+        elapsed = (time.perf_counter() - start) / len(pairs) * 1000
+
+        mean_tokens, median_tokens = summarize(tokens)
+        baseline_tokens = baseline_tokens or mean_tokens
+        saving = 1 - mean_tokens / baseline_tokens if baseline_tokens else 0
+        rows.append([
+            label,
+            f"{summarize(chunks)[0]:.1f}",
+            f"{mean_tokens:.0f}",
+            f"{median_tokens:.0f}",
+            f"{saving:+.0%}" if label != "base (k=5)" else "-",
+            f"{summarize(support)[0]:.1%}",
+            f"{elapsed:.0f} ms",
+        ])
+
+    print(f"\n{len(pairs)} paires question/réponse{' (feedback positif)' if positive_only else ''}\n")
+    print_table(["Configuration", "Chunks", "Tokens moy.", "Tokens méd.", "Économie", "Support réponse",
+                 "Sélection/question"], rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark du reclassement des chunks")
+    parser.add_argument("--limit", type=int, default=200, help="Nombre de paires question/réponse")
+    parser.add_argument("--positive-only", action="store_true", help="Uniquement les réponses notées 👍")
+    parser.add_argument("--fetch-k", type=int, default=20, help="Candidats récupérés avant reclassement")
+    parser.add_argument("--rerankers", nargs="+", default=["gap", "cross-encoder"], choices=list(RERANKERS))
+    parser.add_argument("--compress", action="store_true", help="Mesurer aussi la compression de contexte")
+    args = parser.parse_args()
+    run(args.limit, args.positive_only, args.rerankers, args.fetch_k, args.compress)
@@ -128,3 +128,43 @@ def get_feedback(matricule, conversation_name, message_index):
     conn.close()
 
     return result[0] if result else None
+
+
+def get_frequent_questions(limit=200):
+    """Questions les plus posées (toutes conversations), pour le préchauffage des caches"""
+    with get_conn() as conn:
+        rows = conn.execute("""
+            SELECT MIN(content) as content, COUNT(*) as count
+            FROM conversations
+            WHERE role = 'user'
+            GROUP BY lower(trim(content))
+            ORDER BY count DESC
+            LIMIT ?
+        """, (limit,)).fetchall()
+    return [(row["content"], row["count"]) for row in rows]
+
+
+def get_qa_pairs(limit=200, positive_only=False):
+    """
+    Paires (question, réponse) consécutives des conversations, pour les benchmarks.
+    `positive_only` ne garde que les réponses ayant reçu un feedback positif.
+    """
+    with get_conn() as conn:
+        rows = conn.execute(f"""
+            WITH numbered AS (
+                SELECT
+                    matricule, conv_name, role, content,
+                    ROW_NUMBER() OVER (PARTITION BY matricule, conv_name ORDER BY id) - 1 as message_index,
+                    LAG(role) OVER (PARTITION BY matricule, conv_name ORDER BY id) as previous_role,
+                    LAG(content) OVER (PARTITION BY matricule, conv_name ORDER BY id) as question
+                FROM conversations
+            )
+            SELECT n.question, n.content as answer
+            FROM numbered n
+            {"JOIN message_feedback f ON f.matricule = n.matricule AND f.conversation_name = n.conv_name "
+             "AND f.message_index = n.message_index AND f.feedback_type = 'positive'" if positive_only else ""}
+            WHERE n.role = 'assistant' AND n.previous_role = 'user'
+            ORDER BY RANDOM()
+            LIMIT ?
+        """, (limit,)).fetchall()
+    return [(row["question"], row["answer"]) for row in rows]
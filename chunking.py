@@ -0,0 +1,240 @@
+"""
+Découpage des documents selon leur structure (textes juridiques et RH).
+
+Au lieu de couper tous les 520 caractères, le texte est analysé en sections
+(titres, chapitres, « Article N », intitulés numérotés) puis en blocs
+(paragraphes, clauses numérotées, tableaux). Une section qui tient dans
+`max_chars` donne un seul chunk ; une section plus longue est découpée en
+chunks enfants alignés sur ses blocs, tous rattachés à la section parente
+(`section_id`). Un tableau n'est jamais coupé au milieu d'une ligne et son
+en-tête est répété dans chaque morceau.
+
+`get_text_splitter()` retourne ce découpeur ou, avec CHUNKER=recursive,
+l'ancien `RecursiveCharacterTextSplitter`.
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from sentence_index import split_sentences
+
+CHUNKER = os.getenv("CHUNKER", "structure")
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", 1200))
+CHUNK_CHILD_CHARS = int(os.getenv("CHUNK_CHILD_CHARS", 520))
+
+# Niveaux de titres : 1 = titre/chapitre, 2 = section, 3 = article ; intitulés numérotés 3+
+_LEVEL_1 = re.compile(r"^(?:PARTIE|LIVRE|TITRE|CHAPITRE|Partie|Livre|Titre|Chapitre)\s+"
+                      r"(?:[IVXLC]+|\d+|premier|PREMIER|unique|UNIQUE)\b")
+_LEVEL_2 = re.compile(r"^(?:SECTION|Section|SOUS-SECTION|Sous-section|ANNEXE|Annexe)\b(?:\s+[\dIVXLC]+)?")
+_ARTICLE = re.compile(r"^(?:ARTICLE|Article|Art\.)\s*(?:[LRD]\.?\s*)?\d+(?:[-.]\d+)*"
+                      r"(?:\s*(?:bis|ter|quater))?\b")
+_NUMBERED_HEADING = re.compile(r"^(\d+(?:\.\d+){0,3})[.)]?\s+[A-ZÀ-Ý][^.!?;]{2,80}$")
+_CLAUSE = re.compile(r"^(?:\d+°|\d+\)|[a-z]\)|[IVX]+\.\s|[-•–▪]\s)")
+_TABLE_ROW = re.compile(r"\|.*\||\t|\S\s{3,}\S.*\S\s{3,}\S")
+MAX_HEADING_LENGTH = 100
+# Métadonnées qui varient d'une page à l'autre et ne sont donc pas copiées du document
+PAGE_METADATA = ("page", "ocr_processed")
+
+
+def _heading_level(line):
+    """Niveau du titre porté par la ligne, ou None pour une ligne de texte"""
+    if len(line) > MAX_HEADING_LENGTH:
+        return None
+    if _LEVEL_1.match(line):
+        return 1
+    if _LEVEL_2.match(line):
+        return 2
+    if _ARTICLE.match(line):
+        return 3
+    match = _NUMBERED_HEADING.match(line)
+    if match:
+        return 3 + match.group(1).count(".")
+    letters = [c for c in line if c.isalpha()]
+    if len(letters) >= 4 and all(c.isupper() for c in letters) and not line.endswith("."):
+        return 2
+    return None
+
+
+@dataclass
+class Section:
+    """Unité de structure : un titre et ses blocs (type, texte, page)"""
+
+    section_id: str
+    title: str
+    path: list
+    page: int = None
+    blocks: list = field(default_factory=list)
+
+    @property
+    def body(self) -> str:
+        return "\n".join(text for _, text, _ in self.blocks)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(part for part in (self.title, self.body) if part)
+
+
+class StructureChunker:
+    """Découpeur aligné sur la structure ; même interface que les splitters LangChain"""
+
+    def __init__(self, max_chars=CHUNK_MAX_CHARS, child_chars=CHUNK_CHILD_CHARS):
+        self.max_chars = max_chars
+        self.child_chars = child_chars
+
+    # ===== ANALYSE =====
+
+    def parse(self, pages) -> list:
+        """Sections d'un document (liste de pages LangChain, dans l'ordre)"""
+        sections, stack = [], []
+        current = Section("s0", "", [])
+        block_kind, block_lines, block_page = None, [], None
+
+        def flush_block():
+            nonlocal block_kind, block_lines
+            if block_lines:
+                joiner = "\n" if block_kind == "table" else " "
+                current.blocks.append((block_kind, joiner.join(block_lines), block_page))
+            block_kind, block_lines = None, []
+
+        for page in pages:
+            page_num = page.metadata.get("page")
+            for raw in page.page_content.splitlines():
+                is_row = bool(_TABLE_ROW.search(raw))
+                line = raw.strip() if is_row else " ".join(raw.split())
+                if not line:
+                    if block_kind != "table":
+                        flush_block()
+                    continue
+
+                level = None if is_row else _heading_level(line)
+                if level is not None:
+                    flush_block()
+                    if current.blocks or current.title:
+                        sections.append(current)
+                    stack = [(lvl, title) for lvl, title in stack if lvl < level] + [(level, line)]
+                    current = Section(f"s{len(sections) + 1}", line, [title for _, title in stack[:-1]],
+                                      page=page_num)
+                    continue
+
+                kind = "table" if is_row else ("clause" if _CLAUSE.match(line) else "text")
+                if kind != block_kind or kind == "clause":
+                    # Une clause numérotée ouvre toujours un nouveau bloc
+                    if not (kind == "text" and block_kind == "clause"):
+                        flush_block()
+                        block_kind, block_page = kind, page_num
+                block_lines.append(line)
+            flush_block()
+
+        if current.blocks or current.title:
+            sections.append(current)
+        # Un titre sans texte n'est gardé que s'il n'a pas de sous-section (ex. article tenant sur une ligne)
+        return [s for s, following in zip(sections, sections[1:] + [None])
+                if s.blocks or (following is None or s.title not in following.path)]
+
+    # ===== DÉCOUPAGE =====
+
+    def _split_table(self, text):
+        """Tableau trop long : groupes de lignes, en-tête répété"""
+        header, *rows = text.split("\n")
+        parts, current = [], []
+        for row in rows:
+            if current and len(header) + sum(len(r) + 1 for r in current) + len(row) > self.child_chars:
+                parts.append("\n".join([header] + current))
+                current = []
+            current.append(row)
+        if current or not parts:
+            parts.append("\n".join([header] + current))
+        return parts
+
+    def _split_text(self, text):
+        """Bloc de texte trop long : paquets de phrases, coupe par mots en dernier recours"""
+        parts, current = [], ""
+        for sentence in split_sentences(text):
+            while len(sentence) > self.child_chars:
+                cut = sentence.rfind(" ", 0, self.child_chars)
+                cut = cut if cut > 0 else self.child_chars
+                if current:
+                    parts.append(current)
+                    current = ""
+                parts.append(sentence[:cut])
+                sentence = sentence[cut:].strip()
+            if current and len(current) + len(sentence) + 1 > self.child_chars:
+                parts.append(current)
+                current = ""
+            current = f"{current} {sentence}".strip()
+        if current:
+            parts.append(current)
+        return parts
+
+    def _children(self, section):
+        """Paquets de blocs d'au plus `child_chars` caractères (page du premier bloc)"""
+        pieces = []
+        for kind, text, page in section.blocks:
+            if len(text) <= self.child_chars:
+                pieces.append((text, page))
+            else:
+                split = self._split_table if kind == "table" else self._split_text
+                pieces.extend((part, page) for part in split(text))
+
+        children, current, current_page = [], [], None
+        for text, page in pieces:
+            if current and sum(len(t) + 1 for t in current) + len(text) > self.child_chars:
+                children.append(("\n".join(current), current_page))
+                current = []
+            if not current:
+                current_page = page
+            current.append(text)
+        if current:
+            children.append(("\n".join(current), current_page))
+        return children
+
+    def chunk(self, sections, metadata=None) -> list:
+        """Chunks des sections ; les enfants répètent le titre de leur section"""
+        docs = []
+        for section in sections:
+            base = dict(metadata or {})
+            base.update({
+                "section_id": section.section_id,
+                "section_title": section.title,
+                "section_path": " > ".join(section.path + [section.title] if section.title else section.path),
+            })
+            if len(section.text) <= self.max_chars:
+                # Section sans titre (début du document) : page de son premier bloc
+                page = section.page if section.page is not None else next(
+                    (block_page for _, _, block_page in section.blocks), None)
+                docs.append(Document(page_content=section.text, metadata=dict(
+                    base, page=page, chunk_role="section", child_index=0, child_count=1)))
+                continue
+
+            children = self._children(section)
+            for idx, (text, page) in enumerate(children):
+                content = f"{section.title}\n{text}" if section.title else text
+                docs.append(Document(page_content=content, metadata=dict(
+                    base, page=page, chunk_role="child", child_index=idx, child_count=len(children))))
+
+        # Chroma n'accepte pas les métadonnées None
+        for d in docs:
+            if d.metadata.get("page") is None:
+                d.metadata.pop("page", None)
+        return docs
+
+    def split_documents(self, pages) -> list:
+        metadata = {k: v for k, v in pages[0].metadata.items() if k not in PAGE_METADATA} if pages else {}
+        docs = self.chunk(self.parse(pages), metadata)
+        # Métadonnées propres à chaque page (ex. page OCRisée ou native) : celles de la page du chunk
+        by_page = {p.metadata.get("page"): p.metadata for p in pages}
+        for d in docs:
+            page_metadata = by_page.get(d.metadata.get("page"), {})
+            d.metadata.update({k: page_metadata[k] for k in PAGE_METADATA if k != "page" and k in page_metadata})
+        return docs
+
+
+def get_text_splitter(chunker=CHUNKER):
+    """Découpeur de texte configuré (CHUNKER=structure|recursive)"""
+    if chunker == "recursive":
+        return RecursiveCharacterTextSplitter(chunk_size=520, chunk_overlap=20, length_function=len)
+    return StructureChunker()
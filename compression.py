@@ -0,0 +1,160 @@
+"""
+Compression du contexte entre le retriever et le prompt.
+
+Les chunks récupérés sont réduits à leurs phrases les plus proches de la
+question (similarité cosinus avec les vecteurs de phrases précalculés à
+l'indexation, cf. `sentence_index`), dans la limite d'un budget de tokens
+strict. Les phrases retenues gardent l'ordre du chunk ; les chunks sans phrase
+retenue sont écartés. Les chunks sans phrases indexées (ou tous, si l'index est
+désactivé) sont gardés entiers, le dernier tronqué pour tenir dans le budget.
+"""
+
+import os
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from ingestion import chunk_hash
+from scheduler import scheduler
+from sentence_index import model_key, sentence_index
+from tokens import count_tokens, truncate_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1200))
+# Écart de similarité maximal avec la meilleure phrase pour qu'une phrase soit retenue
+COMPRESSION_MARGIN = float(os.getenv("COMPRESSION_MARGIN", 0.2))
+# Séparateurs et en-têtes ajoutés par format_docs, comptés par chunk
+DOC_OVERHEAD_TOKENS = 8
+ELLIPSIS = " […] "
+
+class ContextCompressor:
+    """Réduit une liste de chunks aux phrases pertinentes pour la question"""
+
+    def __init__(self, embeddings, embed_query=None, budget=CONTEXT_TOKEN_BUDGET, margin=COMPRESSION_MARGIN,
+                 index=sentence_index):
+        self.embeddings = embeddings
+        self.model = model_key(embeddings)
+        self._embed_query = embed_query or embeddings.embed_query
+        self.budget = budget
+        self.margin = margin
+        self.index = index
+
+    def _sentences(self, hashes, docs):
+        """Phrases et vecteurs des chunks ; ceux indexés avant la compression le sont à la volée"""
+        stored = self.index.get(self.model, hashes)
+        missing = [(h, d.page_content) for h, d in zip(hashes, docs) if h not in stored]
+        if missing:
+            self.index.index(self.embeddings, missing)
+            stored.update(self.index.get(self.model, [h for h, _ in missing]))
+        return stored
+
+    def _fit(self, docs, budget):
+        """Chunks entiers dans l'ordre, le dernier tronqué au budget restant ; retourne (chunks, tokens utilisés)"""
+        kept, used = [], 0
+        for d in docs:
+            room = budget - used - DOC_OVERHEAD_TOKENS
+            if room <= 0:
+                break
+            tokens = count_tokens(d.page_content)
+            if tokens > room:
+                kept.append(Document(page_content=truncate_tokens(d.page_content, room),
+                                     metadata=dict(d.metadata, compressed=True)))
+                used = budget
+                break
+            kept.append(d)
+            used += tokens + DOC_OVERHEAD_TOKENS
+        return kept, used
+
+    def compress(self, query, docs, embedding=None):
+        if self.index is None or not docs:
+            return self._fit(docs, self.budget)[0]
+
+        hashes = [d.metadata.get("chunk_hash") or chunk_hash(d.page_content) for d in docs]
+        stored = self._sentences(hashes, docs)
+
+        # Chunks sans phrases indexées : gardés entiers, sur le budget, avant la sélection des phrases
+        unindexed = [i for i, h in enumerate(hashes) if not stored.get(h)]
+        kept, reserved = self._fit([docs[i] for i in unindexed], self.budget)
+        whole = dict(zip(unindexed, kept))
+        budget = self.budget - reserved
+
+        candidates = [(i, position, sentence, vector)
+                      for i, h in enumerate(hashes)
+                      for position, (sentence, vector) in enumerate(stored.get(h, []))]
+        if not candidates or budget <= DOC_OVERHEAD_TOKENS:
+            return [whole[i] for i in sorted(whole)]
+
+        query_vector = np.asarray(embedding if embedding is not None else self._embed_query(query),
+                                  dtype=np.float32)
+        matrix = np.stack([vector for *_, vector in candidates])
+        similarities = matrix @ query_vector / (
+            np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vector) + 1e-9)
+
+        order = np.argsort(-similarities)
+        best = similarities[order[0]]
+        selected, used = {}, 0
+        for rank in order:
+            if similarities[rank] < best - self.margin:
+                break
+            i, position, sentence, _ = candidates[rank]
+            cost = count_tokens(sentence) + 1 + (DOC_OVERHEAD_TOKENS if i not in selected else 0)
+            if used + cost > budget:
+                if not selected:
+                    # Meilleure phrase plus longue que le budget : tronquée plutôt qu'un contexte vide
+                    selected[i] = [(position, truncate_tokens(sentence, budget - DOC_OVERHEAD_TOKENS))]
+                    break
+                continue
+            selected.setdefault(i, []).append((position, sentence))
+            used += cost
+
+        compressed = []
+        for i, d in enumerate(docs):
+            if i in whole:
+                compressed.append(whole[i])
+                continue
+            if i not in selected:
+                continue
+            parts, previous = [], None
+            for position, sentence in sorted(selected[i]):
+                if previous is not None:
+                    parts.append(" " if position == previous + 1 else ELLIPSIS)
+                parts.append(sentence)
+                previous = position
+            compressed.append(Document(page_content="".join(parts), metadata=dict(d.metadata, compressed=True)))
+        return compressed
+
+    def as_runnable(self, retriever):
+        """Retriever puis compression, pour le slot `context` d'une chaîne LCEL"""
+        return RunnableLambda(lambda query: self.compress(query, retriever.invoke(query)))
+
+    def prune_index(self, vector_store) -> int:
+        """Purge de l'index des phrases des chunks supprimés de la collection (sections parentes gardées)"""
+        from docstore import section_store
+
+        results = vector_store.get(include=["metadatas", "documents"])
+        live = {meta.get("chunk_hash") or chunk_hash(text)
+                for meta, text in zip(results["metadatas"], results["documents"])}
+        return self.index.prune(live | section_store.live_hashes())
+
+
+_compressors = {}
+_compressors_lock = threading.Lock()
+
+
+def get_context_compressor(vector_store, embed_query=None) -> ContextCompressor:
+    """
+    Compresseur partagé du processus pour ce vector store.
+    À la première création, enregistre la purge quotidienne de l'index des phrases.
+    """
+    key = id(vector_store)
+    with _compressors_lock:
+        if key in _compressors:
+            return _compressors[key]
+        compressor = _compressors[key] = ContextCompressor(vector_store.embeddings, embed_query)
+
+    if compressor.index is not None:
+        scheduler.register("sentence_index_gc", lambda: compressor.prune_index(vector_store),
+                           interval=24 * 3600)
+        scheduler.start()
+    return compressor
@@ -0,0 +1,224 @@
+"""
+Gestion des identifiants : hachage des mots de passe (scrypt salé),
+vérification dans un pool de workers et limitation des tentatives par compte.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# ===== PARAMÈTRES DU KDF =====
+
+# Coût scrypt ajustable par variables d'environnement (N doit être une puissance de 2)
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", 2 ** 14))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", 8))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", 1))
+SALT_BYTES = 16
+HASH_BYTES = 32
+SCHEME = "scrypt"
+
+# Pool de vérification : borne les calculs scrypt simultanés (scrypt libère le GIL)
+VERIFY_WORKERS = int(os.getenv("PASSWORD_VERIFY_WORKERS", 4))
+VERIFY_TIMEOUT = 10
+
+_executor = ThreadPoolExecutor(max_workers=VERIFY_WORKERS, thread_name_prefix="pwd-verify")
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(),
+        salt=salt,
+        n=n,
+        r=r,
+        p=p,
+        maxmem=128 * n * r * p + 1024 * 1024,
+        dklen=HASH_BYTES
+    )
+
+
+def _is_legacy(hashed: str) -> bool:
+    """Ancien format : SHA256 hexadécimal non salé"""
+    return len(hashed) == 64 and all(c in "0123456789abcdef" for c in hashed.lower())
+
+
+# ===== HACHAGE / VÉRIFICATION =====
+
+def hash_password(password: str) -> str:
+    """Hash un mot de passe avec scrypt : scrypt$n$r$p$sel$hash"""
+    salt = secrets.token_bytes(SALT_BYTES)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"{SCHEME}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    """Vérifie un mot de passe (format scrypt ou ancien SHA256)"""
+    if not hashed:
+        return False
+
+    if _is_legacy(hashed):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, hashed.lower())
+
+    try:
+        scheme, n, r, p, salt, digest = hashed.split("$")
+        if scheme != SCHEME:
+            return False
+        candidate = _scrypt(password, _unb64(salt), int(n), int(r), int(p))
+        expected = _unb64(digest)
+    except (ValueError, TypeError):
+        return False
+
+    return hmac.compare_digest(candidate, expected)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """Indique si le hash doit être régénéré (ancien format ou coût obsolète)"""
+    if not hashed or _is_legacy(hashed):
+        return True
+    try:
+        scheme, n, r, p, _, _ = hashed.split("$")
+    except ValueError:
+        return True
+    return scheme != SCHEME or (int(n), int(r), int(p)) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+_dummy_hash = None
+
+
+def _get_dummy_hash() -> str:
+    """Hash factice (calculé une fois) vérifié quand le compte n'existe pas"""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_urlsafe(16))
+    return _dummy_hash
+
+
+def verify_password_async(password: str, hashed: str):
+    """Soumet la vérification au pool de workers et retourne un Future"""
+    return _executor.submit(verify_password, password, hashed)
+
+
+def check_password(password: str, hashed: str, timeout: float = VERIFY_TIMEOUT) -> bool:
+    """
+    Vérifie un mot de passe via le pool de workers. Le script appelant attend
+    le résultat : le pool ne rend pas la connexion asynchrone, il borne le
+    nombre de calculs scrypt simultanés (CPU et mémoire) entre les sessions.
+    Un dépassement du délai est traité comme un échec.
+
+    Sans hash (compte inconnu), la vérification tourne quand même sur un hash
+    factice : la durée de réponse ne révèle pas l'existence du compte.
+    """
+    future = verify_password_async(password, hashed or _get_dummy_hash())
+    try:
+        return future.result(timeout=timeout) and bool(hashed)
+    except FutureTimeoutError:
+        future.cancel()
+        print(f"⚠️ Vérification du mot de passe interrompue après {timeout} s (serveur surchargé)")
+        return False
+
+
+def hash_password_async(password: str):
+    """Soumet le hachage au pool de workers et retourne un Future"""
+    return _executor.submit(hash_password, password)
+
+
+# ===== LIMITATION DES TENTATIVES =====
+
+class LoginRateLimiter:
+    """
+    Limiteur de tentatives par compte : après `max_attempts` échecs dans la
+    fenêtre, le compte est bloqué avec un délai qui double à chaque blocage.
+    """
+
+    def __init__(self, max_attempts=5, window=300, base_lockout=30, max_lockout=900):
+        self.max_attempts = max_attempts
+        self.window = window
+        self.base_lockout = base_lockout
+        self.max_lockout = max_lockout
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._lockouts = {}
+        self._last_prune = time.monotonic()
+
+    @staticmethod
+    def _key(matricule: str) -> str:
+        return (matricule or "").strip().lower()
+
+    def check(self, matricule: str) -> tuple[bool, int]:
+        """Retourne (can_login, seconds_remaining)"""
+        key = self._key(matricule)
+        now = time.monotonic()
+        with self._lock:
+            lockout = self._lockouts.get(key)
+            if lockout and lockout[0] > now:
+                return False, int(lockout[0] - now) + 1
+        return True, 0
+
+    def remaining_attempts(self, matricule: str) -> int:
+        """Nombre de tentatives restantes avant blocage"""
+        key = self._key(matricule)
+        now = time.monotonic()
+        with self._lock:
+            recent = [t for t in self._failures.get(key, []) if now - t < self.window]
+        return max(self.max_attempts - len(recent), 0)
+
+    def _prune(self, now):
+        """
+        Oublie les comptes sans échec récent ni blocage (chaque matricule essayé
+        crée une entrée). Un blocage expiré reste `max_lockout` secondes pour que
+        le délai continue de doubler. Appelé sous le verrou, au plus une fois par fenêtre.
+        """
+        if now - self._last_prune < self.window:
+            return
+        self._last_prune = now
+        self._failures = {key: times for key, times in self._failures.items()
+                          if times and now - times[-1] < self.window}
+        self._lockouts = {key: lockout for key, lockout in self._lockouts.items()
+                          if now - lockout[0] < self.max_lockout}
+
+    def record_failure(self, matricule: str) -> int:
+        """Enregistre un échec ; retourne la durée de blocage appliquée (0 si aucune)"""
+        key = self._key(matricule)
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            recent = [t for t in self._failures.get(key, []) if now - t < self.window]
+            recent.append(now)
+            self._failures[key] = recent
+
+            if len(recent) < self.max_attempts:
+                return 0
+
+            strikes = self._lockouts.get(key, (0, 0))[1] + 1
+            duration = min(self.base_lockout * 2 ** (strikes - 1), self.max_lockout)
+            self._lockouts[key] = (now + duration, strikes)
+            self._failures[key] = []
+            return duration
+
+    def record_success(self, matricule: str):
+        """Réinitialise les compteurs après une connexion réussie"""
+        key = self._key(matricule)
+        with self._lock:
+            self._failures.pop(key, None)
+            self._lockouts.pop(key, None)
+
+
+login_limiter = LoginRateLimiter(
+    max_attempts=int(os.getenv("LOGIN_MAX_ATTEMPTS", 5)),
+    window=int(os.getenv("LOGIN_ATTEMPT_WINDOW", 300)),
+    base_lockout=int(os.getenv("LOGIN_LOCKOUT_SECONDS", 30))
+)
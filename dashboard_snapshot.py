@@ -0,0 +1,83 @@
+"""
+Instantané des métriques du tableau de bord analytics.
+
+Les modules de statistiques (SQLite et PostgreSQL) calculent toutes les
+métriques en une seule requête CTE ; ce module définit l'objet retourné et
+la conversion de la ligne résultat, commune aux deux backends.
+"""
+
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+
+JOURS = {
+    0: 'Dimanche',
+    1: 'Lundi',
+    2: 'Mardi',
+    3: 'Mercredi',
+    4: 'Jeudi',
+    5: 'Vendredi',
+    6: 'Samedi'
+}
+
+
+@dataclass
+class DashboardSnapshot:
+    """Métriques principales du tableau de bord, calculées en un aller-retour"""
+
+    window: int
+    total_users: int = 0
+    users_connected_now: int = 0
+    total_conversations: int = 0
+    total_documents: int = 0
+    feedback_stats: dict = field(default_factory=lambda: {"positive": 0, "negative": 0})
+    user_types: dict = field(default_factory=dict)
+    documents_by_type: dict = field(default_factory=dict)
+    user_stats: list = field(default_factory=list)
+    conversations_by_day: list = field(default_factory=list)
+    conversations_by_weekday: list = field(default_factory=list)
+    generated_at: datetime = field(default_factory=datetime.now)
+
+    @property
+    def total_feedbacks(self) -> int:
+        return self.feedback_stats["positive"] + self.feedback_stats["negative"]
+
+    @property
+    def satisfaction_rate(self) -> float:
+        return self.feedback_stats["positive"] / self.total_feedbacks * 100 if self.total_feedbacks else 0
+
+
+def _json(value, default):
+    """Les colonnes JSON arrivent en texte (SQLite) ou déjà décodées (psycopg2)"""
+    if value is None:
+        return default
+    if isinstance(value, (str, bytes)):
+        return json.loads(value)
+    return value
+
+
+def build_snapshot(row, window, documents=None) -> DashboardSnapshot:
+    """Construit l'instantané à partir de la ligne unique retournée par la requête CTE"""
+    feedback_stats = {"positive": 0, "negative": 0}
+    feedback_stats.update(_json(row["feedback"], {}))
+    documents = documents or {"total": 0, "by_type": {}}
+
+    return DashboardSnapshot(
+        window=window,
+        total_users=row["total_users"] or 0,
+        users_connected_now=row["users_connected_now"] or 0,
+        total_conversations=row["total_conversations"] or 0,
+        total_documents=documents["total"],
+        feedback_stats=feedback_stats,
+        user_types=_json(row["user_types"], {}),
+        documents_by_type=documents["by_type"],
+        user_stats=_json(row["user_stats"], []),
+        conversations_by_day=[
+            (str(date), count, JOURS[int(day_num)])
+            for date, count, day_num in _json(row["conversations_by_day"], [])
+        ],
+        conversations_by_weekday=[
+            (JOURS[int(day_num)], avg)
+            for day_num, avg in _json(row["conversations_by_weekday"], [])
+        ]
+    )
@@ -81,6 +81,17 @@ def create_tables():
         )
     """)
 
+    # Rollup d'activité quotidienne (alimenté par le planificateur, cf. new_get_stats_bis2)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_activity_rollup (
+            date DATE PRIMARY KEY,
+            questions INTEGER NOT NULL,
+            responses INTEGER NOT NULL,
+            active_users INTEGER NOT NULL,
+            refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
     conn.commit()
     cursor.close()
     conn.close()
@@ -1,12 +1,14 @@
 import streamlit as st
-import hashlib
 from datetime import datetime
-from streamlit_cookies_manager import EncryptedCookieManager
+from streamlit_cookies_manager import CookieManager
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 import os
 from contextlib import contextmanager
+from credentials import hash_password, check_password, needs_rehash
+from scheduler import scheduler
+from session_store import SessionStore, PostgresSessionBackend
 
 # Charger les variables d'environnement
 load_dotenv()
@@ -20,16 +22,6 @@ DB_CONFIG = {
     "password": os.getenv("POSTGRES_PASSWORD")
 }
 
-# Initialiser le gestionnaire de cookies
-cookies = EncryptedCookieManager(
-    prefix="chatbot_",
-    password=os.getenv("COOKIE_SECRET", "VotreCleSecreteTresLongueEtComplexe123!")
-)
-
-if not cookies.ready():
-    st.stop()
-
-
 @contextmanager
 def get_connection():
     """Context manager pour les connexions PostgreSQL"""
@@ -44,6 +36,33 @@ def get_connection():
         conn.close()
 
 
+# Store de sessions côté serveur : le cookie ne contient qu'un jeton opaque
+session_store = SessionStore(PostgresSessionBackend(get_connection))
+
+# Flush et expiration des sessions : propres à chaque processus (store en mémoire)
+scheduler.register("session_flush", session_store.flush, interval=session_store.flush_interval,
+                   leader_only=False)
+scheduler.register("session_expiry", session_store.expire_idle, interval=60, leader_only=False)
+scheduler.start()
+
+SESSION_KEYS = ["logged_in", "matricule", "nom", "prenom", "email", "role", "session_token"]
+
+
+def get_cookies():
+    """
+    Gestionnaire de cookies instancié à la demande (et non à l'import),
+    uniquement quand une session doit être restaurée, créée ou effacée.
+    Une seule instance par session : le composant a une clé fixe et ne peut
+    pas être rendu deux fois dans la même exécution du script.
+    """
+    if "cookie_manager" not in st.session_state:
+        st.session_state.cookie_manager = CookieManager(prefix="chatbot_")
+    cookies = st.session_state.cookie_manager
+    if not cookies.ready():
+        st.stop()
+    return cookies
+
+
 def create_users_table():
     """Crée les tables si elles n'existent pas"""
     with get_connection() as conn:
@@ -75,16 +94,6 @@ def create_users_table():
         cursor.close()
 
 
-def hash_password(password: str) -> str:
-    """Hash un mot de passe avec SHA256"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-
-def verify_password(password: str, hashed: str) -> bool:
-    """Vérifie un mot de passe hashé"""
-    return hash_password(password) == hashed
-
-
 def register_user(matricule, nom, prenom, email, password, role):
     """Enregistre un nouvel utilisateur"""
     with get_connection() as conn:
@@ -98,40 +107,50 @@ def register_user(matricule, nom, prenom, email, password, role):
 
 
 def save_session_to_cookies(matricule, nom, prenom, email, role):
-    """Sauvegarde la session dans les cookies"""
-    cookies['matricule'] = matricule
-    cookies['nom'] = nom
-    cookies['prenom'] = prenom
-    cookies['email'] = email
-    cookies['role'] = role
-    cookies['logged_in'] = 'true'
+    """Ouvre une session serveur et place son jeton dans le cookie"""
+    token = session_store.create({
+        "matricule": matricule,
+        "nom": nom,
+        "prenom": prenom,
+        "email": email,
+        "role": role
+    })
+    st.session_state.session_token = token
+
+    cookies = get_cookies()
+    cookies['session'] = token
     cookies.save()
 
 
 def restore_session_from_cookies():
-    """Restaure la session depuis les cookies"""
-    if cookies.get('logged_in') == 'true':
+    """Restaure la session depuis le store serveur à partir du jeton du cookie"""
+    token = get_cookies().get('session')
+    user = session_store.get(token)
+    if user:
         st.session_state.logged_in = True
-        st.session_state.matricule = cookies.get('matricule')
-        st.session_state.nom = cookies.get('nom')
-        st.session_state.prenom = cookies.get('prenom')
-        st.session_state.email = cookies.get('email')
-        st.session_state.role = cookies.get('role')
+        st.session_state.session_token = token
+        st.session_state.matricule = user['matricule']
+        st.session_state.nom = user['nom']
+        st.session_state.prenom = user['prenom']
+        st.session_state.email = user['email']
+        st.session_state.role = user['role']
         return True
     return False
 
 
 def clear_cookies():
-    """Efface tous les cookies de session"""
-    cookies['logged_in'] = 'false'
-    cookies['matricule'] = ''
-    cookies['nom'] = ''
-    cookies['prenom'] = ''
-    cookies['email'] = ''
-    cookies['role'] = ''
+    """Révoque la session serveur et efface le jeton du cookie"""
+    session_store.revoke(st.session_state.get("session_token"))
+    cookies = get_cookies()
+    cookies['session'] = ''
     cookies.save()
 
 
+def update_session_activity():
+    """Met à jour l'activité de la session (en mémoire, écrite en base par lots)"""
+    session_store.touch(st.session_state.get("session_token"))
+
+
 def login_user(matricule, password):
     """Authentifie un utilisateur"""
     with get_connection() as conn:
@@ -143,9 +162,18 @@ def login_user(matricule, password):
         )
         row = cursor.fetchone()
 
-        if row and verify_password(password, row['password']):
+        # Compte inconnu : vérification sur un hash factice, même durée de réponse
+        verified = check_password(password, row['password'] if row else None)
+        if row and verified:
             now = datetime.now()
 
+            # Migration transparente des anciens hash vers scrypt
+            if needs_rehash(row['password']):
+                cursor.execute(
+                    "UPDATE users SET password = %s WHERE matricule = %s",
+                    (hash_password(password), row['matricule'])
+                )
+
             # Vérifier si une session existe déjà
             cursor.execute(
                 "SELECT matricule FROM user_sessions WHERE matricule = %s",
@@ -201,19 +229,21 @@ def logout_user():
             """, (datetime.now(), st.session_state.matricule))
             cursor.close()
 
+    # Révoquer la session serveur et effacer le cookie
+    clear_cookies()
+
     # Effacer session_state
-    for key in ["logged_in", "matricule", "nom", "prenom", "email", "role"]:
+    for key in SESSION_KEYS:
         st.session_state.pop(key, None)
 
-    # Effacer les cookies
-    clear_cookies()
-
 
 def check_and_restore_session():
     """
     À appeler au début de chaque page pour restaurer la session
-    si elle existe dans les cookies mais pas dans session_state
+    si elle existe dans les cookies mais pas dans session_state.
+    Une session déjà chargée ne coûte qu'une écriture mémoire.
     """
     if "logged_in" not in st.session_state or not st.session_state.logged_in:
         return restore_session_from_cookies()
+    update_session_activity()
     return True
@@ -4,9 +4,14 @@ from contextlib import contextmanager
 from dotenv import load_dotenv
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(".")
 from src.vectorstore import get_vector_store
+from scheduler import scheduler, PostgresLeaderLock
+from dashboard_snapshot import build_snapshot
 
 load_dotenv()
 
@@ -34,6 +39,13 @@ def get_conn():
         conn.close()
 
 
+DOC_STATS_TTL = 600
+ROLLUP_DAYS = 2
+
+_doc_stats_cache = {}
+_doc_stats_lock = threading.Lock()
+
+
 # ===== STATISTIQUES EXISTANTES =====
 
 def get_all_feedbacks():
@@ -144,21 +156,36 @@ def get_conversation_stats():
 
 
 def get_daily_activity():
-    """Récupère l'activité quotidienne"""
+    """
+    Récupère l'activité quotidienne (depuis le rollup, calcul direct s'il est
+    vide ou pas encore créé par le leader)
+    """
     with get_conn() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT 
-                DATE(timestamp) as date,
-                COUNT(CASE WHEN role = 'user' THEN 1 END) as questions,
-                COUNT(CASE WHEN role = 'assistant' THEN 1 END) as responses,
-                COUNT(DISTINCT matricule) as active_users
-            FROM conversations
-            GROUP BY DATE(timestamp)
-            ORDER BY date DESC
-            LIMIT 30
-        """)
-        rows = cursor.fetchall()
+        cursor.execute("SELECT to_regclass('daily_activity_rollup') IS NOT NULL AS ready")
+        rows = []
+        if cursor.fetchone()['ready']:
+            cursor.execute("""
+                SELECT date, questions, responses, active_users
+                FROM daily_activity_rollup
+                ORDER BY date DESC
+                LIMIT 30
+            """)
+            rows = cursor.fetchall()
+
+        if not rows:
+            cursor.execute("""
+                SELECT 
+                    DATE(timestamp) as date,
+                    COUNT(CASE WHEN role = 'user' THEN 1 END) as questions,
+                    COUNT(CASE WHEN role = 'assistant' THEN 1 END) as responses,
+                    COUNT(DISTINCT matricule) as active_users
+                FROM conversations
+                GROUP BY DATE(timestamp)
+                ORDER BY date DESC
+                LIMIT 30
+            """)
+            rows = cursor.fetchall()
         cursor.close()
 
     return [(str(row['date']), row['questions'], row['responses'], row['active_users'])
@@ -193,53 +220,58 @@ def get_total_users():
     return result['count']
 
 
-def get_total_documents():
-    """Nombre total de documents chargés"""
-    try:
-        vector_store = get_vector_store()
-        results = vector_store.get(include=["metadatas"])
-        metadatas = results["metadatas"]
+def _scan_documents():
+    """Parcourt le vector store : nombre de documents et répartition par type"""
+    vector_store = get_vector_store()
+    results = vector_store.get(include=["metadatas"])
+    metadatas = results["metadatas"]
 
-        unique_doc_ids = set()
-        for meta in metadatas:
-            doc_id = meta.get("doc_id")
-            if doc_id:
-                unique_doc_ids.add(doc_id)
+    doc_types = {}
+    seen_docs = set()
 
-        return len(unique_doc_ids)
-    except:
-        return 0
+    for meta in metadatas:
+        doc_id = meta.get("doc_id")
+        filename = meta.get("filename", "")
 
+        if doc_id and doc_id not in seen_docs:
+            seen_docs.add(doc_id)
 
-def get_documents_by_type():
-    """Statistiques des documents par type"""
-    try:
-        vector_store = get_vector_store()
-        results = vector_store.get(include=["metadatas"])
-        metadatas = results["metadatas"]
+            if filename.endswith('.pdf'):
+                doc_type = 'PDF'
+            elif filename.endswith(('.xlsx', '.xls')):
+                doc_type = 'Excel'
+            elif filename.endswith('.csv'):
+                doc_type = 'CSV'
+            else:
+                doc_type = 'Autre'
 
-        doc_types = {}
-        seen_docs = set()
+            doc_types[doc_type] = doc_types.get(doc_type, 0) + 1
 
-        for meta in metadatas:
-            doc_id = meta.get("doc_id")
-            filename = meta.get("filename", "")
+    return {"total": len(seen_docs), "by_type": doc_types}
 
-            if doc_id and doc_id not in seen_docs:
-                seen_docs.add(doc_id)
 
-                if filename.endswith('.pdf'):
-                    doc_type = 'PDF'
-                elif filename.endswith(('.xlsx', '.xls')):
-                    doc_type = 'Excel'
-                elif filename.endswith('.csv'):
-                    doc_type = 'CSV'
-                else:
-                    doc_type = 'Autre'
+def _document_stats():
+    """Statistiques documents préchauffées par le planificateur (scan direct si cache vide)"""
+    with _doc_stats_lock:
+        cached = _doc_stats_cache.get("value")
+        fresh = cached is not None and time.monotonic() - _doc_stats_cache["at"] < DOC_STATS_TTL
+    if fresh:
+        return cached
+    return warm_document_stats()
 
-                doc_types[doc_type] = doc_types.get(doc_type, 0) + 1
 
-        return doc_types
+def get_total_documents():
+    """Nombre total de documents chargés"""
+    try:
+        return _document_stats()["total"]
+    except:
+        return 0
+
+
+def get_documents_by_type():
+    """Statistiques des documents par type"""
+    try:
+        return _document_stats()["by_type"]
     except:
         return {}
 
@@ -248,8 +280,6 @@ def get_users_connected_now(exclude_admin=False):
     """
     Nombre d'utilisateurs actuellement connectés (is_active = 1)
     """
-    _cleanup_ghost_sessions()
-
     with get_conn() as conn:
         cursor = conn.cursor()
         if exclude_admin:
@@ -271,19 +301,6 @@ def get_users_connected_now(exclude_admin=False):
     return result['count']
 
 
-def _cleanup_ghost_sessions():
-    """Nettoie les sessions 'fantômes'"""
-    with get_conn() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE user_sessions 
-            SET is_active = 0, logout_time = CURRENT_TIMESTAMP
-            WHERE is_active = 1 
-            AND login_time < CURRENT_TIMESTAMP - INTERVAL '12 hours'
-        """)
-        cursor.close()
-
-
 def get_users_connected_today():
     """Utilisateurs connectés aujourd'hui"""
     with get_conn() as conn:
@@ -305,8 +322,6 @@ def get_users_connected_today():
 
 def get_active_users_now(exclude_admin=False):
     """Liste des utilisateurs actuellement connectés"""
-    _cleanup_ghost_sessions()
-
     with get_conn() as conn:
         cursor = conn.cursor()
         if exclude_admin:
@@ -522,3 +537,171 @@ def get_response_time_by_user():
 
     return [(row['matricule'], row['avg_time'], row['response_count'],
              row['min_time'], row['max_time']) for row in rows]
+
+
+# ===== INSTANTANÉ DU TABLEAU DE BORD =====
+
+DASHBOARD_SQL = """
+    WITH
+    conv AS (
+        SELECT matricule, conv_name, role, timestamp FROM conversations
+    ),
+    per_user AS (
+        SELECT 
+            matricule,
+            COUNT(CASE WHEN role = 'user' THEN 1 END) as total_questions,
+            COUNT(CASE WHEN role = 'assistant' THEN 1 END) as total_responses,
+            COUNT(DISTINCT conv_name) as total_conversations,
+            MIN(timestamp) as first_activity,
+            MAX(timestamp) as last_activity
+        FROM conv
+        GROUP BY matricule
+    ),
+    feedback_per_user AS (
+        SELECT 
+            matricule,
+            COUNT(CASE WHEN feedback_type = 'positive' THEN 1 END) as positive_feedbacks,
+            COUNT(CASE WHEN feedback_type = 'negative' THEN 1 END) as negative_feedbacks
+        FROM message_feedback
+        GROUP BY matricule
+    ),
+    by_day AS (
+        SELECT 
+            DATE(timestamp) as date,
+            COUNT(DISTINCT conv_name || '_' || matricule) as conv_count,
+            EXTRACT(DOW FROM DATE(timestamp)) as day_num
+        FROM conv
+        WHERE timestamp >= CURRENT_DATE - %(window)s * INTERVAL '1 day'
+        GROUP BY DATE(timestamp)
+    ),
+    by_weekday AS (
+        SELECT 
+            EXTRACT(DOW FROM timestamp) as day_num,
+            CAST(COUNT(DISTINCT DATE(timestamp) || '_' || conv_name || '_' || matricule) AS FLOAT) / 
+            NULLIF(COUNT(DISTINCT DATE(timestamp)), 0) as avg_convs
+        FROM conv
+        GROUP BY EXTRACT(DOW FROM timestamp)
+    )
+    SELECT
+        (SELECT COUNT(*) FROM users) as total_users,
+        (SELECT COUNT(DISTINCT matricule) FROM user_sessions WHERE is_active = 1) as users_connected_now,
+        (SELECT COUNT(DISTINCT conv_name || '_' || matricule) FROM conv) as total_conversations,
+        (SELECT json_object_agg(feedback_type, count) FROM (
+            SELECT feedback_type, COUNT(*) as count FROM message_feedback GROUP BY feedback_type
+        ) f) as feedback,
+        (SELECT json_object_agg(role, count) FROM (
+            SELECT role, COUNT(*) as count FROM users GROUP BY role
+        ) r) as user_types,
+        (SELECT json_agg(json_build_object(
+            'matricule', p.matricule,
+            'total_questions', p.total_questions,
+            'total_responses', p.total_responses,
+            'total_conversations', p.total_conversations,
+            'first_activity', to_char(p.first_activity, 'YYYY-MM-DD HH24:MI:SS'),
+            'last_activity', to_char(p.last_activity, 'YYYY-MM-DD HH24:MI:SS'),
+            'positive_feedbacks', COALESCE(f.positive_feedbacks, 0),
+            'negative_feedbacks', COALESCE(f.negative_feedbacks, 0)
+        )) FROM per_user p LEFT JOIN feedback_per_user f ON f.matricule = p.matricule) as user_stats,
+        (SELECT json_agg(json_build_array(date, conv_count, day_num) ORDER BY date)
+         FROM by_day) as conversations_by_day,
+        (SELECT json_agg(json_build_array(day_num, avg_convs) ORDER BY day_num)
+         FROM by_weekday) as conversations_by_weekday
+"""
+
+
+def get_dashboard_snapshot(window=30):
+    """
+    Toutes les métriques du tableau de bord en une requête CTE ;
+    les statistiques documents (cache préchauffé) sont lues en parallèle
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        documents = executor.submit(_document_stats)
+
+        with get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(DASHBOARD_SQL, {"window": int(window)})
+            row = cursor.fetchone()
+            cursor.close()
+
+        try:
+            documents = documents.result()
+        except Exception:
+            documents = None
+
+    return build_snapshot(row, window, documents)
+
+
+# ===== MAINTENANCE (exécutée par le planificateur) =====
+
+def expire_ghost_sessions():
+    """Ferme les sessions 'fantômes' restées actives depuis plus de 12h"""
+    with get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE user_sessions 
+            SET is_active = 0, logout_time = CURRENT_TIMESTAMP
+            WHERE is_active = 1 
+            AND login_time < CURRENT_TIMESTAMP - INTERVAL '12 hours'
+        """)
+        cursor.close()
+
+
+def refresh_daily_activity_rollup(days=ROLLUP_DAYS):
+    """Recalcule le rollup d'activité quotidienne des `days` derniers jours"""
+    with get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS daily_activity_rollup (
+                date DATE PRIMARY KEY,
+                questions INTEGER NOT NULL,
+                responses INTEGER NOT NULL,
+                active_users INTEGER NOT NULL,
+                refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Premier passage : on remplit tout l'historique
+        cursor.execute("SELECT COUNT(*) as count FROM daily_activity_rollup")
+        since = None if cursor.fetchone()['count'] == 0 else days
+
+        cursor.execute("""
+            INSERT INTO daily_activity_rollup (date, questions, responses, active_users, refreshed_at)
+            SELECT 
+                DATE(timestamp),
+                COUNT(CASE WHEN role = 'user' THEN 1 END),
+                COUNT(CASE WHEN role = 'assistant' THEN 1 END),
+                COUNT(DISTINCT matricule),
+                CURRENT_TIMESTAMP
+            FROM conversations
+            WHERE %s IS NULL OR timestamp >= CURRENT_DATE - %s * INTERVAL '1 day'
+            GROUP BY DATE(timestamp)
+            ON CONFLICT (date) DO UPDATE SET
+                questions = EXCLUDED.questions,
+                responses = EXCLUDED.responses,
+                active_users = EXCLUDED.active_users,
+                refreshed_at = EXCLUDED.refreshed_at
+        """, (since, since))
+        cursor.close()
+
+
+def warm_document_stats():
+    """Préchauffe le cache des statistiques documents (scan du vector store)"""
+    value = _scan_documents()
+    with _doc_stats_lock:
+        _doc_stats_cache["value"] = value
+        _doc_stats_cache["at"] = time.monotonic()
+    return value
+
+
+def get_maintenance_stats():
+    """Durées et état des tâches de maintenance"""
+    return scheduler.stats()
+
+
+scheduler.set_lock(PostgresLeaderLock(lambda: psycopg2.connect(**DB_CONFIG)))
+scheduler.register("ghost_sessions", expire_ghost_sessions, interval=300, run_at_start=True)
+scheduler.register("daily_activity_rollup", refresh_daily_activity_rollup, interval=600, run_at_start=True)
+# Le cache documents est propre à chaque processus : préchauffage partout
+scheduler.register("document_stats_warmup", warm_document_stats, interval=DOC_STATS_TTL // 2,
+                   leader_only=False, run_at_start=True)
+scheduler.start()
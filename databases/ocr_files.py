@@ -1,20 +1,16 @@
 import streamlit as st
-import tempfile
-import os
 import shutil
-from uuid import uuid4
 from datetime import datetime
 from pathlib import Path
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 
 from src.vectorstore import get_vector_store
-from langchain_openai import OpenAIEmbeddings
+from embeddings_backend import bind_collection_embeddings
+from dedup import file_hash, find_file
+from document_pipeline import extract_pages, split_pages
+from ingestion_jobs import ingestion_queue, start_background_workers, ACTIVE_STATES, STATE_LABELS
 from src import CONFIG
 import pandas as pd
-import pytesseract
-from pdf2image import convert_from_path
 from PIL import Image
 import io
 
@@ -25,8 +21,6 @@ import io
 OPENAI_API_KEY = CONFIG["OPENAI_API_KEY"]
 BASE_DIR = "./collections"
 
-embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
-
 # Configuration de la page
 st.set_page_config(
     page_title="Traitement_OCR",
@@ -35,117 +29,77 @@ st.set_page_config(
 )
 
 # Initialisation du vector store
-vector_store = get_vector_store()
+vector_store = bind_collection_embeddings(get_vector_store())
+# Workers d'indexation en arrière-plan (une seule fois par processus)
+start_background_workers()
 
 
-def extract_text_from_scanned_pdf(pdf_path):
+def process_file(uploaded_file, fhash=None):
     """
-    Extrait le texte d'un PDF scanné en utilisant OCR avec Tesseract.
-    Utilise pdf2image au lieu de PyMuPDF pour éviter les conflits.
+    Traite un fichier et retourne les documents splittés.
+    Le fichier est lu en mémoire, sans fichier temporaire ; seules les pages
+    scannées des PDFs passent par l'OCR (pages en cache, cf. `ocr_cache`).
     """
     try:
-        # Convertir le PDF en images
-        images = convert_from_path(pdf_path, dpi=300)
-
-        extracted_text = []
-
-        for page_num, image in enumerate(images):
-            custom_config = r'--oem 3 --psm 6 -l fra+eng'
-            text = pytesseract.image_to_string(image, config=custom_config)
-
-            if text.strip():
-                extracted_text.append(text)
-
-        full_text = "\n\n".join(extracted_text)
-        return full_text.strip() if full_text.strip() else None
+        data = uploaded_file.getvalue()
+        pages = extract_pages(data, uploaded_file.name, fhash or file_hash(data),
+                              on_ocr=lambda selected: st.info(
+                                  f"📄 {len(selected)} page(s) scannée(s) détectée(s). Application de l'OCR..."))
+        if not pages:
+            st.warning("⚠️ Impossible d'extraire le texte du fichier")
+            return [], None
+        return split_pages(uploaded_file.name, pages), None
 
     except Exception as e:
-        st.error(f"❌ Erreur lors de l'extraction OCR: {str(e)}")
-        return None
+        return None, str(e)
 
 
-def process_file(uploaded_file):
+def enqueue_files(files, metadata=None):
     """
-    Traite un fichier et retourne les documents splittés.
-    Gère automatiquement les PDFs scannés avec OCR.
+    Met les fichiers en file d'indexation (OCR et embeddings faits par les workers,
+    cf. `ingestion_jobs`) ; les fichiers déjà indexés ou en cours sont ignorés.
     """
-    ext = uploaded_file.name.split(".")[-1].lower()
-    docs = []
-
-    try:
-        if ext == "pdf":
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                tmp_file.write(uploaded_file.getbuffer())
-                tmp_path = tmp_file.name
-
-            # Tentative de chargement classique
-            loader = PyPDFLoader(tmp_path)
-            pages = loader.load()
-
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=520,
-                chunk_overlap=20,
-                length_function=len
-            )
-            docs = text_splitter.split_documents(pages)
-
-            # Vérifier si c'est un PDF scanné
-            total_chars = sum(len(doc.page_content.strip()) for doc in docs)
-            avg_chars_per_page = total_chars / len(pages) if len(pages) > 0 else 0
-
-            if len(docs) == 0 or avg_chars_per_page < 100:
-                st.info("📄 PDF scanné détecté. Application de l'OCR en cours...")
-
-                ocr_text = extract_text_from_scanned_pdf(tmp_path)
-
-                if ocr_text:
-                    docs = [type("Doc", (), {
-                        "page_content": ocr_text,
-                        "metadata": {}
-                    })]
-                    docs = text_splitter.split_documents(docs)
-                    st.success(f"✅ OCR terminé: {len(docs)} chunks créés")
-                else:
-                    st.warning("⚠️ Impossible d'extraire le texte du PDF scanné")
-                    docs = []
-
-            os.remove(tmp_path)
-
-        elif ext == "txt":
-            content = uploaded_file.read().decode("utf-8")
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=520,
-                chunk_overlap=20,
-                length_function=len
-            )
-            docs = [type("Doc", (), {"page_content": content, "metadata": {}})]
-            docs = text_splitter.split_documents(docs)
-
-        elif ext in ["xlsx", "xls", "csv"]:
-            if ext == "csv":
-                df = pd.read_csv(uploaded_file)
-            else:
-                df = pd.read_excel(uploaded_file)
-
-            text_content = df.to_csv(index=False)
-            docs = [type("Doc", (), {"page_content": text_content, "metadata": {}})]
-
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=50
-            )
-            docs = text_splitter.split_documents(docs)
-
-        return docs, None
-
-    except Exception as e:
-        return None, str(e)
+    queued, skipped = [], []
+    for uploaded_file in files:
+        fhash = file_hash(uploaded_file.getbuffer())
+        if find_file(vector_store, fhash) or ingestion_queue.find_active(fhash):
+            skipped.append(uploaded_file.name)
+            continue
+        ingestion_queue.enqueue(uploaded_file.getvalue(), uploaded_file.name, dict(
+            metadata or {},
+            filename=uploaded_file.name,
+            date_added=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            file_hash=fhash
+        ), file_hash=fhash)
+        queued.append(uploaded_file.name)
+    st.session_state.ocr_enqueue_report = (queued, skipped)
+
+
+def show_enqueue_report():
+    """Résultat du dernier dépôt et état des indexations récentes"""
+    queued, skipped = st.session_state.pop("ocr_enqueue_report", ([], []))
+    if queued:
+        st.success(f"📥 {len(queued)} document(s) en file d'indexation")
+    for name in skipped:
+        st.info(f"♻️ '{name}' est déjà présent dans la base ou en cours d'indexation, ignoré")
+
+    jobs = ingestion_queue.jobs(limit=10)
+    if any(job["state"] in ACTIVE_STATES for job in jobs):
+        st.caption("⏳ Indexation en arrière-plan : vous pouvez quitter la page.")
+    if jobs:
+        st.dataframe(pd.DataFrame([{
+            "Fichier": job["filename"],
+            "État": STATE_LABELS.get(job["state"], job["state"]),
+            "Détail": job["error"] if job["state"] == "failed" else (job["report"] or ""),
+        } for job in jobs]), use_container_width=True, hide_index=True)
 
 
 # ============================================
 # INTERFACE STREAMLIT
 # ============================================
 
+show_enqueue_report()
+
 # Section pour admin/super_user
 if st.session_state.get("role") in ("admin", "super_user"):
     with st.expander("📁 Chargement de nouveaux documents", expanded=False):
@@ -164,70 +118,11 @@ if st.session_state.get("role") in ("admin", "super_user"):
             col1, col2 = st.columns([1, 4])
             with col1:
                 if st.button("➕ Ajouter à la base", type="primary", use_container_width=True):
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    success_count = 0
-                    error_count = 0
-
-                    for idx, uploaded_file in enumerate(admin_uploaded_files):
-                        status_text.text(f"Traitement de {uploaded_file.name}...")
-
-                        docs, error = process_file(uploaded_file)
-
-                        if error:
-                            st.error(f"❌ Erreur avec '{uploaded_file.name}': {error}")
-                            error_count += 1
-                        else:
-                            if docs and len(docs) > 0:
-                                # Ajout des métadonnées
-                                doc_id = str(uuid4())
-                                date_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                uploader = f"{st.session_state.get('nom', 'N/A')} {st.session_state.get('prenom', 'N/A')}"
-
-                                for d in docs:
-                                    d.metadata.update({
-                                        "doc_id": doc_id,
-                                        "filename": uploaded_file.name,
-                                        "date_added": date_str,
-                                        "uploaded_by_role": st.session_state.get("role", "unknown"),
-                                        "uploader": uploader
-                                    })
-
-                                # Chargement dans la base vectorielle
-                                if len(docs) <= 512:
-                                    vector_store.add_documents(
-                                        ids=[str(uuid4()) for _ in range(len(docs))],
-                                        documents=docs
-                                    )
-                                    success_count += 1
-                                else:
-                                    # Traitement par batch pour les gros documents
-                                    batch_size = 512
-                                    for i in range(0, len(docs), batch_size):
-                                        batch_docs = docs[i:i + batch_size]
-                                        batch_ids = [str(uuid4()) for _ in range(len(batch_docs))]
-
-                                        vector_store.add_documents(
-                                            ids=batch_ids,
-                                            documents=batch_docs
-                                        )
-                                    success_count += 1
-                            else:
-                                st.warning(f"⚠️ Aucun contenu extractible de '{uploaded_file.name}'")
-                                error_count += 1
-
-                        # Mise à jour de la progression
-                        progress_bar.progress((idx + 1) / len(admin_uploaded_files))
-
-                    # Fin du traitement
-                    status_text.empty()
-                    progress_bar.empty()
-
-                    if success_count > 0:
-                        st.success(f"✅ {success_count} document(s) ajouté(s) avec succès !")
-                    if error_count > 0:
-                        st.warning(f"⚠️ {error_count} document(s) en erreur.")
-
+                    uploader = f"{st.session_state.get('nom', 'N/A')} {st.session_state.get('prenom', 'N/A')}"
+                    enqueue_files(admin_uploaded_files, {
+                        "uploaded_by_role": st.session_state.get("role", "unknown"),
+                        "uploader": uploader,
+                    })
                     st.rerun()
 else:
     st.info("ℹ️ Seuls les administrateurs et les éditeurs peuvent charger de nouveaux documents.")
@@ -264,7 +159,14 @@ if uploaded_files:
 
     # Afficher l'aperçu
     with st.expander(f"👁️ Aperçu de '{preview_file.name}'", expanded=True):
-        docs, error = process_file(preview_file)
+        # Aperçu mémorisé par contenu : pas de nouveau traitement à chaque changement de sélection
+        preview_hash = file_hash(preview_file.getbuffer())
+        previews = st.session_state.setdefault("ocr_previews", {})
+        if preview_hash not in previews:
+            if len(previews) >= 8:
+                previews.pop(next(iter(previews)))
+            previews[preview_hash] = process_file(preview_file, preview_hash)
+        docs, error = previews[preview_hash]
 
         if error:
             st.error(f"Erreur lors du chargement: {error}")
@@ -279,8 +181,11 @@ if uploaded_files:
             with col_info2:
                 st.metric("Nombre de caractères", len(full_content))
             with col_info3:
-                if docs and docs[0].metadata.get("ocr_processed"):
+                ocr_chunks = sum(bool(doc.metadata.get("ocr_processed")) for doc in docs)
+                if docs and ocr_chunks == len(docs):
                     st.metric("Type", "OCR 🔍")
+                elif ocr_chunks:
+                    st.metric("Type", "Mixte 🔍📝", help=f"{ocr_chunks} chunk(s) issus de pages OCRisées")
                 else:
                     st.metric("Type", "Texte natif 📝")
 
@@ -298,49 +203,5 @@ if uploaded_files:
     col1, col2 = st.columns([1, 4])
     with col1:
         if st.button("✅ Ajouter à la base", type="primary", use_container_width=True, key="add_test_files"):
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            success_count = 0
-            error_count = 0
-
-            for idx, uploaded_file in enumerate(uploaded_files):
-                status_text.text(f"Traitement de {uploaded_file.name}...")
-
-                docs, error = process_file(uploaded_file)
-
-                if error:
-                    st.error(f"❌ Erreur avec '{uploaded_file.name}': {error}")
-                    error_count += 1
-                else:
-                    if docs and len(docs) > 0:
-                        # Ajout des métadonnées
-                        doc_id = str(uuid4())
-                        date_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                        for d in docs:
-                            d.metadata.update({
-                                "doc_id": doc_id,
-                                "filename": uploaded_file.name,
-                                "date_added": date_str
-                            })
-
-                        vector_store.add_documents(
-                            ids=[str(uuid4()) for _ in range(len(docs))],
-                            documents=docs
-                        )
-                        success_count += 1
-                    else:
-                        st.warning(f"⚠️ Aucun contenu extractible de '{uploaded_file.name}'")
-                        error_count += 1
-
-                progress_bar.progress((idx + 1) / len(uploaded_files))
-
-            status_text.empty()
-            progress_bar.empty()
-
-            if success_count > 0:
-                st.success(f"✅ {success_count} document(s) ajouté(s) avec succès !")
-            if error_count > 0:
-                st.warning(f"⚠️ {error_count} document(s) en erreur.")
-
+            enqueue_files(uploaded_files)
             st.rerun()
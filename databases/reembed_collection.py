@@ -0,0 +1,99 @@
+"""
+Ré-embedding d'une collection Chroma avec un autre backend (cf. `embeddings_backend`).
+
+Les chunks (ids, textes, métadonnées) sont copiés par lots dans une collection
+`<nom>__reembed` avec les vecteurs du nouveau modèle. Avec --swap, la
+collection d'origine est renommée `<nom>__old_<date>` (gardée pour retour
+arrière) et la nouvelle prend son nom. Le backend est enregistré pour la
+collection résultante.
+
+L'échange se fait application arrêtée et file d'indexation vide : un
+processus en cours garde la collection d'origine (par identifiant) et
+continuerait d'y écrire, sous son nom `__old_`, jusqu'à son redémarrage.
+
+    python -m databases.reembed_collection --collection documents --backend local --swap
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime
+
+import chromadb
+
+sys.path.append(".")
+
+from embeddings_backend import EMBEDDING_LOCAL_MODEL, LOCAL_MODELS, get_embeddings, set_collection_backend
+from ingestion import bump_collection_version
+from vectorstore_maintenance import check_idle, confirm_app_stopped
+
+BASE_DIR = "./collections"
+READ_BATCH = 1000
+
+
+def reembed(collection_name, backend, model=None, batch_size=256, swap=False, force=False):
+    if swap:
+        check_idle(force)
+    if backend == "local":
+        model = model or EMBEDDING_LOCAL_MODEL
+    client = chromadb.PersistentClient(path=BASE_DIR)
+    source = client.get_collection(collection_name)
+    embeddings = get_embeddings(backend, model)
+
+    target_name = f"{collection_name}__reembed"
+    try:
+        # Reprise après une migration interrompue : on repart de zéro
+        client.delete_collection(target_name)
+    except Exception:
+        pass
+    target = client.create_collection(target_name, metadata=source.metadata or None)
+
+    total = source.count()
+    print(f"📚 {total} chunks à ré-embedder avec {backend}{f' ({model})' if model else ''}")
+    done, start = 0, time.perf_counter()
+    for offset in range(0, total, READ_BATCH):
+        page = source.get(offset=offset, limit=READ_BATCH, include=["documents", "metadatas"])
+        for i in range(0, len(page["ids"]), batch_size):
+            ids = page["ids"][i:i + batch_size]
+            texts = page["documents"][i:i + batch_size]
+            target.add(ids=ids, documents=texts, metadatas=page["metadatas"][i:i + batch_size],
+                       embeddings=embeddings.embed_documents(texts))
+            done += len(ids)
+            rate = done / (time.perf_counter() - start)
+            print(f"   {done}/{total} chunks ({rate:.0f} chunks/s)", end="\r", flush=True)
+    print()
+
+    if swap:
+        # La copie peut être longue : une indexation lancée entre-temps n'y serait pas
+        check_idle(force)
+        backup_name = f"{collection_name}__old_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        source.modify(name=backup_name)
+        target.modify(name=collection_name)
+        set_collection_backend(collection_name, backend, model)
+        print(f"🔁 '{collection_name}' remplacée ; ancienne collection conservée sous '{backup_name}'")
+    else:
+        set_collection_backend(target_name, backend, model)
+        print(f"✅ Collection '{target_name}' prête (relancer avec --swap pour remplacer '{collection_name}')")
+
+    bump_collection_version()
+    print(f"⏱️ {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ré-embedding d'une collection Chroma")
+    parser.add_argument("--collection", required=True, help="Nom de la collection Chroma")
+    parser.add_argument("--backend", choices=["openai", "local"], required=True)
+    parser.add_argument("--model", help=f"Modèle (local : {', '.join(LOCAL_MODELS)})")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks par appel d'embedding")
+    parser.add_argument("--swap", action="store_true",
+                        help="Remplacer la collection d'origine (application arrêtée)")
+    parser.add_argument("--force", action="store_true", help="Ignorer les indexations en cours")
+    parser.add_argument("--yes", action="store_true", help="Confirmer que l'application est arrêtée")
+    args = parser.parse_args()
+    if args.swap and not args.yes and not confirm_app_stopped():
+        raise SystemExit(1)
+
+    print("=" * 60)
+    print("🔄 RÉ-EMBEDDING DE LA COLLECTION")
+    print("=" * 60 + "\n")
+    reembed(args.collection, args.backend, args.model, args.batch_size, args.swap, args.force)
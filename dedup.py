@@ -0,0 +1,289 @@
+"""
+Déduplication à l'indexation.
+
+- Niveau fichier : empreinte SHA256 du contenu brut, stockée dans les
+  métadonnées des chunks (`file_hash`) pour rejeter les re-téléversements.
+- Niveau chunk : doublons exacts (empreinte normalisée) et quasi-doublons
+  (MinHash + LSH sur des shingles de mots), via un index SQLite local.
+
+Un quasi-doublon n'est écarté que s'il reprend un passage d'un autre document
+avec les mêmes nombres (mentions légales, en-têtes répétés) : deux lignes de
+grille ou deux versions d'un barème qui ne diffèrent que par un montant, une
+date ou un échelon sont presque identiques pour MinHash mais sont conservées,
+de même que les quasi-doublons internes au document et les chunks de tableaux.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+
+from langchain_core.documents import Document
+
+from ingestion import chunk_hash, normalize_text
+from tables import is_table_chunk
+
+INDEX_PATH = os.path.join("./collections", "dedup_index.db")
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+NEAR_DUP_THRESHOLD = 0.85
+
+_NUMBER = re.compile(r"\d+(?:[.,\s]\d{3})*(?:[.,]\d+)?")
+
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Permutations fixes (déterministes) pour que les signatures restent comparables
+_PERMS = [
+    (int.from_bytes(hashlib.sha256(f"a{i}".encode()).digest()[:8], "big") % _MERSENNE | 1,
+     int.from_bytes(hashlib.sha256(f"b{i}".encode()).digest()[:8], "big") % _MERSENNE)
+    for i in range(NUM_PERM)
+]
+
+
+def file_hash(data) -> str:
+    """Empreinte du contenu brut d'un fichier (bytes ou memoryview)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def find_file(vector_store, fhash):
+    """Retourne les métadonnées d'un document déjà indexé avec ce contenu, sinon None"""
+    results = vector_store.get(where={"file_hash": fhash}, limit=1, include=["metadatas"])
+    return results["metadatas"][0] if results["metadatas"] else None
+
+
+def find_document_by_name(vector_store, filename, department=None):
+    """Retourne le doc_id d'un document du même nom (et département), sinon None"""
+    where = {"filename": filename}
+    if department:
+        where = {"$and": [{"filename": filename}, {"department": department}]}
+    results = vector_store.get(where=where, limit=1, include=["metadatas"])
+    return results["metadatas"][0].get("doc_id") if results["metadatas"] else None
+
+
+# ===== MINHASH =====
+
+def _shingles(text):
+    words = normalize_text(text).split()
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """Signature MinHash (NUM_PERM entiers 32 bits) d'un texte"""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+              for s in _shingles(text)]
+    return [min(((a * h + b) % _MERSENNE) & _MAX_HASH for h in hashes) for a, b in _PERMS]
+
+
+def number_key(text) -> str:
+    """Empreinte de la suite des nombres d'un texte (montants, dates, échelons)"""
+    numbers = [re.sub(r"\D", "", n) for n in _NUMBER.findall(text)]
+    return hashlib.md5(",".join(numbers).encode()).hexdigest()
+
+
+def similarity(sig_a, sig_b) -> float:
+    """Estimation de la similarité de Jaccard à partir de deux signatures"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+def _band_keys(signature):
+    return [
+        f"{b}:" + hashlib.md5(",".join(map(str, signature[b * ROWS:(b + 1) * ROWS])).encode()).hexdigest()
+        for b in range(BANDS)
+    ]
+
+
+# ===== INDEX LOCAL =====
+
+class ChunkIndex:
+    """Index SQLite des empreintes et signatures des chunks déjà indexés"""
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    chunk_hash TEXT NOT NULL,
+                    doc_id TEXT NOT NULL,
+                    department TEXT NOT NULL,
+                    signature TEXT NOT NULL,
+                    numbers TEXT
+                )
+            """)
+            # Index créé avant `numbers` : colonne ajoutée, remplie par `rebuild`
+            if "numbers" not in [row[1] for row in conn.execute("PRAGMA table_info(chunks)")]:
+                conn.execute("ALTER TABLE chunks ADD COLUMN numbers TEXT")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS bands (
+                    band_key TEXT NOT NULL,
+                    chunk_hash TEXT NOT NULL,
+                    doc_id TEXT NOT NULL,
+                    department TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_hash ON chunks(chunk_hash, department)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc ON chunks(doc_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_key ON bands(band_key, department)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_doc ON bands(doc_id)")
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _session(self, conn=None):
+        """Connexion de l'appelant (une par lot d'ingestion) ou ouverte pour l'appel"""
+        if conn is not None:
+            yield conn
+        else:
+            with self._conn() as conn:
+                yield conn
+
+    def connection(self):
+        """Connexion à réutiliser pour tout un lot (cf. `deduplicate_chunks`)"""
+        return self._conn()
+
+    @staticmethod
+    def _rows(docs, department=None):
+        department = department or ""
+        chunk_rows, band_rows = [], []
+        for d in docs:
+            h = d.metadata.get("chunk_hash") or chunk_hash(d.page_content)
+            doc_id = d.metadata["doc_id"]
+            signature = minhash(d.page_content)
+            chunk_rows.append((h, doc_id, department, ",".join(map(str, signature)), number_key(d.page_content)))
+            band_rows.extend((key, h, doc_id, department) for key in _band_keys(signature))
+        return chunk_rows, band_rows
+
+    @staticmethod
+    def _insert(conn, chunk_rows, band_rows):
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", chunk_rows)
+        conn.executemany("INSERT INTO bands VALUES (?, ?, ?, ?)", band_rows)
+
+    def add(self, docs, department=None):
+        """Enregistre les chunks (déjà munis de `doc_id` et `chunk_hash`)"""
+        chunk_rows, band_rows = self._rows(docs, department)
+        with self._conn() as conn:
+            self._insert(conn, chunk_rows, band_rows)
+
+    def remove_document(self, doc_id):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            conn.execute("DELETE FROM bands WHERE doc_id = ?", (doc_id,))
+
+    def existing_hashes(self, hashes, department=None, conn=None):
+        """Sous-ensemble de `hashes` déjà présents dans le département"""
+        hashes = list(set(hashes))
+        found = set()
+        with self._session(conn) as conn:
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT DISTINCT chunk_hash FROM chunks WHERE department = ? "
+                    f"AND chunk_hash IN ({','.join('?' * len(batch))})",
+                    [department or ""] + batch
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def find_near_duplicate(self, signature, department=None, threshold=NEAR_DUP_THRESHOLD,
+                            exclude_doc_id=None, numbers=None, conn=None):
+        """
+        Retourne (doc_id, similarité, empreinte des nombres) du chunk indexé le
+        plus proche au-delà du seuil, sinon None. Les candidats du document
+        `exclude_doc_id`, ou dont les nombres diffèrent de `numbers`, sont
+        écartés avant de choisir le plus proche : ils ne masquent pas un autre match.
+        """
+        keys = _band_keys(signature)
+        query = f"""SELECT DISTINCT c.doc_id, c.signature, c.numbers FROM bands b
+                    JOIN chunks c ON c.chunk_hash = b.chunk_hash AND c.doc_id = b.doc_id
+                    WHERE b.department = ? AND b.band_key IN ({','.join('?' * len(keys))})"""
+        params = [department or ""] + keys
+        if exclude_doc_id is not None:
+            query += " AND c.doc_id != ?"
+            params.append(exclude_doc_id)
+        if numbers is not None:
+            query += " AND c.numbers = ?"
+            params.append(numbers)
+        with self._session(conn) as conn:
+            candidates = conn.execute(query, params).fetchall()
+
+        best = None
+        for doc_id, sig, numbers in candidates:
+            sim = similarity(signature, [int(x) for x in sig.split(",")])
+            if sim >= threshold and (best is None or sim > best[1]):
+                best = (doc_id, sim, numbers)
+        return best
+
+    def needs_rebuild(self) -> bool:
+        """Index vide ou antérieur à la colonne `numbers`"""
+        with self._conn() as conn:
+            total, missing = conn.execute(
+                "SELECT COUNT(*), COUNT(*) - COUNT(numbers) FROM chunks"
+            ).fetchone()
+        return total == 0 or missing > 0
+
+    def rebuild(self, vector_store):
+        """Reconstruit l'index depuis le vector store (chunks indexés avant la déduplication)"""
+        results = vector_store.get(include=["metadatas", "documents"])
+        chunk_rows, band_rows = [], []
+        for meta, text in zip(results["metadatas"], results["documents"]):
+            if not (meta or {}).get("doc_id"):
+                continue
+            rows = self._rows([Document(page_content=text, metadata=dict(meta))], meta.get("department"))
+            chunk_rows.extend(rows[0])
+            band_rows.extend(rows[1])
+
+        # Une seule transaction : deux reconstructions simultanées ne dupliquent pas l'index
+        with self._conn() as conn:
+            conn.execute("DELETE FROM chunks")
+            conn.execute("DELETE FROM bands")
+            self._insert(conn, chunk_rows, band_rows)
+        return len(chunk_rows)
+
+
+def deduplicate_chunks(docs, index, department=None, threshold=NEAR_DUP_THRESHOLD):
+    """
+    Filtre les doublons exacts (dans l'upload et dans la base du département)
+    et les quasi-doublons d'un autre document qui ont les mêmes nombres.
+    Retourne (chunks conservés, rapport des chunks écartés).
+    """
+    hashes = [d.metadata.get("chunk_hash") or chunk_hash(d.page_content) for d in docs]
+    kept, skipped = [], []
+    seen_hashes = set()
+
+    # Une seule connexion pour tout le lot (une recherche LSH par chunk)
+    with index.connection() as conn:
+        already_indexed = index.existing_hashes(hashes, department, conn=conn)
+
+        for d, h in zip(docs, hashes):
+            preview = " ".join(d.page_content.split())[:80]
+
+            if h in already_indexed or h in seen_hashes:
+                skipped.append({"raison": "doublon exact", "similarité": 1.0, "extrait": preview})
+                continue
+
+            if not is_table_chunk(d):
+                # Passage répété d'un autre document ; un nombre différent en fait un contenu distinct
+                near = index.find_near_duplicate(minhash(d.page_content), department, threshold,
+                                                 exclude_doc_id=d.metadata.get("doc_id"),
+                                                 numbers=number_key(d.page_content), conn=conn)
+                if near is not None:
+                    skipped.append({"raison": "quasi-doublon", "similarité": round(near[1], 2), "extrait": preview})
+                    continue
+
+            seen_hashes.add(h)
+            kept.append(d)
+
+    return kept, skipped
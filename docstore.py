@@ -0,0 +1,243 @@
+"""
+Docstore des sections parentes et recherche « small-to-big ».
+
+La recherche se fait sur les petits chunks (cf. `chunking`), mais chaque
+chunk trouvé est remplacé par sa section parente complète, lue dans un
+docstore local (SQLite) indexé par `doc_id` + `section_id` et alimenté à
+l'indexation. Plusieurs chunks d'une même section ne donnent qu'une
+expansion ; une section trop longue est réduite aux enfants trouvés et à
+leurs voisins. Les sections lues sont gardées dans un LRU invalidé par la
+version de la collection.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from langchain_core.documents import Document
+
+from ingestion import chunk_hash, collection_version, index_sentences
+
+PARENT_EXPANSION = os.getenv("PARENT_EXPANSION", "1") == "1"
+DOCSTORE_PATH = os.getenv("DOCSTORE_PATH", os.path.join("./collections", "sections.db"))
+# Au-delà, seule une fenêtre de `PARENT_WINDOW` enfants autour de chaque chunk trouvé est gardée
+PARENT_MAX_CHARS = int(os.getenv("PARENT_MAX_CHARS", 3000))
+PARENT_WINDOW = 1
+SECTION_CACHE_SIZE = 1024
+ELLIPSIS = "[…]"
+
+
+def _strip_title(content, title):
+    """Les enfants répètent le titre de leur section (cf. `chunking`) : on le retire pour les recoller"""
+    if title and content.startswith(title + "\n"):
+        return content[len(title) + 1:]
+    return content
+
+
+def sections_from_chunks(docs) -> dict:
+    """
+    Reconstitue les sections d'un document à partir de ses chunks (avant déduplication).
+    Retourne {section_id: {"title", "path", "page", "children": [textes]}}.
+    """
+    sections = {}
+    for d in sorted(docs, key=lambda d: d.metadata.get("child_index", 0)):
+        section_id = d.metadata.get("section_id")
+        if not section_id:
+            continue
+        title = d.metadata.get("section_title", "")
+        section = sections.setdefault(section_id, {
+            "title": title,
+            "path": d.metadata.get("section_path", ""),
+            "page": d.metadata.get("page"),
+            "children": [],
+        })
+        section["children"].append(_strip_title(d.page_content, title))
+    return sections
+
+
+def section_content(title, children) -> str:
+    return "\n".join([title] + children if title else children)
+
+
+class SectionStore:
+    """Sections parentes par (doc_id, section_id)"""
+
+    def __init__(self, path=DOCSTORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sections (
+                    doc_id TEXT NOT NULL,
+                    section_id TEXT NOT NULL,
+                    title TEXT,
+                    path TEXT,
+                    page INTEGER,
+                    children TEXT NOT NULL,
+                    PRIMARY KEY (doc_id, section_id)
+                )
+            """)
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def put_document(self, doc_id, sections):
+        """Remplace toutes les sections d'un document (cf. `sections_from_chunks`)"""
+        with self._conn() as conn:
+            conn.execute("DELETE FROM sections WHERE doc_id = ?", (doc_id,))
+            conn.executemany(
+                "INSERT INTO sections VALUES (?, ?, ?, ?, ?, ?)",
+                [(doc_id, section_id, s["title"], s["path"], s["page"], json.dumps(s["children"]))
+                 for section_id, s in sections.items()]
+            )
+
+    def delete_document(self, doc_id):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM sections WHERE doc_id = ?", (doc_id,))
+
+    def prune(self, live_doc_ids) -> int:
+        """Supprime les sections des documents qui ne sont plus dans la collection"""
+        with self._conn() as conn:
+            conn.execute("CREATE TEMP TABLE live (doc_id TEXT PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO live VALUES (?)", [(d,) for d in live_doc_ids])
+            return conn.execute(
+                "DELETE FROM sections WHERE doc_id NOT IN (SELECT doc_id FROM live)"
+            ).rowcount
+
+    def live_hashes(self) -> set:
+        """
+        Empreintes des sections complètes : leurs phrases sont précalculées à
+        l'indexation (cf. `store_document_sections`) et doivent survivre aux
+        purges de l'index des phrases, qui ne voient que les chunks.
+        """
+        with self._conn() as conn:
+            rows = conn.execute("SELECT title, children FROM sections").fetchall()
+        return {chunk_hash(section_content(title or "", json.loads(children))) for title, children in rows}
+
+    def get_many(self, keys) -> dict:
+        """{(doc_id, section_id): {"title", "path", "page", "children"}}"""
+        keys = list(set(keys))
+        if not keys:
+            return {}
+        with self._conn() as conn:
+            rows = conn.execute(
+                f"SELECT doc_id, section_id, title, path, page, children FROM sections "
+                f"WHERE (doc_id, section_id) IN (VALUES {','.join(['(?, ?)'] * len(keys))})",
+                [value for key in keys for value in key]
+            ).fetchall()
+        return {(doc_id, section_id): {"title": title or "", "path": path or "", "page": page,
+                                       "children": json.loads(children)}
+                for doc_id, section_id, title, path, page, children in rows}
+
+
+# Docstore partagé du processus
+section_store = SectionStore()
+
+
+def store_document_sections(vector_store, doc_id, docs, store=section_store):
+    """
+    Enregistre les sections d'un document à l'indexation et précalcule les
+    vecteurs de phrases des sections complètes (pour la compression de contexte).
+    À appeler avant l'ajout des chunks, dont l'incrément de version invalide les caches.
+    """
+    sections = sections_from_chunks(docs)
+    store.put_document(doc_id, sections)
+    contents = [section_content(s["title"], s["children"]) for s in sections.values() if len(s["children"]) > 1]
+    index_sentences(vector_store, [Document(page_content=c) for c in contents if len(c) <= PARENT_MAX_CHARS])
+
+
+class ParentExpander:
+    """Remplace les chunks trouvés par leur section parente, sans doublon"""
+
+    def __init__(self, store=section_store, max_chars=PARENT_MAX_CHARS, window=PARENT_WINDOW,
+                 cache_size=SECTION_CACHE_SIZE):
+        self.store = store
+        self.max_chars = max_chars
+        self.window = window
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _sections(self, keys):
+        version = collection_version()
+        found, missing = {}, []
+        with self._lock:
+            if version != self._version:
+                self._cache.clear()
+                self._version = version
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[key] = self._cache[key]
+                else:
+                    missing.append(key)
+
+        if missing:
+            loaded = self.store.get_many(missing)
+            with self._lock:
+                for key in missing:
+                    # Les absents sont aussi mémorisés (None) : documents indexés sans sections
+                    self._cache[key] = found[key] = loaded.get(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return found
+
+    def _content(self, section, hits):
+        content = section_content(section["title"], section["children"])
+        if len(content) <= self.max_chars:
+            return content, True
+
+        # Section trop longue : enfants trouvés et leurs voisins, trous marqués
+        children = section["children"]
+        keep = sorted({i for hit in hits for i in range(hit - self.window, hit + self.window + 1)
+                       if 0 <= i < len(children)})
+        parts, previous = [], None
+        for i in keep:
+            if previous is not None and i != previous + 1:
+                parts.append(ELLIPSIS)
+            parts.append(children[i])
+            previous = i
+        return section_content(section["title"], parts), False
+
+    def expand(self, docs):
+        keys = [(d.metadata.get("doc_id"), d.metadata.get("section_id")) for d in docs]
+        sections = self._sections([key for key in keys if all(key)])
+
+        # Regroupement par section, dans l'ordre du premier chunk trouvé
+        groups = OrderedDict()
+        for d, key in zip(docs, keys):
+            if sections.get(key) is None:
+                groups[id(d)] = (d, None, [])
+                continue
+            if key not in groups:
+                groups[key] = (d, sections[key], [])
+            groups[key][2].append(int(d.metadata.get("child_index", 0)))
+
+        expanded = []
+        for d, section, hits in groups.values():
+            if section is None:
+                expanded.append(d)
+                continue
+            content, complete = self._content(section, hits)
+            metadata = dict(d.metadata, chunk_role="parent", expanded_hits=len(hits))
+            if complete:
+                # Empreinte de la section complète : ses phrases sont indexées à l'ingestion
+                metadata["chunk_hash"] = chunk_hash(content)
+            else:
+                metadata.pop("chunk_hash", None)
+            expanded.append(Document(page_content=content, metadata=metadata))
+        return expanded
+
+
+parent_expander = ParentExpander() if PARENT_EXPANSION else None
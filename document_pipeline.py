@@ -0,0 +1,245 @@
+"""
+Extraction et découpage des fichiers téléversés, sans dépendance à Streamlit.
+
+Utilisé par les workers d'indexation (cf. `ingestion_jobs`) et l'aperçu de la
+page OCR : lecture du fichier en pages, OCR Tesseract des seules pages
+scannées (en parallèle, après prétraitement des images cf. `ocr_preprocess`,
+résultats en cache cf. `ocr_cache`), puis découpage (cf. `chunking`).
+
+Tout se fait sur le contenu du fichier en mémoire (bytes) : lecture du texte
+avec pypdf, rendu des pages avec PyMuPDF. Sans PyMuPDF, le rendu passe par
+pdf2image, qui exige un fichier : il est écrit une seule fois par document et
+toujours supprimé.
+
+Les tableaux (feuilles de tableur, tableaux détectés dans les PDF) deviennent
+des chunks ligne par ligne avec leurs en-têtes (cf. `tables`).
+
+Chaque page d'un PDF est classée d'après sa couche texte et, si PyMuPDF est
+installé, la part de sa surface couverte par des images : une page sans
+texte, ou couverte d'images avec une couche texte maigre, est OCRisée ; une
+page blanche (ni texte ni image) est ignorée.
+"""
+
+import io
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pandas as pd
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from pdf2image import convert_from_path
+from PIL import Image
+from pypdf import PdfReader
+
+import ocr_preprocess
+from chunking import get_text_splitter
+from dedup import file_hash
+from ocr_cache import ocr_cache
+from ocr_engine import OCR_CONFIG, OCR_WORKERS, get_ocr_engine
+from tables import TABLE_EXTRACTION, dataframe_documents, is_table_chunk, split_pdf_tables
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+OCR_DPI = 300
+# Prétraitement des pages (cf. `ocr_preprocess`) : pages blanches ignorées, résolution adaptée
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "1") == "1"
+# En dessous de ce nombre de caractères, la page est considérée comme scannée
+MIN_CHARS_PER_PAGE = 100
+# Page couverte d'images à ce point et couche texte maigre : scan avec en-tête ou OCR embarqué pauvre
+IMAGE_COVERAGE_OCR = 0.6
+SCANNED_PAGE_MAX_CHARS = 400
+SPREADSHEET_EXTENSIONS = ("xlsx", "xls", "csv")
+SUPPORTED_EXTENSIONS = ("pdf", "txt") + SPREADSHEET_EXTENSIONS
+
+
+def extension(filename) -> str:
+    return filename.rsplit(".", 1)[-1].lower()
+
+
+def load_pages(data, filename):
+    """Pages (Documents LangChain) du fichier de contenu `data` (bytes)"""
+    ext = extension(filename)
+    if ext == "pdf":
+        reader = PdfReader(io.BytesIO(data))
+        return [Document(page_content=page.extract_text() or "", metadata={"source": filename, "page": i})
+                for i, page in enumerate(reader.pages)]
+    if ext == "txt":
+        return [Document(page_content=bytes(data).decode("utf-8"), metadata={})]
+    if ext in SPREADSHEET_EXTENSIONS:
+        buffer = io.BytesIO(data)
+        if TABLE_EXTRACTION:
+            # Une ligne = un enregistrement avec ses en-têtes (cf. `tables`), toutes les feuilles
+            frames = {"csv": pd.read_csv(buffer)} if ext == "csv" else pd.read_excel(buffer, sheet_name=None)
+            return dataframe_documents(frames, filename)
+        df = pd.read_csv(buffer) if ext == "csv" else pd.read_excel(buffer)
+        return [Document(page_content=df.to_csv(index=False), metadata={})]
+    raise ValueError(f"Format non pris en charge : .{ext}")
+
+
+def image_coverage(data) -> dict:
+    """{page: part de la surface couverte par des images}, vide sans PyMuPDF"""
+    if fitz is None:
+        return {}
+    coverage = {}
+    with fitz.open(stream=data, filetype="pdf") as pdf:
+        for page_num, page in enumerate(pdf):
+            page_area = abs(page.rect) or 1
+            image_area = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+            coverage[page_num] = min(1.0, image_area / page_area)
+    return coverage
+
+
+def pages_to_ocr(data, filename, pages) -> list:
+    """Numéros des pages d'un PDF dont la couche texte ne suffit pas"""
+    if extension(filename) != "pdf":
+        return []
+    coverage = image_coverage(data)
+    page_count = len(coverage) or len(pages)
+    chars = {p.metadata.get("page", i): len(p.page_content.strip()) for i, p in enumerate(pages)}
+
+    selected = []
+    for page_num in range(page_count):
+        text_chars = chars.get(page_num, 0)
+        images = coverage.get(page_num)
+        if text_chars < MIN_CHARS_PER_PAGE:
+            # Page blanche (connue grâce à PyMuPDF) : rien à OCRiser
+            if images != 0:
+                selected.append(page_num)
+        elif images is not None and images >= IMAGE_COVERAGE_OCR and text_chars < SCANNED_PAGE_MAX_CHARS:
+            selected.append(page_num)
+    return selected
+
+
+def ocr_cache_config() -> str:
+    """Configuration OCR faisant partie de la clé du cache"""
+    if OCR_PREPROCESS:
+        return f"{OCR_CONFIG} --preprocess {ocr_preprocess.PREPROCESS_VERSION}"
+    return f"{OCR_CONFIG} --dpi {OCR_DPI}"
+
+
+@contextmanager
+def temporary_file(data, suffix=".pdf"):
+    """Chemin d'un fichier temporaire contenant `data`, supprimé à la sortie quoi qu'il arrive"""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        yield path
+    finally:
+        os.remove(path)
+
+
+@contextmanager
+def page_renderer(data):
+    """
+    Fonction `render(numéro de page, dpi) -> image PIL` pour ce PDF.
+    PyMuPDF rend depuis la mémoire (un document ouvert par appel : utilisable en parallèle) ;
+    sinon pdf2image travaille sur un fichier temporaire partagé par toutes les pages.
+    """
+    if fitz is not None:
+        def render(page_num, dpi=OCR_DPI):
+            with fitz.open(stream=data, filetype="pdf") as pdf:
+                pix = pdf[page_num].get_pixmap(dpi=dpi, alpha=False)
+                return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        yield render
+        return
+
+    with temporary_file(data) as path:
+        yield lambda page_num, dpi=OCR_DPI: convert_from_path(path, dpi=dpi, first_page=page_num + 1,
+                                                              last_page=page_num + 1)[0]
+
+
+def ocr_page(render, page_num, preprocess=OCR_PREPROCESS, engine=None) -> str:
+    """
+    Texte OCR d'une page. Avec prétraitement : sonde basse résolution (page
+    blanche → aucun OCR), rendu à la résolution adaptée, redressement, binarisation.
+    """
+    engine = engine or get_ocr_engine()
+    if not preprocess:
+        return engine.image_to_text(render(page_num, OCR_DPI))
+    analysis = ocr_preprocess.analyze(render(page_num, ocr_preprocess.OCR_PROBE_DPI))
+    if analysis is None:
+        return ""
+    angle, dpi = analysis
+    image = ocr_preprocess.prepare(render(page_num, dpi), angle)
+    return engine.image_to_text(image, dpi)
+
+
+def ocr_pdf(data, fhash=None, page_numbers=None):
+    """
+    Pages OCRisées d'un PDF (toutes, ou `page_numbers`), dans l'ordre ; les pages vides sont ignorées.
+    Seules les pages absentes du cache sont rendues et OCRisées, en parallèle.
+    """
+    fhash = fhash or file_hash(data)
+    if page_numbers is None:
+        page_numbers = range(len(PdfReader(io.BytesIO(data)).pages))
+    config = ocr_cache_config()
+    texts = ocr_cache.get_many(fhash, config)
+
+    missing = [page_num for page_num in page_numbers if page_num not in texts]
+    if missing:
+        with page_renderer(data) as render, \
+                ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr") as executor:
+            for page_num, text in zip(missing, executor.map(lambda n: ocr_page(render, n), missing)):
+                texts[page_num] = text
+                # Les pages vides sont aussi mémorisées : elles ne sont pas OCRisées à nouveau
+                ocr_cache.put(fhash, page_num, config, text)
+
+    return [Document(page_content=texts[page_num], metadata={"page": page_num, "ocr_processed": True})
+            for page_num in page_numbers if texts[page_num].strip()]
+
+
+def merge_pages(pages, ocr_pages):
+    """
+    Remplace les pages natives par leur version OCR, dans l'ordre des pages.
+    Une page OCRisée sans résultat garde son texte natif, s'il y en a un.
+    """
+    merged = {}
+    for i, page in enumerate(pages):
+        if page.page_content.strip():
+            page.metadata.setdefault("page", i)
+            page.metadata["ocr_processed"] = False
+            merged[page.metadata["page"]] = page
+    for page in ocr_pages:
+        metadata = dict(merged[page.metadata["page"]].metadata) if page.metadata["page"] in merged else {}
+        metadata.update(page.metadata)
+        merged[page.metadata["page"]] = Document(page_content=page.page_content, metadata=metadata)
+    return [merged[page_num] for page_num in sorted(merged)]
+
+
+def extract_pages(data, filename, fhash=None, on_ocr=None):
+    """
+    Pages du fichier de contenu `data`, les pages scannées d'un PDF étant OCRisées.
+    `on_ocr(numéros de pages)` est appelé avant l'OCR, s'il y en a un.
+    """
+    pages = load_pages(data, filename)
+    selected = pages_to_ocr(data, filename, pages)
+    if selected:
+        if on_ocr:
+            on_ocr(selected)
+        pages = merge_pages(pages, ocr_pdf(data, fhash, selected))
+    if extension(filename) == "pdf":
+        # Tableaux des pages natives : retirés du texte, chunks ligne par ligne
+        pages, table_docs = split_pdf_tables(data, pages)
+        pages = pages + table_docs
+    return pages
+
+
+def split_pages(filename, pages):
+    """
+    Chunks du document : structure pour le texte ; les chunks de tableaux
+    (cf. `tables`) sont gardés tels quels, après le texte.
+    """
+    tables = [p for p in pages if is_table_chunk(p)]
+    pages = [p for p in pages if not is_table_chunk(p) and p.page_content.strip()]
+    if not pages:
+        return tables
+    if extension(filename) in SPREADSHEET_EXTENSIONS:
+        # Tableur sans extraction des tableaux (TABLE_EXTRACTION=0) : lignes CSV groupées
+        return RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=50).split_documents(pages) + tables
+    return get_text_splitter().split_documents(pages) + tables
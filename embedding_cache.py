@@ -0,0 +1,221 @@
+"""
+Mémoïsation des embeddings de questions.
+
+Chaque question passait par un appel réseau d'embedding, même quand la même
+formulation revient chez de nombreux utilisateurs. Les embeddings sont gardés
+dans un LRU en mémoire (par processus) et, optionnellement, dans un store
+SQLite sur disque partagé entre processus. Le cache est préchauffé en un seul
+appel groupé à partir des questions les plus fréquentes de l'historique.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from chat_db import get_frequent_questions
+from embeddings_backend import embed_queries
+from ingestion import normalize_text
+from scheduler import scheduler
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 4096))
+# Chemin du store disque ; chaîne vide pour le désactiver
+EMBEDDING_DISK_CACHE = os.getenv("EMBEDDING_DISK_CACHE", os.path.join("./collections", "query_embeddings.db"))
+EMBEDDING_DISK_TTL_DAYS = int(os.getenv("EMBEDDING_DISK_TTL_DAYS", 30))
+EMBEDDING_DISK_MAX_ROWS = int(os.getenv("EMBEDDING_DISK_MAX_ROWS", 100_000))
+WARMUP_QUESTIONS = int(os.getenv("EMBEDDING_WARMUP_QUESTIONS", 200))
+WARMUP_BATCH_SIZE = 100
+# Préfixe des clés : changé quand des vecteurs en cache sont invalides
+# (q2 : le préchauffage stockait des embeddings de passages, cf. `embed_queries`)
+KEY_VERSION = "q2"
+
+
+def _model_key(embeddings) -> str:
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+
+class _DiskStore:
+    """Embeddings persistés (float32) indexés par modèle et empreinte du texte normalisé"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_query_embeddings_used ON query_embeddings(last_used)")
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_many(self, model, text_hashes):
+        if not text_hashes:
+            return {}
+        with self._conn() as conn:
+            rows = conn.execute(
+                f"SELECT text_hash, vector FROM query_embeddings WHERE model = ? "
+                f"AND text_hash IN ({','.join('?' * len(text_hashes))})",
+                [model] + list(text_hashes)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE query_embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(time.time(), model, h) for h, _ in rows]
+            )
+        return {h: np.frombuffer(vector, dtype=np.float32).tolist() for h, vector in rows}
+
+    def put_many(self, model, items):
+        """items : liste de (text_hash, vecteur)"""
+        now = time.time()
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)",
+                [(model, h, np.asarray(v, dtype=np.float32).tobytes(), now) for h, v in items]
+            )
+
+    def gc(self, max_age_days=EMBEDDING_DISK_TTL_DAYS, max_rows=EMBEDDING_DISK_MAX_ROWS) -> int:
+        """Purge les entrées inutilisées depuis `max_age_days` puis les plus anciennes au-delà de `max_rows`"""
+        cutoff = time.time() - max_age_days * 86400
+        with self._conn() as conn:
+            deleted = conn.execute("DELETE FROM query_embeddings WHERE last_used < ?", (cutoff,)).rowcount
+            deleted += conn.execute("""
+                DELETE FROM query_embeddings WHERE rowid IN (
+                    SELECT rowid FROM query_embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (max_rows,)).rowcount
+        return deleted
+
+
+class QueryEmbeddingCache:
+    """Enveloppe `embed_query` d'un modèle d'embeddings avec un LRU mémoire et un store disque"""
+
+    def __init__(self, embeddings, max_entries=EMBEDDING_CACHE_SIZE, disk_path=EMBEDDING_DISK_CACHE):
+        self.embeddings = embeddings
+        self.model = _model_key(embeddings)
+        self.max_entries = max_entries
+        self.disk = _DiskStore(disk_path) if disk_path else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(text) -> str:
+        return hashlib.sha256(f"{KEY_VERSION}:{normalize_text(text)}".encode()).hexdigest()
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def embed_query(self, text):
+        key = self._key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return vector
+
+        if self.disk is not None:
+            vector = self.disk.get_many(self.model, [key]).get(key)
+            if vector is not None:
+                with self._lock:
+                    self.hits_disk += 1
+                self._remember(key, vector)
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self._remember(key, vector)
+        if self.disk is not None:
+            self.disk.put_many(self.model, [(key, vector)])
+        return vector
+
+    def warm_up(self, questions) -> int:
+        """Charge en cache les questions données ; n'embedde (par lots) que les absentes du disque"""
+        pending = {}
+        for question in questions:
+            key = self._key(question)
+            with self._lock:
+                if key in self._memory:
+                    continue
+            pending.setdefault(key, question)
+
+        if self.disk is not None and pending:
+            for key, vector in self.disk.get_many(self.model, list(pending)).items():
+                self._remember(key, vector)
+                pending.pop(key)
+
+        items = list(pending.items())
+        for i in range(0, len(items), WARMUP_BATCH_SIZE):
+            batch = items[i:i + WARMUP_BATCH_SIZE]
+            vectors = embed_queries(self.embeddings, [question for _, question in batch])
+            for (key, _), vector in zip(batch, vectors):
+                self._remember(key, vector)
+            if self.disk is not None:
+                self.disk.put_many(self.model, [(key, vector) for (key, _), vector in zip(batch, vectors)])
+        return len(items)
+
+    def warm_up_from_history(self, limit=WARMUP_QUESTIONS) -> int:
+        return self.warm_up(question for question, _ in get_frequent_questions(limit))
+
+    def gc(self) -> int:
+        return self.disk.gc() if self.disk is not None else 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "model": self.model,
+                "entries": len(self._memory),
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0,
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_query_embedding_cache(embeddings) -> QueryEmbeddingCache:
+    """
+    Cache partagé du processus pour ce modèle d'embeddings.
+    À la première création, enregistre le préchauffage (par processus) et le GC du store disque.
+    """
+    model = _model_key(embeddings)
+    with _caches_lock:
+        if model in _caches:
+            return _caches[model]
+        cache = _caches[model] = QueryEmbeddingCache(embeddings)
+
+    scheduler.register(f"embedding_warmup:{model}", cache.warm_up_from_history, interval=6 * 3600,
+                       leader_only=False, run_at_start=True)
+    if cache.disk is not None:
+        scheduler.register("embedding_cache_gc", cache.gc, interval=24 * 3600)
+    scheduler.start()
+    return cache
@@ -0,0 +1,253 @@
+"""
+Ordonnanceur des appels d'embedding à l'indexation.
+
+- Les textes sont regroupés en lots selon leur nombre de tokens (et non un
+  nombre fixe de documents), dans les limites d'une requête de l'API.
+- Plusieurs lots partent en parallèle, sous un plafond de tokens par minute
+  (seau à jetons) et de requêtes simultanées.
+- Sur un 429, le lot est rejoué après un délai exponentiel avec jitter (ou le
+  Retry-After de l'API) ; le débit autorisé est ramené sous le débit mesuré et
+  la concurrence divisée par deux, puis remontent progressivement.
+- Chaque appel produit un rapport de débit (`last_report`, par thread).
+
+L'ordonnanceur expose `embed_documents` / `embed_query` / `model` : il se
+substitue à l'objet d'embeddings là où l'indexation en attend un.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from tokens import count_tokens
+
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", 20_000))
+# Plafond d'entrées par requête de l'API OpenAI
+EMBED_BATCH_ITEMS = int(os.getenv("EMBED_BATCH_ITEMS", 2048))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", 4))
+EMBED_TPM_LIMIT = int(os.getenv("EMBED_TPM_LIMIT", 1_000_000))
+EMBED_MAX_RETRIES = 8
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+MIN_TPM = 10_000
+
+
+@dataclass
+class EmbeddingReport:
+    """Débit d'un appel à `embed_documents`"""
+
+    texts: int = 0
+    tokens: int = 0
+    batches: int = 0
+    rate_limited: int = 0
+    duration: float = 0.0
+    max_concurrency: int = 1
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.duration if self.duration else 0
+
+    @property
+    def texts_per_second(self) -> float:
+        return self.texts / self.duration if self.duration else 0
+
+    def __str__(self):
+        limited = f", {self.rate_limited} limitation(s) 429" if self.rate_limited else ""
+        return (f"{self.texts} textes, {self.tokens} tokens en {self.duration:.1f} s "
+                f"({self.tokens_per_second:.0f} tokens/s, {self.batches} lots, "
+                f"jusqu'à {self.max_concurrency} en parallèle{limited})")
+
+
+def is_rate_limit_error(error) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _TokenBucket:
+    """Seau à jetons en tokens par minute, dont le débit peut être ajusté"""
+
+    def __init__(self, tokens_per_minute):
+        self.rate = tokens_per_minute
+        self.available = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.rate, self.available + (now - self._updated) * self.rate / 60)
+        self._updated = now
+
+    def acquire(self, tokens):
+        while True:
+            with self._lock:
+                self._refill()
+                # Un lot plus gros que le seau passe dès que le seau est plein
+                if self.available >= min(tokens, self.rate):
+                    self.available -= tokens
+                    return
+                wait = (min(tokens, self.rate) - self.available) * 60 / self.rate
+            time.sleep(min(wait, 1.0))
+
+
+class EmbeddingScheduler:
+    """Embeddings par lots de tokens, concurrents et tolérants aux limitations de débit"""
+
+    def __init__(self, embeddings, batch_tokens=EMBED_BATCH_TOKENS, batch_items=EMBED_BATCH_ITEMS,
+                 max_concurrency=EMBED_MAX_CONCURRENCY, tpm_limit=EMBED_TPM_LIMIT):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.batch_tokens = batch_tokens
+        self.batch_items = batch_items
+        self.max_concurrency = max_concurrency
+        self.tpm_limit = tpm_limit
+        self.bucket = _TokenBucket(tpm_limit)
+        self._concurrency = max_concurrency
+        self._active = 0
+        self._slots = threading.Condition()
+        self._done = deque()
+        self._successes = 0
+        self._local = threading.local()
+
+    @property
+    def last_report(self):
+        """Rapport du dernier `embed_documents` du thread courant (session Streamlit)"""
+        return getattr(self._local, "report", None)
+
+    # ===== CONCURRENCE ADAPTATIVE =====
+
+    def _acquire_slot(self):
+        with self._slots:
+            self._slots.wait_for(lambda: self._active < self._concurrency)
+            self._active += 1
+
+    def _release_slot(self):
+        with self._slots:
+            self._active -= 1
+            self._slots.notify_all()
+
+    def _measured_tpm(self):
+        cutoff = time.monotonic() - 60
+        while self._done and self._done[0][0] < cutoff:
+            self._done.popleft()
+        return sum(tokens for _, tokens in self._done)
+
+    def _on_success(self, tokens):
+        with self._slots:
+            self._done.append((time.monotonic(), tokens))
+            self._successes += 1
+            # Remontée additive : +1 requête simultanée et +10 % de débit tous les 5 succès
+            if self._successes % 5 == 0:
+                self._concurrency = min(self.max_concurrency, self._concurrency + 1)
+                self.bucket.rate = min(self.tpm_limit, self.bucket.rate * 1.1)
+                self._slots.notify_all()
+
+    def _on_rate_limited(self, report):
+        with self._slots:
+            report.rate_limited += 1
+            self._concurrency = max(1, self._concurrency // 2)
+            measured = self._measured_tpm()
+            target = measured * 0.8 if measured else self.bucket.rate / 2
+            self.bucket.rate = max(MIN_TPM, min(self.bucket.rate, target))
+            self._successes = 0
+
+    # ===== LOTS =====
+
+    def pack(self, texts):
+        """Lots d'indices (et leur nombre de tokens) d'au plus `batch_tokens` / `batch_items`"""
+        batches, current, current_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            tokens = count_tokens(text)
+            if current and (current_tokens + tokens > self.batch_tokens or len(current) >= self.batch_items):
+                batches.append((current, current_tokens))
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append((current, current_tokens))
+        return batches
+
+    def _run_batch(self, texts, tokens, report):
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            self.bucket.acquire(tokens)
+            self._acquire_slot()
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == EMBED_MAX_RETRIES:
+                    raise
+                error = e
+            else:
+                self._on_success(tokens)
+                return vectors
+            finally:
+                self._release_slot()
+
+            self._on_rate_limited(report)
+            # Full jitter : évite que les lots limités repartent tous en même temps
+            delay = _retry_after(error) or random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            time.sleep(delay)
+
+    def embed_documents(self, texts, progress=None):
+        """
+        Embeddings de `texts`, dans l'ordre.
+        `progress(textes faits, total)` est appelé à la fin de chaque lot.
+        """
+        texts = list(texts)
+        report = EmbeddingReport(texts=len(texts), max_concurrency=self._concurrency)
+        start = time.perf_counter()
+        vectors = [None] * len(texts)
+        batches = self.pack(texts)
+        report.batches = len(batches)
+        report.tokens = sum(tokens for _, tokens in batches)
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embed") as executor:
+            futures = {executor.submit(self._run_batch, [texts[i] for i in indices], tokens, report): indices
+                       for indices, tokens in batches}
+            for future in futures:
+                indices = futures[future]
+                for i, vector in zip(indices, future.result()):
+                    vectors[i] = vector
+                done += len(indices)
+                report.max_concurrency = max(report.max_concurrency, self._concurrency)
+                if progress:
+                    progress(done, len(texts))
+
+        report.duration = time.perf_counter() - start
+        self._local.report = report
+        return vectors
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_embedding_scheduler(embeddings) -> EmbeddingScheduler:
+    """
+    Ordonnanceur partagé du processus pour cet objet d'embeddings : le débit
+    mesuré et la concurrence sont communs à tous les téléversements en cours.
+    Un modèle local n'a pas de limite de débit et parallélise déjà en interne.
+    """
+    key = id(embeddings)
+    with _schedulers_lock:
+        if key not in _schedulers:
+            if not getattr(embeddings, "rate_limited", True):
+                _schedulers[key] = EmbeddingScheduler(embeddings, batch_tokens=10 ** 9, max_concurrency=1,
+                                                      tpm_limit=10 ** 12)
+            else:
+                _schedulers[key] = EmbeddingScheduler(embeddings)
+        return _schedulers[key]
@@ -0,0 +1,213 @@
+"""
+Backends d'embeddings, choisis par collection.
+
+- `openai` : `OpenAIEmbeddings` (comportement historique) ;
+- `local` : encodeur de phrases quantifié exécuté sur CPU avec ONNX Runtime,
+  sans appel réseau une fois le modèle en cache disque. Les textes sont
+  triés par longueur puis encodés par lots (une multiplication matricielle
+  par lot, padding minimal) ; le nombre de threads est réglable.
+
+Le backend de chaque collection est enregistré dans
+`./collections/embedding_backends.json` ; une collection vide sans entrée
+adopte EMBEDDING_BACKEND, une collection existante reste sur OpenAI. Une collection ne peut pas mélanger des vecteurs de deux modèles : changer
+de backend passe par `databases/reembed_collection.py`.
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from src import CONFIG
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+EMBEDDING_LOCAL_MODEL = os.getenv("EMBEDDING_LOCAL_MODEL", "multilingual-e5-small")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", os.cpu_count() or 4))
+EMBEDDING_LOCAL_BATCH = int(os.getenv("EMBEDDING_LOCAL_BATCH", 32))
+EMBEDDING_MODEL_CACHE = os.getenv("EMBEDDING_MODEL_CACHE", "./models")
+REGISTRY_FILE = os.path.join("./collections", "embedding_backends.json")
+
+# Encodeurs multilingues (français) disponibles en ONNX quantifié int8
+LOCAL_MODELS = {
+    "multilingual-e5-small": {
+        "repo": "Xenova/multilingual-e5-small",
+        "file": "onnx/model_quantized.onnx",
+        "query_prefix": "query: ",
+        "document_prefix": "passage: ",
+        "pad_token": "<pad>",
+        "max_length": 512,
+    },
+    "paraphrase-multilingual-MiniLM-L12-v2": {
+        "repo": "Xenova/paraphrase-multilingual-MiniLM-L12-v2",
+        "file": "onnx/model_quantized.onnx",
+        "query_prefix": "",
+        "document_prefix": "",
+        "pad_token": "<pad>",
+        "max_length": 128,
+    },
+}
+
+
+class LocalEmbeddings(Embeddings):
+    """Encodeur ONNX local (mean pooling + normalisation L2), chargé au premier appel"""
+
+    # Pas de quota : l'ordonnanceur d'embeddings n'applique ni plafond de débit ni concurrence
+    rate_limited = False
+
+    def __init__(self, model_name=EMBEDDING_LOCAL_MODEL, threads=EMBEDDING_THREADS,
+                 batch_size=EMBEDDING_LOCAL_BATCH, cache_dir=EMBEDDING_MODEL_CACHE):
+        if model_name not in LOCAL_MODELS:
+            raise ValueError(f"Modèle local inconnu : {model_name} (disponibles : {', '.join(LOCAL_MODELS)})")
+        self.model_name = model_name
+        self.model = f"local:{model_name}"
+        self.spec = LOCAL_MODELS[model_name]
+        self.threads = threads
+        self.batch_size = batch_size
+        self.cache_dir = cache_dir
+        self._session = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._session is not None:
+                return
+            import onnxruntime as ort
+            from huggingface_hub import snapshot_download
+            from tokenizers import Tokenizer
+
+            # Téléchargé une fois dans le cache ; ensuite utilisable hors ligne (HF_HUB_OFFLINE=1)
+            path = snapshot_download(self.spec["repo"], cache_dir=self.cache_dir,
+                                     allow_patterns=[self.spec["file"], "tokenizer.json", "config.json"])
+
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = ort.InferenceSession(os.path.join(path, self.spec["file"]), options,
+                                           providers=["CPUExecutionProvider"])
+
+            tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+            tokenizer.enable_truncation(max_length=self.spec["max_length"])
+            pad_token = self.spec["pad_token"]
+            tokenizer.enable_padding(pad_id=tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+
+            self._input_names = {i.name for i in session.get_inputs()}
+            self._tokenizer = tokenizer
+            self._session = session
+
+    def _encode_batch(self, texts):
+        encodings = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden = self._session.run(None, inputs)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-9, None)
+
+    def _embed(self, texts):
+        if not texts:
+            return []
+        self._load()
+        # Tri par longueur : les textes d'un lot ont des tailles proches, donc peu de padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._encode_batch([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_documents(self, texts):
+        return self._embed([self.spec["document_prefix"] + t for t in texts])
+
+    def embed_query(self, text):
+        return self._embed([self.spec["query_prefix"] + text])[0]
+
+    def embed_queries(self, texts):
+        """Plusieurs requêtes en un passage (préfixe de requête, pas de document)"""
+        return self._embed([self.spec["query_prefix"] + t for t in texts])
+
+
+def embed_queries(embeddings, texts):
+    """
+    Embeddings de questions par lot, équivalents à `embed_query` : les modèles
+    e5 distinguent requêtes (« query: ») et passages (« passage: »), donc
+    `embed_documents` ne convient pas pour des questions.
+    """
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    if isinstance(embeddings, OpenAIEmbeddings):
+        # Modèle symétrique : un seul appel groupé
+        return embeddings.embed_documents(texts)
+    return [embeddings.embed_query(t) for t in texts]
+
+
+# ===== SÉLECTION PAR COLLECTION =====
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_embeddings(backend=EMBEDDING_BACKEND, model=None):
+    """Instance partagée du processus pour ce backend et ce modèle"""
+    key = (backend, model)
+    with _instances_lock:
+        if key not in _instances:
+            if backend == "local":
+                _instances[key] = LocalEmbeddings(model or EMBEDDING_LOCAL_MODEL)
+            elif backend == "openai":
+                kwargs = {"model": model} if model else {}
+                _instances[key] = OpenAIEmbeddings(api_key=CONFIG["OPENAI_API_KEY"], **kwargs)
+            else:
+                raise ValueError(f"Backend d'embeddings inconnu : {backend}")
+        return _instances[key]
+
+
+def _read_registry():
+    try:
+        with open(REGISTRY_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def collection_backend(collection_name) -> dict:
+    """{"backend", "model"} enregistré pour la collection, None si aucun"""
+    return _read_registry().get(collection_name)
+
+
+def set_collection_backend(collection_name, backend, model=None):
+    registry = _read_registry()
+    registry[collection_name] = {"backend": backend, "model": model}
+    os.makedirs(os.path.dirname(REGISTRY_FILE), exist_ok=True)
+    tmp_path = f"{REGISTRY_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(registry, f, indent=2)
+    os.replace(tmp_path, REGISTRY_FILE)
+
+
+def bind_collection_embeddings(vector_store):
+    """
+    Applique au vector store le backend enregistré pour sa collection.
+    Une collection vide sans entrée adopte EMBEDDING_BACKEND ; une collection déjà
+    remplie sans entrée garde l'embedding configuré par `src.vectorstore` (OpenAI).
+    """
+    name = vector_store._collection.name
+    config = collection_backend(name)
+    if config is None:
+        if EMBEDDING_BACKEND == "openai" or vector_store._collection.count() > 0:
+            return vector_store
+        config = {"backend": EMBEDDING_BACKEND, "model": EMBEDDING_LOCAL_MODEL}
+        set_collection_backend(name, **config)
+
+    if config["backend"] != "openai" or config.get("model"):
+        vector_store._embedding_function = get_embeddings(config["backend"], config.get("model"))
+    return vector_store
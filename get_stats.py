@@ -2,9 +2,11 @@ import sqlite3
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(".")
 from src.vectorstore import get_vector_store
+from dashboard_snapshot import build_snapshot
 
 DB_PATH = "users.db"
 
@@ -150,21 +152,43 @@ def get_total_users():
     return result['count']
 
 
+def _scan_documents():
+    """Parcourt le vector store : nombre de documents et répartition par type"""
+    vector_store = get_vector_store()
+    results = vector_store.get(include=["metadatas"])
+    metadatas = results["metadatas"]
+
+    # Compter les types de documents uniques
+    doc_types = {}
+    seen_docs = set()
+
+    for meta in metadatas:
+        doc_id = meta.get("doc_id")
+        filename = meta.get("filename", "")
+
+        # Éviter de compter plusieurs fois le même document
+        if doc_id and doc_id not in seen_docs:
+            seen_docs.add(doc_id)
+
+            # Déterminer le type
+            if filename.endswith('.pdf'):
+                doc_type = 'PDF'
+            elif filename.endswith(('.xlsx', '.xls')):
+                doc_type = 'Excel'
+            elif filename.endswith('.csv'):
+                doc_type = 'CSV'
+            else:
+                doc_type = 'Autre'
+
+            doc_types[doc_type] = doc_types.get(doc_type, 0) + 1
+
+    return {"total": len(seen_docs), "by_type": doc_types}
+
+
 def get_total_documents():
     """Nombre total de documents chargés"""
     try:
-        vector_store = get_vector_store()
-        results = vector_store.get(include=["metadatas"])
-        metadatas = results["metadatas"]
-
-        # Compter les documents uniques par doc_id
-        unique_doc_ids = set()
-        for meta in metadatas:
-            doc_id = meta.get("doc_id")
-            if doc_id:
-                unique_doc_ids.add(doc_id)
-
-        return len(unique_doc_ids)
+        return _scan_documents()["total"]
     except:
         return 0
 
@@ -172,35 +196,7 @@ def get_total_documents():
 def get_documents_by_type():
     """Statistiques des documents par type"""
     try:
-        vector_store = get_vector_store()
-        results = vector_store.get(include=["metadatas"])
-        metadatas = results["metadatas"]
-
-        # Compter les types de documents uniques
-        doc_types = {}
-        seen_docs = set()
-
-        for meta in metadatas:
-            doc_id = meta.get("doc_id")
-            filename = meta.get("filename", "")
-
-            # Éviter de compter plusieurs fois le même document
-            if doc_id and doc_id not in seen_docs:
-                seen_docs.add(doc_id)
-
-                # Déterminer le type
-                if filename.endswith('.pdf'):
-                    doc_type = 'PDF'
-                elif filename.endswith(('.xlsx', '.xls')):
-                    doc_type = 'Excel'
-                elif filename.endswith('.csv'):
-                    doc_type = 'CSV'
-                else:
-                    doc_type = 'Autre'
-
-                doc_types[doc_type] = doc_types.get(doc_type, 0) + 1
-
-        return doc_types
+        return _scan_documents()["by_type"]
     except:
         return {}
 
@@ -321,3 +317,92 @@ def get_user_types():
         """).fetchall()
 
     return {row['role']: row['count'] for row in rows}
+
+
+# ===== INSTANTANÉ DU TABLEAU DE BORD =====
+
+DASHBOARD_SQL = """
+    WITH
+    conv AS (
+        SELECT matricule, conv_name, role, timestamp FROM conversations
+    ),
+    per_user AS (
+        SELECT 
+            matricule,
+            COUNT(CASE WHEN role = 'user' THEN 1 END) as total_questions,
+            COUNT(CASE WHEN role = 'assistant' THEN 1 END) as total_responses,
+            COUNT(DISTINCT conv_name) as total_conversations,
+            MIN(timestamp) as first_activity,
+            MAX(timestamp) as last_activity
+        FROM conv
+        GROUP BY matricule
+    ),
+    feedback_per_user AS (
+        SELECT 
+            matricule,
+            COUNT(CASE WHEN feedback_type = 'positive' THEN 1 END) as positive_feedbacks,
+            COUNT(CASE WHEN feedback_type = 'negative' THEN 1 END) as negative_feedbacks
+        FROM message_feedback
+        GROUP BY matricule
+    ),
+    by_day AS (
+        SELECT 
+            DATE(timestamp) as date,
+            COUNT(DISTINCT conv_name || '_' || matricule) as conv_count,
+            strftime('%w', DATE(timestamp)) as day_num
+        FROM conv
+        WHERE timestamp >= date('now', :window)
+        GROUP BY DATE(timestamp)
+        ORDER BY date ASC
+    ),
+    by_weekday AS (
+        SELECT 
+            strftime('%w', DATE(timestamp)) as day_num,
+            CAST(COUNT(DISTINCT DATE(timestamp) || '_' || conv_name || '_' || matricule) AS FLOAT) / 
+            COUNT(DISTINCT DATE(timestamp)) as avg_convs
+        FROM conv
+        GROUP BY strftime('%w', DATE(timestamp))
+        ORDER BY day_num
+    )
+    SELECT
+        (SELECT COUNT(*) FROM users) as total_users,
+        (SELECT COUNT(DISTINCT matricule) FROM user_sessions WHERE is_active = 1) as users_connected_now,
+        (SELECT COUNT(DISTINCT conv_name || '_' || matricule) FROM conv) as total_conversations,
+        (SELECT json_group_object(feedback_type, count) FROM (
+            SELECT feedback_type, COUNT(*) as count FROM message_feedback GROUP BY feedback_type
+        )) as feedback,
+        (SELECT json_group_object(role, count) FROM (
+            SELECT role, COUNT(*) as count FROM users GROUP BY role
+        )) as user_types,
+        (SELECT json_group_array(json_object(
+            'matricule', p.matricule,
+            'total_questions', p.total_questions,
+            'total_responses', p.total_responses,
+            'total_conversations', p.total_conversations,
+            'first_activity', p.first_activity,
+            'last_activity', p.last_activity,
+            'positive_feedbacks', COALESCE(f.positive_feedbacks, 0),
+            'negative_feedbacks', COALESCE(f.negative_feedbacks, 0)
+        )) FROM per_user p LEFT JOIN feedback_per_user f ON f.matricule = p.matricule) as user_stats,
+        (SELECT json_group_array(json_array(date, conv_count, day_num)) FROM by_day) as conversations_by_day,
+        (SELECT json_group_array(json_array(day_num, avg_convs)) FROM by_weekday) as conversations_by_weekday
+"""
+
+
+def get_dashboard_snapshot(window=30):
+    """
+    Toutes les métriques du tableau de bord en une requête CTE ;
+    le scan du vector store (documents) tourne en parallèle
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        documents = executor.submit(_scan_documents)
+
+        with get_conn() as conn:
+            row = conn.execute(DASHBOARD_SQL, {"window": f"-{int(window)} days"}).fetchone()
+
+        try:
+            documents = documents.result()
+        except Exception:
+            documents = None
+
+    return build_snapshot(row, window, documents)
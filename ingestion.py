@@ -0,0 +1,183 @@
+"""
+Fonctions d'indexation partagées par les pages de gestion documentaire :
+empreintes de chunks, ajout par lots et mise à jour incrémentale d'un document.
+
+Toute écriture dans la collection incrémente sa version (fichier partagé entre
+processus), ce qui invalide les caches de recherche.
+"""
+
+import fcntl
+import hashlib
+import os
+from datetime import datetime
+from uuid import uuid4
+
+from embedding_scheduler import get_embedding_scheduler
+from sentence_index import sentence_index
+
+# Écritures dans Chroma par lots (les embeddings sont calculés en amont, cf. `embedding_scheduler`)
+ADD_BATCH_SIZE = 512
+VERSION_FILE = os.path.join("./collections", "collection_version")
+
+
+def normalize_text(text: str) -> str:
+    """Normalisation utilisée pour les empreintes (espaces et casse)"""
+    return " ".join(text.split()).lower()
+
+
+def chunk_hash(text: str) -> str:
+    """Empreinte d'un chunk, insensible aux variations d'espacement"""
+    return hashlib.sha256(normalize_text(text).encode()).hexdigest()
+
+
+def content_hash(text: str) -> str:
+    """Empreinte du texte exact (casse et espacement compris)"""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def collection_version() -> int:
+    """Version courante de la collection (0 si jamais modifiée)"""
+    try:
+        with open(VERSION_FILE) as f:
+            return int(f.read() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_collection_version() -> int:
+    """Incrémente la version de la collection (verrou exclusif entre processus)"""
+    os.makedirs(os.path.dirname(VERSION_FILE), exist_ok=True)
+    with open(VERSION_FILE, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            version = int(f.read() or 0) + 1
+        except ValueError:
+            version = 1
+        f.seek(0)
+        f.truncate()
+        f.write(str(version))
+    return version
+
+
+def add_chunks(vector_store, docs, batch_size=ADD_BATCH_SIZE, progress=None):
+    """
+    Ajoute des chunks au vector store ; retourne les ids créés.
+    Tous les embeddings sont calculés avant la première écriture (lots par tokens,
+    en parallèle, reprise sur 429) : un échec n'ajoute pas un document à moitié.
+    `progress(chunks embeddés, total)` suit l'avancement.
+    """
+    if not docs:
+        return []
+    scheduler = get_embedding_scheduler(vector_store.embeddings)
+    texts = [d.page_content for d in docs]
+    vectors = scheduler.embed_documents(texts, progress)
+
+    ids = [str(uuid4()) for _ in docs]
+    for i in range(0, len(docs), batch_size):
+        vector_store._collection.add(
+            ids=ids[i:i + batch_size],
+            embeddings=vectors[i:i + batch_size],
+            documents=texts[i:i + batch_size],
+            metadatas=[d.metadata for d in docs[i:i + batch_size]]
+        )
+    bump_collection_version()
+    index_sentences(vector_store, docs)
+    return ids
+
+
+def last_embedding_report(vector_store):
+    """Rapport de débit du dernier `add_chunks` de la session courante (cf. `EmbeddingReport`)"""
+    return get_embedding_scheduler(vector_store.embeddings).last_report
+
+
+def index_sentences(vector_store, docs):
+    """Précalcule les vecteurs de phrases des chunks (cf. `sentence_index`) pour la compression de contexte"""
+    if sentence_index is None:
+        return
+    try:
+        sentence_index.index(get_embedding_scheduler(vector_store.embeddings), [
+            (d.metadata.get("chunk_hash") or chunk_hash(d.page_content), d.page_content) for d in docs
+        ])
+    except Exception as e:
+        # Non bloquant : les chunks manquants sont indexés à leur première utilisation
+        print(f"⚠️ Indexation des phrases ignorée : {e}")
+
+
+def delete_chunks(vector_store, ids):
+    """Supprime des chunks du vector store"""
+    if ids:
+        vector_store.delete(ids=ids)
+        bump_collection_version()
+
+
+def prepare_chunks(docs, metadata, version=1):
+    """Ajoute les métadonnées du document, l'empreinte et la position de chaque chunk"""
+    for idx, d in enumerate(docs):
+        d.metadata.update(metadata)
+        d.metadata.update({
+            "chunk_hash": chunk_hash(d.page_content),
+            "chunk_index": idx,
+            "version": version
+        })
+    return docs
+
+
+def get_document_chunks(vector_store, doc_id):
+    """Retourne (ids, metadatas, textes) des chunks d'un document"""
+    results = vector_store.get(where={"doc_id": doc_id}, include=["metadatas", "documents"])
+    return results["ids"], results["metadatas"], results["documents"]
+
+
+def update_document(vector_store, doc_id, docs, metadata):
+    """
+    Met à jour un document existant en ne ré-indexant que les chunks modifiés.
+
+    Les chunks de la nouvelle version sont comparés aux chunks stockés sur leur
+    texte exact : les chunks identiques sont conservés (sans ré-embedding),
+    seuls les nouveaux sont embeddés, et les disparus ne sont supprimés
+    qu'une fois les nouveaux ajoutés (un échec d'embedding laisse l'ancienne
+    version intacte).
+    Retourne un rapport {"version", "kept", "added", "removed"}.
+    """
+    ids, metadatas, texts = get_document_chunks(vector_store, doc_id)
+
+    # Chunks stockés, regroupés par texte exact (les doublons sont gérés en multiset).
+    # `chunk_hash` ignore casse et espacement : une correction de ce type doit être appliquée.
+    stored = {}
+    version = 0
+    for chunk_id, meta, text in zip(ids, metadatas, texts):
+        stored.setdefault(content_hash(text), []).append(chunk_id)
+        version = max(version, int(meta.get("version", 1)))
+    new_version = version + 1
+
+    metadata = dict(metadata, doc_id=doc_id, date_updated=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    docs = prepare_chunks(docs, metadata, version=new_version)
+
+    kept_ids, kept_metadatas, to_add = [], [], []
+    for d in docs:
+        h = content_hash(d.page_content)
+        if stored.get(h):
+            kept_ids.append(stored[h].pop())
+            kept_metadatas.append(d.metadata)
+        else:
+            to_add.append(d)
+
+    removed_ids = [chunk_id for remaining in stored.values() for chunk_id in remaining]
+
+    if to_add:
+        add_chunks(vector_store, to_add)
+    if kept_ids:
+        # Mise à jour des métadonnées seules (version, position) : pas de ré-embedding
+        vector_store._collection.update(ids=kept_ids, metadatas=kept_metadatas)
+        bump_collection_version()
+    if removed_ids:
+        delete_chunks(vector_store, removed_ids)
+
+    return {
+        "version": new_version,
+        "kept": len(kept_ids),
+        "added": len(to_add),
+        "removed": len(removed_ids),
+        "chunks": len(docs)
+    }
@@ -0,0 +1,560 @@
+"""
+File persistante des travaux d'indexation.
+
+Les pages ne font plus que déposer le fichier et créer un travail ; un worker
+(thread du processus Streamlit ou processus dédié, cf. `python -m ingestion_jobs`)
+le réclame puis enchaîne les étapes :
+
+    queued → parsing → ocr (PDF scanné) → embedding → indexed | failed
+
+Le résultat de chaque étape est écrit dans le répertoire du travail (pages
+extraites, puis chunks) et l'étape terminée est enregistrée (`stage_done`) :
+une reprise, après une erreur ou un worker interrompu, repart de la dernière
+étape terminée sans refaire l'OCR. Les chunks d'une tentative précédente
+interrompue sont repérés par leur métadonnée `ingest_job` et retirés avant
+l'écriture : un document n'est jamais indexé deux fois ni à moitié.
+
+La file vit dans SQLite (`./collections/ingestion_jobs.db`) ou, avec
+INGESTION_QUEUE=postgres, dans la base PostgreSQL de l'application.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from langchain_core.documents import Document
+
+INGESTION_QUEUE = os.getenv("INGESTION_QUEUE", "sqlite")
+INGESTION_QUEUE_DB = os.getenv("INGESTION_QUEUE_DB", os.path.join("./collections", "ingestion_jobs.db"))
+UPLOAD_DIR = os.getenv("INGESTION_UPLOAD_DIR", os.path.join("./collections", "uploads"))
+# Workers lancés dans chaque processus Streamlit (0 si des workers dédiés tournent)
+INGESTION_INPROCESS_WORKERS = int(os.getenv("INGESTION_INPROCESS_WORKERS", 1))
+INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", 3))
+POLL_INTERVAL = 2
+HEARTBEAT_INTERVAL = 30
+# Délai avant une nouvelle tentative automatique, doublé à chaque échec
+RETRY_DELAY = int(os.getenv("INGESTION_RETRY_DELAY", 60))
+# Un travail en cours sans signe de vie depuis ce délai est considéré comme abandonné
+STALE_AFTER = 10 * 60
+MAINTENANCE_INTERVAL = 60
+# Les travaux terminés sont conservés ce nombre de jours pour l'affichage
+JOB_RETENTION_DAYS = 30
+
+ACTIVE_STATES = ("queued", "parsing", "ocr", "embedding")
+RUNNING_STATES = ("parsing", "ocr", "embedding")
+STATE_LABELS = {
+    "queued": "⏳ En attente",
+    "parsing": "📄 Extraction",
+    "ocr": "🔍 OCR",
+    "embedding": "🧠 Indexation",
+    "indexed": "✅ Indexé",
+    "failed": "❌ Échec",
+}
+
+_COLUMNS = ("job_id", "filename", "file_hash", "department", "doc_id", "mode", "metadata", "state",
+            "stage_done", "attempts", "error", "report", "worker", "heartbeat", "created_at", "updated_at",
+            "not_before")
+
+
+class PermanentJobError(Exception):
+    """Erreur qu'une nouvelle tentative ne corrigerait pas (format, document vide) : échec immédiat"""
+
+
+# ===== BACKENDS DE PERSISTANCE =====
+
+class _SQLJobBackend:
+    """Base commune SQLite / PostgreSQL (seul le style de paramètre change)"""
+
+    placeholder = "?"
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def _sql(self, query: str) -> str:
+        return query.replace("?", self.placeholder)
+
+    def init_schema(self):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                    job_id VARCHAR(36) PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    file_hash VARCHAR(64),
+                    department VARCHAR(50),
+                    doc_id VARCHAR(36) NOT NULL,
+                    mode VARCHAR(10) NOT NULL,
+                    metadata TEXT NOT NULL,
+                    state VARCHAR(20) NOT NULL,
+                    stage_done VARCHAR(20),
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    report TEXT,
+                    worker VARCHAR(100),
+                    heartbeat TIMESTAMP,
+                    created_at TIMESTAMP NOT NULL,
+                    updated_at TIMESTAMP NOT NULL,
+                    not_before TIMESTAMP
+                )
+            """)
+            self._add_column(cursor, "not_before", "TIMESTAMP")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_state ON ingestion_jobs (state, created_at)")
+            cursor.close()
+
+    def _add_column(self, cursor, name, sql_type):
+        """Colonne ajoutée après la création de la table (files existantes)"""
+        raise NotImplementedError
+
+    def _rows(self, query, params=()):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self._sql(query), params)
+            rows = cursor.fetchall()
+            cursor.close()
+        return [dict(zip(_COLUMNS, tuple(row))) for row in rows]
+
+    def _execute(self, query, params=()) -> int:
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self._sql(query), params)
+            count = cursor.rowcount
+            cursor.close()
+        return count
+
+    def insert(self, job):
+        now = datetime.now()
+        self._execute(
+            f"INSERT INTO ingestion_jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+            tuple({**job, "created_at": now, "updated_at": now}.get(c) for c in _COLUMNS)
+        )
+
+    def get(self, job_id):
+        rows = self._rows(f"SELECT {', '.join(_COLUMNS)} FROM ingestion_jobs WHERE job_id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    def list_jobs(self, limit=50, department=None):
+        where, params = "", ()
+        if department:
+            where, params = "WHERE department = ?", (department,)
+        return self._rows(
+            f"SELECT {', '.join(_COLUMNS)} FROM ingestion_jobs {where} ORDER BY created_at DESC LIMIT {int(limit)}",
+            params
+        )
+
+    def find_active(self, file_hash):
+        """Travail en attente ou en cours pour ce contenu de fichier, sinon None"""
+        rows = self._rows(
+            f"SELECT {', '.join(_COLUMNS)} FROM ingestion_jobs "
+            f"WHERE file_hash = ? AND state IN ({', '.join('?' * len(ACTIVE_STATES))})",
+            (file_hash,) + ACTIVE_STATES
+        )
+        return rows[0] if rows else None
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = datetime.now()
+        self._execute(
+            f"UPDATE ingestion_jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE job_id = ?",
+            tuple(fields.values()) + (job_id,)
+        )
+
+    def claim(self, worker):
+        """
+        Réclame le plus ancien travail en attente. L'UPDATE conditionnel (state = 'queued')
+        garantit qu'un seul worker l'obtient, quel que soit le backend.
+        """
+        candidates = self._rows(
+            f"SELECT {', '.join(_COLUMNS)} FROM ingestion_jobs "
+            f"WHERE state = 'queued' AND (not_before IS NULL OR not_before <= ?) ORDER BY created_at LIMIT 5",
+            (datetime.now(),)
+        )
+        for job in candidates:
+            now = datetime.now()
+            state = "embedding" if job["stage_done"] == "chunked" else "parsing"
+            claimed = self._execute(
+                """UPDATE ingestion_jobs SET state = ?, worker = ?, heartbeat = ?, updated_at = ?,
+                                             attempts = attempts + 1
+                   WHERE job_id = ? AND state = 'queued'""",
+                (state, worker, now, now, job["job_id"])
+            )
+            if claimed == 1:
+                return dict(job, state=state, worker=worker, attempts=job["attempts"] + 1)
+        return None
+
+    def heartbeat(self, job_id, worker):
+        self._execute("UPDATE ingestion_jobs SET heartbeat = ? WHERE job_id = ? AND worker = ?",
+                      (datetime.now(), job_id, worker))
+
+    def requeue_stale(self, cutoff, max_attempts):
+        """Remet en file les travaux sans heartbeat depuis `cutoff` ; échec au-delà de `max_attempts`"""
+        running = ", ".join("?" * len(RUNNING_STATES))
+        now = datetime.now()
+        requeued = self._execute(
+            f"""UPDATE ingestion_jobs SET state = 'queued', worker = NULL, updated_at = ?
+                WHERE state IN ({running}) AND heartbeat < ? AND attempts < ?""",
+            (now,) + RUNNING_STATES + (cutoff, max_attempts)
+        )
+        failed = self._execute(
+            f"""UPDATE ingestion_jobs SET state = 'failed', worker = NULL, updated_at = ?,
+                                          error = 'Worker interrompu à chaque tentative'
+                WHERE state IN ({running}) AND heartbeat < ?""",
+            (now,) + RUNNING_STATES + (cutoff,)
+        )
+        return requeued, failed
+
+    def delete_finished(self, cutoff):
+        """Supprime les travaux terminés avant `cutoff` ; retourne leurs job_id"""
+        rows = self._rows(
+            f"SELECT {', '.join(_COLUMNS)} FROM ingestion_jobs WHERE state IN ('indexed', 'failed') AND updated_at < ?",
+            (cutoff,)
+        )
+        for job in rows:
+            self._execute("DELETE FROM ingestion_jobs WHERE job_id = ?", (job["job_id"],))
+        return [job["job_id"] for job in rows]
+
+
+class SQLiteJobBackend(_SQLJobBackend):
+    """File dans une base SQLite locale (workers d'une même machine)"""
+
+    def __init__(self, db_path=INGESTION_QUEUE_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+
+    def _add_column(self, cursor, name, sql_type):
+        if name not in [row[1] for row in cursor.execute("PRAGMA table_info(ingestion_jobs)")]:
+            cursor.execute(f"ALTER TABLE ingestion_jobs ADD COLUMN {name} {sql_type}")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, detect_types=sqlite3.PARSE_DECLTYPES)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class PostgresJobBackend(_SQLJobBackend):
+    """File dans PostgreSQL via le context manager de connexion existant"""
+
+    placeholder = "%s"
+
+    def __init__(self, get_connection):
+        self._get_connection = get_connection
+
+    def _connect(self):
+        return self._get_connection()
+
+    def _add_column(self, cursor, name, sql_type):
+        cursor.execute(f"ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS {name} {sql_type}")
+
+
+# ===== FILE =====
+
+def _dump_docs(path, docs):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump([{"page_content": d.page_content, "metadata": d.metadata} for d in docs], f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _load_docs(path):
+    with open(path, encoding="utf-8") as f:
+        return [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in json.load(f)]
+
+
+class IngestionQueue:
+    """Dépôt des fichiers et suivi des travaux d'indexation"""
+
+    def __init__(self, backend, upload_dir=UPLOAD_DIR):
+        self.backend = backend
+        self.upload_dir = upload_dir
+        self.backend.init_schema()
+
+    def job_dir(self, job_id) -> str:
+        return os.path.join(self.upload_dir, job_id)
+
+    def file_path(self, job) -> str:
+        return os.path.join(self.job_dir(job["job_id"]), os.path.basename(job["filename"]))
+
+    def enqueue(self, data, filename, metadata, department=None, doc_id=None, file_hash=None) -> str:
+        """
+        Dépose le contenu du fichier et crée un travail ; retourne son job_id.
+        Avec `doc_id`, le travail met à jour ce document (cf. `update_document`),
+        sinon il crée un nouveau document.
+        """
+        job_id = str(uuid4())
+        os.makedirs(self.job_dir(job_id), exist_ok=True)
+        job = {
+            "job_id": job_id,
+            "filename": filename,
+            "file_hash": file_hash,
+            "department": department,
+            "doc_id": doc_id or str(uuid4()),
+            "mode": "update" if doc_id else "new",
+            "metadata": json.dumps(metadata, ensure_ascii=False),
+            "state": "queued",
+            "attempts": 0,
+        }
+        with open(self.file_path(job), "wb") as f:
+            f.write(data)
+        self.backend.insert(job)
+        return job_id
+
+    def jobs(self, limit=50, department=None):
+        return self.backend.list_jobs(limit, department)
+
+    def find_active(self, file_hash):
+        return self.backend.find_active(file_hash) if file_hash else None
+
+    def retry(self, job_id) -> bool:
+        """Relance un travail en échec à partir de sa dernière étape terminée"""
+        job = self.backend.get(job_id)
+        if job is None or job["state"] != "failed" or not os.path.isdir(self.job_dir(job_id)):
+            return False
+        self.backend.update(job_id, state="queued", attempts=0, error=None, worker=None, not_before=None)
+        return True
+
+    def maintain(self):
+        """Reprise des travaux abandonnés et purge des anciens travaux terminés"""
+        self.backend.requeue_stale(datetime.now() - timedelta(seconds=STALE_AFTER), INGESTION_MAX_ATTEMPTS)
+        for job_id in self.backend.delete_finished(datetime.now() - timedelta(days=JOB_RETENTION_DAYS)):
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+
+def _default_backend():
+    if INGESTION_QUEUE == "postgres":
+        from inscription.auth import get_connection
+        return PostgresJobBackend(get_connection)
+    return SQLiteJobBackend()
+
+
+# File partagée du processus
+ingestion_queue = IngestionQueue(_default_backend())
+
+
+# ===== WORKER =====
+
+# Reconstruction de l'index de déduplication : un seul worker du processus
+_rebuild_lock = threading.Lock()
+
+class IngestionWorker:
+    """Exécute les travaux de la file, un à la fois"""
+
+    def __init__(self, queue=ingestion_queue, name=None):
+        self.queue = queue
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        self._vector_store = None
+        self._chunk_index = None
+
+    def _store(self):
+        if self._vector_store is None:
+            from dedup import ChunkIndex
+            from embeddings_backend import bind_collection_embeddings
+            from src.vectorstore import get_vector_store
+            self._vector_store = bind_collection_embeddings(get_vector_store())
+            self._chunk_index = ChunkIndex()
+            with _rebuild_lock:
+                # Chunks indexés avant l'index de déduplication (ou avant sa dernière évolution)
+                if self._chunk_index.needs_rebuild() and self._vector_store._collection.count():
+                    count = self._chunk_index.rebuild(self._vector_store)
+                    print(f"♻️ Index de déduplication reconstruit : {count} chunks")
+        return self._vector_store, self._chunk_index
+
+    @contextmanager
+    def _heartbeat(self, job_id):
+        """Signe de vie périodique pendant les étapes longues (OCR, embeddings)"""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(HEARTBEAT_INTERVAL):
+                try:
+                    self.queue.backend.heartbeat(job_id, self.name)
+                except Exception as e:
+                    print(f"⚠️ Heartbeat du travail {job_id} : {e}")
+
+        thread = threading.Thread(target=beat, name=f"heartbeat-{job_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+
+    def _set(self, job, **fields):
+        job.update(fields)
+        self.queue.backend.update(job["job_id"], **fields)
+
+    def _parse(self, job, pages_path):
+        from document_pipeline import SUPPORTED_EXTENSIONS, extension, extract_pages
+
+        self._set(job, state="parsing")
+        if extension(job["filename"]) not in SUPPORTED_EXTENSIONS:
+            raise PermanentJobError(f"Format non pris en charge : {job['filename']}")
+        with open(self.queue.file_path(job), "rb") as f:
+            data = f.read()
+        pages = extract_pages(data, job["filename"], job["file_hash"],
+                              on_ocr=lambda selected: self._set(job, state="ocr",
+                                                                report=f"OCR de {len(selected)} page(s)"))
+        _dump_docs(pages_path, pages)
+        self._set(job, stage_done="parsed")
+        return pages
+
+    def _chunk(self, job, pages, chunks_path):
+        from document_pipeline import split_pages
+        from ingestion import prepare_chunks
+
+        docs = split_pages(job["filename"], pages)
+        if not docs:
+            raise PermanentJobError("Aucun contenu extractible")
+        if job["mode"] == "new":
+            metadata = dict(json.loads(job["metadata"]), doc_id=job["doc_id"], ingest_job=job["job_id"])
+            prepare_chunks(docs, metadata)
+        _dump_docs(chunks_path, docs)
+        self._set(job, stage_done="chunked")
+        return docs
+
+    def _index(self, job, docs):
+        from dedup import deduplicate_chunks
+        from docstore import store_document_sections
+        from ingestion import add_chunks, delete_chunks, last_embedding_report, update_document
+
+        self._set(job, state="embedding")
+        vector_store, chunk_index = self._store()
+        doc_id, department = job["doc_id"], job["department"]
+        metadata = json.loads(job["metadata"])
+
+        if job["mode"] == "update":
+            # `update_document` compare les empreintes : une reprise ne ré-embedde que le manquant
+            store_document_sections(vector_store, doc_id, docs)
+            report = update_document(vector_store, doc_id, docs, metadata)
+            chunk_index.remove_document(doc_id)
+            chunk_index.add(docs, department)
+            return (f"Version {report['version']} : {report['added']} fragment(s) ajouté(s), "
+                    f"{report['removed']} supprimé(s), {report['kept']} conservé(s)")
+
+        # Reprise : chunks écrits par une tentative précédente interrompue
+        partial = vector_store.get(where={"ingest_job": job["job_id"]}, include=[])["ids"]
+        if partial:
+            delete_chunks(vector_store, partial)
+            chunk_index.remove_document(doc_id)
+
+        # Sections parentes enregistrées avant la déduplication (texte complet)
+        store_document_sections(vector_store, doc_id, docs)
+        docs, skipped = deduplicate_chunks(docs, chunk_index, department)
+        if not docs:
+            return f"Aucun fragment ajouté, {len(skipped)} doublon(s) ignoré(s)"
+
+        def progress(done, total):
+            self.queue.backend.update(job["job_id"], report=f"Embeddings : {done}/{total} fragments")
+
+        add_chunks(vector_store, docs, progress=progress)
+        chunk_index.add(docs, department)
+        return (f"{len(docs)} fragment(s) indexé(s), {len(skipped)} doublon(s) ignoré(s) — "
+                f"{last_embedding_report(vector_store)}")
+
+    def process(self, job):
+        """Enchaîne les étapes restantes du travail, à partir de `stage_done`"""
+        job_dir = self.queue.job_dir(job["job_id"])
+        pages_path = os.path.join(job_dir, "pages.json")
+        chunks_path = os.path.join(job_dir, "chunks.json")
+
+        with self._heartbeat(job["job_id"]):
+            try:
+                if job["stage_done"] == "chunked":
+                    docs = _load_docs(chunks_path)
+                else:
+                    pages = _load_docs(pages_path) if job["stage_done"] == "parsed" else self._parse(job, pages_path)
+                    docs = self._chunk(job, pages, chunks_path)
+                report = self._index(job, docs)
+            except Exception as e:
+                traceback.print_exc()
+                error = f"{type(e).__name__}: {e}"[:1000]
+                if isinstance(e, PermanentJobError) or job["attempts"] >= INGESTION_MAX_ATTEMPTS:
+                    self._set(job, state="failed", worker=None, error=error)
+                else:
+                    # Nouvelle tentative automatique (erreurs transitoires), après un délai croissant
+                    delay = RETRY_DELAY * 2 ** (job["attempts"] - 1)
+                    self._set(job, state="queued", worker=None, error=error,
+                              not_before=datetime.now() + timedelta(seconds=delay))
+                return False
+
+        self._set(job, state="indexed", stage_done="indexed", worker=None, error=None, report=report)
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return True
+
+    def run_once(self) -> bool:
+        """Traite un travail s'il y en a un ; retourne False si la file est vide"""
+        job = self.queue.backend.claim(self.name)
+        if job is None:
+            return False
+        print(f"📥 [{self.name}] {job['filename']} ({job['job_id']}, tentative {job['attempts']})")
+        ok = self.process(job)
+        print(f"{'✅' if ok else '❌'} [{self.name}] {job['filename']} : {job.get('report') or job.get('error')}")
+        return True
+
+    def run_forever(self, stop=None):
+        stop = stop or threading.Event()
+        last_maintenance = 0
+        while not stop.is_set():
+            try:
+                if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                    self.queue.maintain()
+                    last_maintenance = time.monotonic()
+                if not self.run_once():
+                    stop.wait(POLL_INTERVAL)
+            except Exception:
+                traceback.print_exc()
+                stop.wait(POLL_INTERVAL)
+
+
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def start_background_workers(count=INGESTION_INPROCESS_WORKERS):
+    """Lance (une seule fois par processus) des workers en threads démons"""
+    with _workers_lock:
+        while len(_workers) < count:
+            worker = IngestionWorker(name=f"{socket.gethostname()}:{os.getpid()}:t{len(_workers)}")
+            thread = threading.Thread(target=worker.run_forever, name=f"ingestion-{len(_workers)}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+
+def _run_worker(index):
+    IngestionWorker(name=f"{socket.gethostname()}:{os.getpid()}:w{index}").run_forever()
+
+
+if __name__ == "__main__":
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description="Workers d'indexation des documents téléversés")
+    parser.add_argument("--workers", type=int, default=1, help="Nombre de processus worker")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"🏭 Workers d'indexation : {args.workers} processus")
+    print(f"   File : {INGESTION_QUEUE} ({INGESTION_QUEUE_DB if INGESTION_QUEUE == 'sqlite' else 'PostgreSQL'})")
+    print("=" * 60)
+
+    processes = [multiprocessing.Process(target=_run_worker, args=(i,), name=f"ingestion-{i}")
+                 for i in range(args.workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("\n🛑 Arrêt des workers")
+        for process in processes:
+            process.terminate()
@@ -1,7 +1,8 @@
 import streamlit as st
 import pandas as pd
+from user_import import IMPORT_BATCH_SIZE, import_users, read_records
 from auth import logout_user, register_user, get_connection, hash_password, check_and_restore_session, \
-    register_user_admin
+    register_user_admin, user_directory
 from psycopg2.extras import RealDictCursor
 
 # ===============================
@@ -69,16 +70,15 @@ with st.sidebar:
         logout_user()
         st.rerun()
 
+IMPORT_ROLES = ["admin", "editeur_rh", "editeur_juridique", "rh", "juridique", "user"]
+DEFAULT_IMPORT_ROLE = "user"
+
 # ===============================
 # 📊 Statistiques utilisateurs
 # ===============================
-with get_connection() as conn:
-    cursor = conn.cursor()
-    cursor.execute("SELECT role, COUNT(*) as count FROM users GROUP BY role")
-    stats = cursor.fetchall()
-    cursor.close()
-
-stats_dict = {role: count for role, count in stats}
+# Un seul GROUP BY pour toutes les tuiles de la page (y compris la vue par département)
+stats_dict = user_directory.role_counts()
+total_users = sum(stats_dict.values())
 
 col1, col2, col3, col4, col5, col6 = st.columns(6)
 with col1:
@@ -154,24 +154,79 @@ with st.expander("➕ Créer un nouvel utilisateur", expanded=False):
 
 st.divider()
 
+# ===============================
+# 📥 Import en masse
+# ===============================
+with st.expander("📥 Importer des utilisateurs (CSV / LDIF)", expanded=False):
+    st.caption(
+        "Colonnes CSV : matricule, nom, prenom, email, password (optionnel), role (optionnel). "
+        "Les exports LDIF (uid, sn, givenName, mail) sont aussi acceptés. "
+        "Un matricule existant est mis à jour."
+    )
+    import_file = st.file_uploader("Fichier d'import", type=["csv", "ldif"], key="import_users_file")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        import_role = st.selectbox("Rôle par défaut", IMPORT_ROLES, index=IMPORT_ROLES.index(DEFAULT_IMPORT_ROLE))
+    with col2:
+        import_batch_size = st.number_input("Taille des lots", min_value=50, max_value=5000,
+                                            value=IMPORT_BATCH_SIZE, step=50)
+    with col3:
+        generate_passwords = st.checkbox("Générer les mots de passe manquants", value=True)
+
+    if import_file and st.button("📥 Lancer l'import", type="primary", use_container_width=True):
+        status = st.empty()
+        with st.spinner("Validation, hachage et écriture par lots..."):
+            report = import_users(
+                read_records(import_file),
+                user_directory,
+                roles=IMPORT_ROLES,
+                default_role=import_role,
+                batch_size=int(import_batch_size),
+                generate_passwords=generate_passwords,
+                progress=lambda n: status.caption(f"⏳ {n} ligne(s) traitée(s)")
+            )
+        st.session_state.import_report = report
+        st.rerun()
+
+    if "import_report" in st.session_state:
+        report = st.session_state.import_report
+        st.success(
+            f"✅ {report.created} créé(s), {report.updated} mis à jour, {report.errors} erreur(s) "
+            f"en {report.duration:.1f} s"
+        )
+        report_df = pd.DataFrame(report.rows, columns=["ligne", "matricule", "statut", "message"])
+        errors_df = report_df[report_df["statut"] == "erreur"]
+        if not errors_df.empty:
+            st.dataframe(errors_df, use_container_width=True, hide_index=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("📄 Rapport complet (CSV)", report_df.to_csv(index=False).encode("utf-8"),
+                               file_name="rapport_import.csv", mime="text/csv", use_container_width=True)
+        with col2:
+            if report.credentials:
+                st.download_button("🔑 Mots de passe générés (CSV)",
+                                   pd.DataFrame(report.credentials).to_csv(index=False).encode("utf-8"),
+                                   file_name="identifiants_import.csv", mime="text/csv",
+                                   use_container_width=True)
+        if st.button("🧹 Effacer le rapport"):
+            del st.session_state.import_report
+            st.rerun()
+
+st.divider()
+
 # ===============================
 # 📋 Liste des utilisateurs
 # ===============================
 st.subheader("📋 Gestion des utilisateurs")
 
-with get_connection() as conn:
-    cursor = conn.cursor()
-    cursor.execute("SELECT matricule, nom, prenom, email, role FROM users ORDER BY role, nom")
-    users = cursor.fetchall()
-    cursor.close()
+SORT_KEYS = {"Nom (A-Z)": "nom", "Nom (Z-A)": "nom_desc", "Rôle": "role", "Matricule": "matricule"}
 
-if users:
-    df = pd.DataFrame(users, columns=["Matricule", "Nom", "Prénom", "Email", "Rôle"])
-
-    # 🔎 Filtres
-    col1, col2, col3 = st.columns([3, 2, 2])
+if total_users:
+    # 🔎 Filtres (appliqués en SQL)
+    col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
     with col1:
-        search = st.text_input("🔎 Rechercher par nom, prénom ou email", key="search_users")
+        search = st.text_input("🔎 Rechercher par matricule, nom ou prénom (début)", key="search_users")
     with col2:
         role_filter = st.selectbox(
             "🎭 Filtrer par rôle",
@@ -181,35 +236,42 @@ if users:
     with col3:
         sort_option = st.selectbox(
             "📊 Trier par",
-            ["Nom (A-Z)", "Nom (Z-A)", "Rôle", "Matricule"],
+            list(SORT_KEYS),
             key="sort_option"
         )
-
-    # Application des filtres
-    df_filtered = df.copy()
+    with col4:
+        page_size = st.selectbox("Par page", [25, 50, 100], index=1, key="users_page_size")
+
+    role_param = None if role_filter == "Tous" else role_filter
+
+    # Pagination par clé : pile des curseurs des pages parcourues, remise à zéro si les filtres changent
+    filters = (search, role_filter, sort_option, page_size)
+    if st.session_state.get("users_filters") != filters:
+        st.session_state.users_filters = filters
+        st.session_state.users_cursors = [None]
+    cursors = st.session_state.users_cursors
+
+    users, next_cursor = user_directory.list_users(
+        search=search,
+        role=role_param,
+        sort=SORT_KEYS[sort_option],
+        after=cursors[-1],
+        limit=page_size
+    )
 
     if search:
-        df_filtered = df_filtered[
-            df_filtered["Nom"].str.contains(search, case=False, na=False) |
-            df_filtered["Prénom"].str.contains(search, case=False, na=False) |
-            df_filtered["Email"].str.contains(search, case=False, na=False)
-            ]
-
-    if role_filter != "Tous":
-        df_filtered = df_filtered[df_filtered["Rôle"] == role_filter]
-
-    # Tri
-    if sort_option == "Nom (A-Z)":
-        df_filtered = df_filtered.sort_values("Nom")
-    elif sort_option == "Nom (Z-A)":
-        df_filtered = df_filtered.sort_values("Nom", ascending=False)
-    elif sort_option == "Rôle":
-        df_filtered = df_filtered.sort_values("Rôle")
-    elif sort_option == "Matricule":
-        df_filtered = df_filtered.sort_values("Matricule")
+        matching = user_directory.count_users(search=search, role=role_param)
+    else:
+        matching = stats_dict.get(role_param, 0) if role_param else total_users
+
+    df_filtered = pd.DataFrame(users, columns=["matricule", "nom", "prenom", "email", "role"])
+    df_filtered.columns = ["Matricule", "Nom", "Prénom", "Email", "Rôle"]
 
     # Affichage du nombre de résultats
-    st.caption(f"📊 {len(df_filtered)} utilisateur(s) affiché(s) sur {len(df)} total")
+    st.caption(
+        f"📊 {matching} utilisateur(s) trouvé(s) sur {total_users} total — page {len(cursors)}, "
+        f"{len(df_filtered)} affiché(s)"
+    )
 
 
     # 📊 Tableau avec mise en forme
@@ -241,6 +303,16 @@ if users:
         }
     )
 
+    col_prev, col_next = st.columns(2)
+    with col_prev:
+        if st.button("⬅️ Précédent", disabled=len(cursors) == 1, use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with col_next:
+        if st.button("Suivant ➡️", disabled=next_cursor is None, use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun()
+
     st.markdown("---")
 
     # ===============================
@@ -263,11 +335,7 @@ if users:
             col_a, col_b = st.columns(2)
             with col_a:
                 if st.button("🗑️ Confirmer suppression", type="primary", use_container_width=True):
-                    with get_connection() as conn:
-                        cursor = conn.cursor()
-                        for mat in selected_rows:
-                            cursor.execute("DELETE FROM users WHERE matricule = %s", (mat,))
-                        cursor.close()
+                    user_directory.delete_users(selected_rows)
                     st.success(f"✅ {len(selected_rows)} utilisateur(s) supprimé(s) avec succès")
                     st.rerun()
             with col_b:
@@ -363,11 +431,7 @@ col1, col2, col3 = st.columns(3)
 
 with col1:
     st.markdown("#### 👔 Département RH")
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT role, COUNT(*) as count FROM users WHERE role IN ('editeur_rh', 'rh') GROUP BY role")
-        rh_stats = cursor.fetchall()
-        cursor.close()
+    rh_stats = [(role, stats_dict[role]) for role in ("editeur_rh", "rh") if role in stats_dict]
 
     if rh_stats:
         for role, count in rh_stats:
@@ -378,12 +442,7 @@ with col1:
 
 with col2:
     st.markdown("#### ⚖️ Département Juridique")
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT role, COUNT(*) as count FROM users WHERE role IN ('editeur_juridique', 'juridique') GROUP BY role")
-        jur_stats = cursor.fetchall()
-        cursor.close()
+    jur_stats = [(role, stats_dict[role]) for role in ("editeur_juridique", "juridique") if role in stats_dict]
 
     if jur_stats:
         for role, count in jur_stats:
@@ -394,10 +453,4 @@ with col2:
 
 with col3:
     st.markdown("#### 👤 Utilisateurs Standards")
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) as count FROM users WHERE role = 'user'")
-        user_count = cursor.fetchone()[0]
-        cursor.close()
-
-    st.metric("👤 Users", user_count)
\ No newline at end of file
+    st.metric("👤 Users", stats_dict.get("user", 0))
\ No newline at end of file
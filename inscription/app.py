@@ -5,6 +5,7 @@ Avec gestion avancée de session, sécurité et UX optimisée + Inscription
 
 import streamlit as st
 from auth import create_users_table, login_user, logout_user, check_and_restore_session, register_user
+from credentials import login_limiter
 import time
 from datetime import datetime
 import re
@@ -168,29 +169,19 @@ def validate_email(email: str) -> bool:
     return re.match(email_pattern, email) is not None
 
 
-def check_login_cooldown() -> tuple[bool, int]:
+def check_login_cooldown(matricule: str) -> tuple[bool, int]:
     """
-    Vérifie si l'utilisateur doit attendre avant de réessayer
+    Vérifie si le compte doit attendre avant de réessayer
     Retourne (can_login, seconds_remaining)
     """
-    if st.session_state.login_attempts >= 3:
-        if st.session_state.last_login_attempt:
-            elapsed = (datetime.now() - st.session_state.last_login_attempt).total_seconds()
-            cooldown = 60  # 60 secondes de délai après 3 tentatives
-            if elapsed < cooldown:
-                return False, int(cooldown - elapsed)
-            else:
-                # Reset après le cooldown
-                st.session_state.login_attempts = 0
-                st.session_state.last_login_attempt = None
-    return True, 0
+    return login_limiter.check(matricule)
 
 
 def handle_login(matricule: str, password: str):
     """Gère le processus de connexion avec validations"""
 
     # Vérifier le cooldown
-    can_login, seconds_remaining = check_login_cooldown()
+    can_login, seconds_remaining = check_login_cooldown(matricule)
     if not can_login:
         st.error(f"⏱️ Trop de tentatives. Veuillez attendre {seconds_remaining} secondes.")
         return
@@ -206,16 +197,14 @@ def handle_login(matricule: str, password: str):
 
     # Tentative de connexion
     with st.spinner("🔄 Connexion en cours..."):
-        time.sleep(0.5)
-
         if login_user(matricule, password):
             # Succès
+            login_limiter.record_success(matricule)
             st.session_state.login_attempts = 0
             st.session_state.last_login_attempt = None
             st.session_state.login_time = datetime.now()
 
             st.success(f"✅ Bienvenue {st.session_state.prenom} {st.session_state.nom} !")
-            time.sleep(1)
 
             # Redirection selon le rôle
             if st.session_state.role == "admin":
@@ -227,11 +216,12 @@ def handle_login(matricule: str, password: str):
             st.session_state.login_attempts += 1
             st.session_state.last_login_attempt = datetime.now()
 
-            remaining_attempts = 3 - st.session_state.login_attempts
-            if remaining_attempts > 0:
-                st.error(f"❌ Identifiants incorrects. Tentatives restantes: {remaining_attempts}")
+            lockout = login_limiter.record_failure(matricule)
+            if lockout:
+                st.error(f"🚫 Compte temporairement bloqué. Attendez {lockout} secondes.")
             else:
-                st.error("🚫 Compte temporairement bloqué. Attendez 60 secondes.")
+                remaining_attempts = login_limiter.remaining_attempts(matricule)
+                st.error(f"❌ Identifiants incorrects. Tentatives restantes: {remaining_attempts}")
 
 
 def handle_registration(matricule: str, nom: str, prenom: str, email: str, password: str, confirm_password: str):
@@ -321,7 +311,7 @@ if not st.session_state.logged_in:
 
         # Afficher le statut des tentatives si nécessaire
         if st.session_state.login_attempts > 0:
-            can_login, seconds = check_login_cooldown()
+            can_login, seconds = check_login_cooldown(matricule_login)
             if not can_login:
                 st.warning(f"⏱️ Attendez {seconds} secondes avant de réessayer")
 
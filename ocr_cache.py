@@ -0,0 +1,118 @@
+"""
+Cache persistant des résultats OCR.
+
+Une page OCRisée est identifiée par l'empreinte du fichier, son numéro de
+page et la configuration OCR (options Tesseract, dpi) : l'aperçu de la page
+OCR et les workers d'indexation partagent les résultats, et un changement de
+configuration n'utilise pas d'anciens textes. La taille du cache est plafonnée
+(OCR_CACHE_MAX_MB) ; les pages les moins récemment lues sont évincées.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", os.path.join("./collections", "ocr_cache.db"))
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", 200))
+# Après éviction, le cache redescend à cette fraction du plafond (évite d'évincer à chaque écriture)
+EVICTION_TARGET = 0.9
+# Taille totale relue en base toutes les N écritures (écritures des autres processus)
+SIZE_RESYNC_WRITES = 100
+
+
+class OCRCache:
+    """Textes OCR par (file_hash, page, config), avec éviction LRU par taille"""
+
+    def __init__(self, path=OCR_CACHE_PATH, max_bytes=OCR_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Taille estimée du cache : évite un SUM sur toute la table à chaque page écrite
+        self._size = None
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ocr_pages (
+                    file_hash TEXT NOT NULL,
+                    page INTEGER NOT NULL,
+                    config TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (file_hash, page, config)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_pages_access ON ocr_pages (last_access)")
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_many(self, file_hash, config) -> dict:
+        """{page: texte} des pages en cache pour ce fichier et cette configuration"""
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT page, text FROM ocr_pages WHERE file_hash = ? AND config = ?",
+                (file_hash, config)
+            ).fetchall()
+            if rows:
+                conn.execute("UPDATE ocr_pages SET last_access = ? WHERE file_hash = ? AND config = ?",
+                             (time.time(), file_hash, config))
+        return dict(rows)
+
+    def put(self, file_hash, page, config, text):
+        size = len(text.encode())
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_pages VALUES (?, ?, ?, ?, ?, ?)",
+                (file_hash, page, config, text, size, time.time())
+            )
+        with self._lock:
+            self._writes += 1
+            if self._size is None or self._writes % SIZE_RESYNC_WRITES == 0:
+                self._size = self.size()
+            else:
+                self._size += size
+            over = self._size > self.max_bytes
+        if over:
+            self._evict()
+
+    def size(self) -> int:
+        with self._conn() as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_pages").fetchone()[0]
+
+    def _evict(self):
+        with self._lock:
+            total = self._size = self.size()
+            if total <= self.max_bytes:
+                return
+            target = int(self.max_bytes * EVICTION_TARGET)
+            excess = total - target
+            with self._conn() as conn:
+                rows = conn.execute("SELECT rowid, size FROM ocr_pages ORDER BY last_access").fetchall()
+                evicted = []
+                for rowid, size in rows:
+                    if excess <= 0:
+                        break
+                    evicted.append((rowid,))
+                    excess -= size
+                conn.executemany("DELETE FROM ocr_pages WHERE rowid = ?", evicted)
+            self._size = target + excess
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM ocr_pages")
+        self._size = None
+
+
+# Cache partagé du processus (et, via le fichier, entre processus)
+ocr_cache = OCRCache()
@@ -0,0 +1,126 @@
+"""
+Moteurs OCR.
+
+- `tesserocr` : API Tesseract en mémoire. Un pool d'instances initialisées une
+  fois (modèles fra+eng chargés) sert toutes les pages ; l'image passe en
+  mémoire et la reconnaissance libère le GIL, donc les threads de l'OCR
+  tournent réellement en parallèle.
+- `pytesseract` : un processus `tesseract` et des fichiers temporaires par
+  page (comportement historique), utilisé si tesserocr n'est pas installé.
+
+OCR_ENGINE=auto (défaut) choisit tesserocr s'il est disponible.
+"""
+
+import os
+import queue
+import threading
+
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")
+OCR_LANG = "fra+eng"
+OCR_OEM = 3
+OCR_PSM = 6
+OCR_CONFIG = f"--oem {OCR_OEM} --psm {OCR_PSM} -l {OCR_LANG}"
+# Instances Tesseract gardées en mémoire (une par page OCRisée simultanément)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", min(4, os.cpu_count() or 1)))
+
+
+class OCREngine:
+    """Interface commune : texte d'une image PIL rendue à `dpi`"""
+
+    name = None
+
+    def image_to_text(self, image, dpi=None) -> str:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PytesseractEngine(OCREngine):
+    """Un sous-processus `tesseract` par page"""
+
+    name = "pytesseract"
+
+    def image_to_text(self, image, dpi=None) -> str:
+        import pytesseract
+        config = f"{OCR_CONFIG} --dpi {dpi}" if dpi else OCR_CONFIG
+        return pytesseract.image_to_string(image, config=config)
+
+
+class TesserocrEngine(OCREngine):
+    """Pool d'API Tesseract persistantes, créées à la demande jusqu'à `size`"""
+
+    name = "tesserocr"
+
+    def __init__(self, size=OCR_WORKERS, lang=OCR_LANG, oem=OCR_OEM, psm=OCR_PSM):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self.size = size
+        self.lang = lang
+        self.oem = oem
+        self.psm = psm
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if not create:
+            return self._pool.get()
+        try:
+            return self._tesserocr.PyTessBaseAPI(lang=self.lang, oem=self._tesserocr.OEM(self.oem),
+                                                 psm=self._tesserocr.PSM(self.psm))
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def image_to_text(self, image, dpi=None) -> str:
+        api = self._acquire()
+        try:
+            api.SetImage(image)
+            if dpi:
+                api.SetSourceResolution(dpi)
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+            self._pool.put(api)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().End()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_ocr_engine(engine=OCR_ENGINE) -> OCREngine:
+    """Moteur partagé du processus (`auto` : tesserocr s'il est installé, sinon pytesseract)"""
+    with _engines_lock:
+        if engine not in _engines:
+            if engine == "pytesseract":
+                _engines[engine] = PytesseractEngine()
+            elif engine == "tesserocr":
+                _engines[engine] = TesserocrEngine()
+            elif engine == "auto":
+                try:
+                    _engines[engine] = TesserocrEngine()
+                except ImportError:
+                    print("⚠️ tesserocr non installé : OCR par sous-processus tesseract")
+                    _engines[engine] = PytesseractEngine()
+            else:
+                raise ValueError(f"Moteur OCR inconnu : {engine}")
+        return _engines[engine]
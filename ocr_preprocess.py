@@ -0,0 +1,160 @@
+"""
+Prétraitement des pages avant Tesseract.
+
+Chaque page est d'abord rendue à basse résolution (sonde) : une page blanche
+s'arrête là, sans OCR. Sur la sonde, l'inclinaison est estimée (profil de
+projection) ainsi que la hauteur des lignes de texte, d'où la résolution à
+laquelle rendre la page pour que les lignes aient la taille où Tesseract est
+le plus fiable (gros caractères : moins de pixels ; petits : plus). La page
+rendue est passée en niveaux de gris, redressée, binarisée (Otsu) et rognée
+à son contenu : image plus petite et plus nette, OCR plus rapide.
+"""
+
+import os
+import statistics
+
+import numpy as np
+from PIL import Image
+
+OCR_PROBE_DPI = 100
+OCR_MIN_DPI = int(os.getenv("OCR_MIN_DPI", 150))
+OCR_MAX_DPI = int(os.getenv("OCR_MAX_DPI", 400))
+# Hauteur de ligne visée (pixels, lignes d'encre denses), atteinte par un texte de 10 pt à 300 dpi
+TARGET_LINE_PX = 28
+# En dessous de cette part de pixels d'encre, la page est considérée comme blanche
+BLANK_INK_RATIO = 0.002
+MAX_SKEW = 5.0
+CROP_MARGIN = 0.02
+# Version des réglages, incluse dans la clé du cache OCR
+# (v2 : pages à deux niveaux prises pour des pages blanches en v1)
+PREPROCESS_VERSION = "v2"
+
+
+def to_gray(image) -> np.ndarray:
+    return np.asarray(image.convert("L"), dtype=np.uint8)
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """
+    Seuil qui maximise la variance inter-classes (encre / fond). La classe
+    encre est `gray <= seuil` : sur une image à deux niveaux, le seuil est la
+    valeur de l'encre elle-même.
+    """
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    sum_bg = np.cumsum(hist * levels)
+    mean_bg = sum_bg / np.maximum(weight_bg, 1)
+    mean_fg = (sum_bg[-1] - sum_bg) / np.maximum(weight_fg, 1)
+    variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(variance))
+
+
+def ink_mask(gray: np.ndarray) -> np.ndarray:
+    """Pixels d'encre (True), seuil d'Otsu borné pour les pages presque vides"""
+    # Sur une page blanche, Otsu sépare le bruit du papier : le seuil est plafonné
+    return gray <= min(otsu_threshold(gray), 160)
+
+
+def is_blank(ink: np.ndarray) -> bool:
+    return ink.mean() < BLANK_INK_RATIO
+
+
+def estimate_skew(ink: np.ndarray) -> float:
+    """
+    Angle (degrés) qui aligne les lignes sur l'horizontale : celui qui rend le
+    profil des lignes le plus contrasté. Recherche grossière puis fine.
+    """
+    image = Image.fromarray((ink * 255).astype(np.uint8))
+
+    def score(angle):
+        rotated = np.asarray(image.rotate(angle, resample=Image.NEAREST, fillcolor=0))
+        return float(np.var(rotated.sum(axis=1, dtype=np.int64)))
+
+    best = max(np.arange(-MAX_SKEW, MAX_SKEW + 0.5, 1.0), key=score)
+    return round(float(max(np.arange(best - 0.8, best + 0.9, 0.2), key=score)), 1)
+
+
+def line_height(ink: np.ndarray) -> float:
+    """Hauteur médiane (pixels) des lignes de texte, None si aucune ligne détectée"""
+    rows = ink.sum(axis=1) > max(2, ink.shape[1] * 0.005)
+    runs, current = [], 0
+    for has_ink in rows:
+        if has_ink:
+            current += 1
+        elif current:
+            runs.append(current)
+            current = 0
+    if current:
+        runs.append(current)
+    runs = [r for r in runs if r >= 3]
+    return statistics.median(runs) if runs else None
+
+
+def choose_dpi(line_px, probe_dpi=OCR_PROBE_DPI) -> int:
+    """Résolution qui amène les lignes à TARGET_LINE_PX, arrondie à 25 dpi"""
+    if not line_px:
+        return 300
+    dpi = probe_dpi * TARGET_LINE_PX / line_px
+    return int(min(OCR_MAX_DPI, max(OCR_MIN_DPI, round(dpi / 25) * 25)))
+
+
+def analyze(probe, probe_dpi=OCR_PROBE_DPI):
+    """
+    Analyse de la sonde : None pour une page blanche, sinon (angle, dpi).
+    """
+    ink = ink_mask(to_gray(probe))
+    if is_blank(ink):
+        return None
+    angle = estimate_skew(ink)
+    if abs(angle) >= 0.1:
+        ink = np.asarray(Image.fromarray((ink * 255).astype(np.uint8))
+                         .rotate(angle, resample=Image.NEAREST, fillcolor=0)) > 0
+    return angle, choose_dpi(line_height(ink), probe_dpi)
+
+
+def crop_to_content(binary: np.ndarray) -> np.ndarray:
+    """Rogne les marges vides (une marge de CROP_MARGIN est gardée autour du contenu)"""
+    ink = binary == 0
+    rows = np.flatnonzero(ink.sum(axis=1) > 1)
+    cols = np.flatnonzero(ink.sum(axis=0) > 1)
+    if not len(rows) or not len(cols):
+        return binary
+    margin = int(max(binary.shape) * CROP_MARGIN)
+    top, bottom = max(0, rows[0] - margin), min(binary.shape[0], rows[-1] + margin + 1)
+    left, right = max(0, cols[0] - margin), min(binary.shape[1], cols[-1] + margin + 1)
+    return binary[top:bottom, left:right]
+
+
+def prepare(image, angle=0.0):
+    """Page rendue → image binaire redressée et rognée, prête pour Tesseract"""
+    gray = image.convert("L")
+    if abs(angle) >= 0.1:
+        gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    gray = np.asarray(gray, dtype=np.uint8)
+    binary = np.where(gray <= otsu_threshold(gray), 0, 255).astype(np.uint8)
+    return Image.fromarray(crop_to_content(binary))
+
+
+def _two_level_page():
+    """Page synthétique à deux niveaux (scan 1 bit, rendu vectoriel) : 30 lignes noires"""
+    page = np.full((1100, 850), 255, dtype=np.uint8)
+    for i in range(30):
+        top = 60 + i * 32
+        page[top:top + 12, 80:770] = 0
+    return Image.fromarray(page)
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🔎 Vérification du prétraitement sur une page à deux niveaux")
+    page = _two_level_page()
+    result = analyze(page)
+    prepared = np.asarray(prepare(page))
+    ink = int((prepared == 0).sum())
+    print(f"   analyze : {result}")
+    print(f"   prepare : {ink} pixels d'encre sur {prepared.size}")
+    print("✅ OK" if result is not None and ink > 0 else "❌ Page prise pour une page blanche")
+    print("=" * 60)
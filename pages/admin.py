@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
-from auth import logout_user, register_user, get_connection, hash_password
+from auth import logout_user, register_user, get_connection, hash_password, user_directory
+from src.vectorstore import get_vector_store
+import vectorstore_maintenance as maintenance
 
 # ===============================
 # 🔒 Vérification accès admin
@@ -83,30 +85,41 @@ with st.expander("➕ Créer un nouvel utilisateur", expanded=False):
 # ===============================
 st.subheader("📋 Gestion des utilisateurs")
 
-conn = get_connection()
-cursor = conn.execute("SELECT matricule, nom, prenom, email, role FROM users")
-users = cursor.fetchall()
-conn.close()
-
-if users:
-    df = pd.DataFrame(users, columns=["Matricule", "Nom", "Prénom", "Email", "Rôle"])
-
-    # 🔎 Filtres
+if user_directory.role_counts():
+    # 🔎 Filtres (appliqués en SQL)
     col1, col2 = st.columns([2, 1])
     with col1:
-        search = st.text_input("🔎 Rechercher par nom, prénom ou email")
+        search = st.text_input("🔎 Rechercher par matricule, nom ou prénom (début)")
     with col2:
         role_filter = st.selectbox("🎭 Filtrer par rôle", ["Tous", "juridique", "admin", "rh"])
 
-    df_filtered = df.copy()
-    if search:
-        df_filtered = df_filtered[df_filtered.apply(lambda row: search.lower() in row.astype(str).str.lower().to_string(), axis=1)]
-    if role_filter != "Tous":
-        df_filtered = df_filtered[df_filtered["Rôle"] == role_filter]
+    # Pagination par clé, remise à zéro si les filtres changent
+    if st.session_state.get("users_filters") != (search, role_filter):
+        st.session_state.users_filters = (search, role_filter)
+        st.session_state.users_cursors = [None]
+    cursors = st.session_state.users_cursors
+
+    users, next_cursor = user_directory.list_users(
+        search=search,
+        role=None if role_filter == "Tous" else role_filter,
+        after=cursors[-1]
+    )
+    df_filtered = pd.DataFrame(users, columns=["matricule", "nom", "prenom", "email", "role"])
+    df_filtered.columns = ["Matricule", "Nom", "Prénom", "Email", "Rôle"]
 
     # 📊 Tableau filtré
     st.dataframe(df_filtered, use_container_width=True, hide_index=True)
 
+    col_prev, col_next = st.columns(2)
+    with col_prev:
+        if st.button("⬅️ Précédent", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col_next:
+        if st.button("Suivant ➡️", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+
     st.markdown("---")
     col1, col2 = st.columns(2)
 
@@ -115,11 +128,7 @@ if users:
         selected_rows = st.multiselect("Sélectionnez des matricules à supprimer", df_filtered["Matricule"])
         if st.button("🗑️ Supprimer sélection"):
             if selected_rows:
-                conn = get_connection()
-                for mat in selected_rows:
-                    conn.execute("DELETE FROM users WHERE matricule = ?", (mat,))
-                conn.commit()
-                conn.close()
+                user_directory.delete_users(selected_rows)
                 st.success("✅ Utilisateur(s) supprimé(s) avec succès")
                 st.rerun()
             else:
@@ -156,3 +165,71 @@ if users:
 
 else:
     st.info("ℹ️ Aucun utilisateur enregistré.")
+
+
+# ===============================
+# 🗄️ Maintenance de la base vectorielle
+# ===============================
+st.markdown("---")
+st.subheader("🗄️ Base vectorielle")
+
+collection_name = get_vector_store()._collection.name
+if st.button("🔄 Analyser la collection"):
+    with st.spinner("Analyse de la collection..."):
+        st.session_state.vectorstore_stats = maintenance.collection_stats(collection_name)
+
+stats = st.session_state.get("vectorstore_stats")
+if stats and stats["collection"] == collection_name:
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Chunks", stats["chunks"])
+    col2.metric("Documents", stats["documents"])
+    col3.metric("Orphelins", stats["orphans"])
+    if stats["fragmentation"] is not None:
+        col4.metric("Fragmentation", f"{stats['fragmentation']:.0%}")
+
+    col1, col2, col3 = st.columns(3)
+    if stats["latency_ms"]:
+        mean, median, p95 = stats["latency_ms"]
+        col1.metric(f"Latence top-{maintenance.LATENCY_K} (méd. / p95)", f"{median:.0f} / {p95:.0f} ms")
+    if stats["index_bytes"] is not None:
+        col2.metric("Index HNSW", f"{stats['index_bytes'] / 1024 / 1024:.1f} Mo")
+    col3.metric("Répertoire collections", f"{stats['disk_bytes'] / 1024 / 1024:.1f} Mo")
+
+    st.dataframe(
+        pd.DataFrame(list(stats["departments"].items()), columns=["Département", "Chunks"]),
+        use_container_width=True, hide_index=True
+    )
+    st.caption("Paramètres HNSW : " + ", ".join(f"{k}={v}" for k, v in stats["hnsw"].items()))
+    if stats["leftovers"]:
+        st.caption("Collections intermédiaires : " + ", ".join(stats["leftovers"]))
+
+busy = maintenance.ingestion_busy()
+if busy:
+    st.info("⏳ Indexation en cours : les opérations de maintenance sont désactivées")
+
+col1, col2 = st.columns(2)
+with col1:
+    if st.button("🧹 Supprimer les orphelins", disabled=busy):
+        deleted = maintenance.delete_orphans(collection_name)
+        st.session_state.pop("vectorstore_stats", None)
+        st.success(f"✅ {deleted} chunk(s) orphelin(s) supprimé(s)")
+with col2:
+    if st.button("📸 Créer un instantané", disabled=busy):
+        with st.spinner("Copie de ./collections..."):
+            maintenance.create_snapshot()
+        st.success("✅ Instantané créé")
+
+# La compaction échange les collections : les processus en cours écriraient dans l'ancienne
+if stats and stats["fragmentation"] is not None and stats["fragmentation"] >= maintenance.COMPACTION_THRESHOLD:
+    st.warning(f"🗜️ Index fragmenté à {stats['fragmentation']:.0%} : compaction recommandée")
+st.caption("Compaction (application arrêtée) : "
+           f"`python -m vectorstore_maintenance compact --collection {collection_name}`")
+
+snapshots = maintenance.list_snapshots()
+if snapshots:
+    st.dataframe(pd.DataFrame([{
+        "Instantané": s["name"],
+        "Créé le": s["created_at"],
+        "Taille (Mo)": round(s["bytes"] / 1024 / 1024, 1),
+    } for s in snapshots]), use_container_width=True, hide_index=True)
+    st.caption("Restauration (application arrêtée) : `python -m vectorstore_maintenance restore <instantané>`")
@@ -3,8 +3,8 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-from get_stats import (get_feedback_stats, get_user_stats, get_conversation_stats,
-                     get_daily_activity, get_connected_users, get_all_feedbacks)
+from get_stats import (get_conversation_stats, get_daily_activity, get_connected_users,
+                       get_all_feedbacks, get_dashboard_snapshot)
 from auth import logout_user
 
 # --- Configuration de la page ---
@@ -46,8 +46,9 @@ with col2:
 st.divider()
 
 # --- Récupération des données ---
-feedback_stats = get_feedback_stats()
-user_stats = get_user_stats()
+snapshot = get_dashboard_snapshot()
+feedback_stats = snapshot.feedback_stats
+user_stats = snapshot.user_stats
 conversation_stats = get_conversation_stats()
 daily_activity = get_daily_activity()
 connected_users = get_connected_users()
@@ -1,16 +1,15 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
 import seaborn as sns
+from matplotlib.patches import Circle
 from datetime import datetime, timedelta
 from get_stats import (
-    get_feedback_stats, get_user_stats, get_conversation_stats,
-    get_daily_activity, get_connected_users, get_all_feedbacks,
-    get_total_users, get_total_documents, get_documents_by_type,
-    get_users_connected_now, get_users_connected_today, get_active_users_now,
-    get_total_conversations, get_conversations_by_day, get_conversations_by_weekday,
-    get_user_types
+    get_total_documents, get_documents_by_type,
+    get_users_connected_today, get_active_users_now
 )
+from analytics_frames import load_frames, render_figure
 from auth import logout_user
 
 # Configuration style matplotlib
@@ -56,16 +55,14 @@ with col2:
 st.divider()
 
 # --- Récupération des données ---
-total_users = get_total_users()
+# Frames colonnaires mis en cache par version des données (cf. analytics_frames)
+frames = load_frames()
 total_documents = get_total_documents()
-users_connected_now = get_users_connected_now()
-total_conversations = get_total_conversations()
-feedback_stats = get_feedback_stats()
-user_stats = get_user_stats()
-user_types = get_user_types()
 documents_by_type = get_documents_by_type()
-conversations_by_day = get_conversations_by_day()
-conversations_by_weekday = get_conversations_by_weekday()
+
+total_users = frames.total_users
+total_feedbacks = frames.total_feedbacks
+satisfaction_rate = frames.satisfaction_rate
 
 # === 1. MÉTRIQUES PRINCIPALES ===
 st.subheader("📈 Métriques Principales")
@@ -74,99 +71,144 @@ col1, col2, col3, col4 = st.columns(4)
 
 with col1:
     st.metric("👥 Utilisateurs inscrits", total_users)
-    st.caption(f"🟢 {users_connected_now} connectés maintenant")
+    st.caption(f"🟢 {frames.users_connected_now} connectés maintenant")
 
 with col2:
     st.metric("📄 Documents chargés", total_documents)
 
 with col3:
-    st.metric("💬 Conversations totales", total_conversations)
+    st.metric("💬 Conversations totales", frames.total_conversations)
 
 with col4:
-    total_feedbacks = feedback_stats["positive"] + feedback_stats["negative"]
-    satisfaction_rate = (feedback_stats["positive"] / total_feedbacks * 100) if total_feedbacks > 0 else 0
     st.metric("📊 Taux de satisfaction", f"{satisfaction_rate:.1f}%")
     delta = satisfaction_rate - 90
     st.caption(f"{'🟢' if delta >= 0 else '🔴'} Objectif: 90%")
 
 st.divider()
 
+
+# === RENDU DES FIGURES (appelé uniquement si la figure n'est pas en cache) ===
+
+def draw_feedbacks(fig, ax):
+    labels = ['Positifs 👍', 'Négatifs 👎']
+    sizes = [frames.feedback["positive"], frames.feedback["negative"]]
+    colors = ['#2ecc71', '#e74c3c']
+    explode = (0.05, 0.05)
+
+    # Création du donut chart
+    ax.pie(
+        sizes,
+        labels=labels,
+        autopct='%1.1f%%',
+        startangle=90,
+        colors=colors,
+        explode=explode,
+        textprops={'fontsize': 11, 'weight': 'bold'}
+    )
+
+    # Trou au centre pour donut
+    ax.add_artist(Circle((0, 0), 0.70, fc='white'))
+
+    # Texte au centre
+    ax.text(0, 0, f'{satisfaction_rate:.1f}%',
+            ha='center', va='center',
+            fontsize=24, weight='bold', color='#2c3e50')
+    ax.axis('equal')
+
+
+def draw_user_types(fig, ax):
+    labels = frames.user_types.index.tolist()
+    colors = ['#3498db', '#e74c3c', '#2ecc71', '#f39c12', '#9b59b6', '#1abc9c']
+
+    ax.pie(
+        frames.user_types.values,
+        labels=labels,
+        autopct='%1.1f%%',
+        startangle=90,
+        colors=colors[:len(labels)],
+        explode=[0.05] * len(labels),
+        textprops={'fontsize': 11, 'weight': 'bold'}
+    )
+
+    # Donut
+    ax.add_artist(Circle((0, 0), 0.70, fc='white'))
+
+    # Total au centre
+    ax.text(0, 0, f'{total_users}',
+            ha='center', va='center',
+            fontsize=24, weight='bold', color='#2c3e50')
+    ax.axis('equal')
+
+
+def draw_documents(fig, ax):
+    types = list(documents_by_type.keys())
+    counts = list(documents_by_type.values())
+
+    colors_map = {'PDF': '#e74c3c', 'Excel': '#2ecc71', 'CSV': '#3498db', 'Autre': '#95a5a6'}
+    bar_colors = [colors_map.get(t, '#95a5a6') for t in types]
+
+    bars = ax.bar(types, counts, color=bar_colors, edgecolor='black', linewidth=1.5)
+    ax.bar_label(bars, fmt='%d', fontsize=12, weight='bold')
+
+    ax.set_ylabel('Nombre de documents', fontsize=12, weight='bold')
+    ax.set_xlabel('')
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.grid(axis='y', alpha=0.3)
+
+
+def draw_by_day(fig, ax):
+    df = frames.by_day
+    ax.plot(df['date'], df['conv_count'],
+            marker='o', linewidth=2.5, markersize=6, color='#3498db')
+    ax.fill_between(df['date'], df['conv_count'],
+                    alpha=0.3, color='#3498db')
+
+    ax.set_ylabel('Nombre de conversations', fontsize=12, weight='bold')
+    ax.set_xlabel('Date', fontsize=12, weight='bold')
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.grid(True, alpha=0.3)
+
+    # Format des dates
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'))
+    ax.tick_params(axis='x', rotation=45)
+
+
+def draw_by_weekday(fig, ax):
+    df = frames.by_weekday
+
+    # Gradient de couleurs
+    colors_gradient = plt.cm.Blues(df['avg_convs'] / df['avg_convs'].max())
+
+    bars = ax.bar(df['day_name'].astype(str), df['avg_convs'],
+                  color=colors_gradient, edgecolor='black', linewidth=1.5)
+    ax.bar_label(bars, fmt='%.1f', fontsize=11, weight='bold')
+
+    ax.set_ylabel('Moyenne de conversations', fontsize=12, weight='bold')
+    ax.set_xlabel('Jour de la semaine', fontsize=12, weight='bold')
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.grid(axis='y', alpha=0.3)
+    ax.tick_params(axis='x', rotation=45)
+
+
 # === 2. GRAPHIQUES PRINCIPAUX ===
 col1, col2 = st.columns(2)
 
 with col1:
     st.subheader("📊 Distribution des Feedbacks")
-    
+
     if total_feedbacks > 0:
-        fig, ax = plt.subplots(figsize=(8, 6))
-        
-        # Données
-        labels = ['Positifs 👍', 'Négatifs 👎']
-        sizes = [feedback_stats["positive"], feedback_stats["negative"]]
-        colors = ['#2ecc71', '#e74c3c']
-        explode = (0.05, 0.05)
-        
-        # Création du donut chart
-        wedges, texts, autotexts = ax.pie(
-            sizes, 
-            labels=labels, 
-            autopct='%1.1f%%',
-            startangle=90,
-            colors=colors,
-            explode=explode,
-            textprops={'fontsize': 11, 'weight': 'bold'}
-        )
-        
-        # Trou au centre pour donut
-        centre_circle = plt.Circle((0, 0), 0.70, fc='white')
-        ax.add_artist(centre_circle)
-        
-        # Texte au centre
-        ax.text(0, 0, f'{satisfaction_rate:.1f}%', 
-                ha='center', va='center', 
-                fontsize=24, weight='bold', color='#2c3e50')
-        
-        ax.axis('equal')
-        plt.tight_layout()
-        st.pyplot(fig)
-        plt.close()
+        st.image(render_figure("feedbacks", frames.version, draw_feedbacks), use_container_width=True)
     else:
         st.info("Aucun feedback enregistré pour le moment")
 
 with col2:
     st.subheader("👥 Types d'utilisateurs")
-    
-    if user_types:
-        fig, ax = plt.subplots(figsize=(8, 6))
-        
-        labels = list(user_types.keys())
-        sizes = list(user_types.values())
-        colors = ['#3498db', '#e74c3c', '#2ecc71', '#f39c12', '#9b59b6', '#1abc9c']
-        explode = tuple([0.05] * len(labels))
-        
-        wedges, texts, autotexts = ax.pie(
-            sizes,
-            labels=labels,
-            autopct='%1.1f%%',
-            startangle=90,
-            colors=colors[:len(labels)],
-            explode=explode,
-            textprops={'fontsize': 11, 'weight': 'bold'}
-        )
-        
-        # Donut
-        centre_circle = plt.Circle((0, 0), 0.70, fc='white')
-        ax.add_artist(centre_circle)
-        
-        # Total au centre
-        ax.text(0, 0, f'{total_users}', 
-                ha='center', va='center', 
-                fontsize=24, weight='bold', color='#2c3e50')
-        
-        ax.axis('equal')
-        plt.tight_layout()
-        st.pyplot(fig)
-        plt.close()
+
+    if not frames.user_types.empty:
+        st.image(render_figure("user_types", frames.version, draw_user_types), use_container_width=True)
     else:
         st.info("Aucun utilisateur inscrit")
 
@@ -176,31 +218,10 @@ st.divider()
 st.subheader("📄 Types de documents chargés")
 
 if documents_by_type:
-    fig, ax = plt.subplots(figsize=(10, 5))
-    
-    df_docs = pd.DataFrame(list(documents_by_type.items()), columns=['Type', 'Nombre'])
-    
-    colors_map = {'PDF': '#e74c3c', 'Excel': '#2ecc71', 'CSV': '#3498db', 'Autre': '#95a5a6'}
-    bar_colors = [colors_map.get(t, '#95a5a6') for t in df_docs['Type']]
-    
-    bars = ax.bar(df_docs['Type'], df_docs['Nombre'], color=bar_colors, edgecolor='black', linewidth=1.5)
-    
-    # Ajouter les valeurs sur les barres
-    for bar in bars:
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width()/2., height,
-                f'{int(height)}',
-                ha='center', va='bottom', fontsize=12, weight='bold')
-    
-    ax.set_ylabel('Nombre de documents', fontsize=12, weight='bold')
-    ax.set_xlabel('')
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    ax.grid(axis='y', alpha=0.3)
-    
-    plt.tight_layout()
-    st.pyplot(fig)
-    plt.close()
+    # Les documents viennent du vector store : leur version est la répartition elle-même
+    documents_version = repr(sorted(documents_by_type.items()))
+    st.image(render_figure("documents", documents_version, draw_documents, figsize=(10, 5)),
+             use_container_width=True)
 else:
     st.info("Aucun document chargé")
 
@@ -212,81 +233,28 @@ st.subheader("📈 Évolution des conversations")
 tab1, tab2 = st.tabs(["📅 Par jour (30 derniers jours)", "📊 Moyenne par jour de la semaine"])
 
 with tab1:
-    if conversations_by_day:
-        df_conv_day = pd.DataFrame(conversations_by_day, columns=['Date', 'Conversations', 'Jour'])
-        df_conv_day['Date'] = pd.to_datetime(df_conv_day['Date'])
-        
-        fig, ax = plt.subplots(figsize=(12, 5))
-        
-        ax.plot(df_conv_day['Date'], df_conv_day['Conversations'], 
-                marker='o', linewidth=2.5, markersize=6, color='#3498db')
-        ax.fill_between(df_conv_day['Date'], df_conv_day['Conversations'], 
-                        alpha=0.3, color='#3498db')
-        
-        ax.set_ylabel('Nombre de conversations', fontsize=12, weight='bold')
-        ax.set_xlabel('Date', fontsize=12, weight='bold')
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.grid(True, alpha=0.3)
-        
-        # Format des dates
-        import matplotlib.dates as mdates
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'))
-        plt.xticks(rotation=45)
-        
-        plt.tight_layout()
-        st.pyplot(fig)
-        plt.close()
-        
+    if not frames.by_day.empty:
+        st.image(render_figure("by_day", frames.version, draw_by_day, figsize=(12, 5)), use_container_width=True)
+
         # Statistiques
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("📊 Moyenne/jour", f"{df_conv_day['Conversations'].mean():.1f}")
+            st.metric("📊 Moyenne/jour", f"{frames.by_day['conv_count'].mean():.1f}")
         with col2:
-            st.metric("📈 Maximum", f"{df_conv_day['Conversations'].max()}")
+            st.metric("📈 Maximum", f"{frames.by_day['conv_count'].max()}")
         with col3:
-            st.metric("📉 Minimum", f"{df_conv_day['Conversations'].min()}")
+            st.metric("📉 Minimum", f"{frames.by_day['conv_count'].min()}")
     else:
         st.info("Aucune donnée de conversation disponible")
 
 with tab2:
-    if conversations_by_weekday:
-        df_weekday = pd.DataFrame(conversations_by_weekday, columns=['Jour', 'Moyenne'])
-        
-        # Ordre des jours
-        jour_order = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
-        df_weekday['Jour'] = pd.Categorical(df_weekday['Jour'], categories=jour_order, ordered=True)
-        df_weekday = df_weekday.sort_values('Jour')
-        
-        fig, ax = plt.subplots(figsize=(10, 5))
-        
-        # Gradient de couleurs
-        colors_gradient = plt.cm.Blues(df_weekday['Moyenne'] / df_weekday['Moyenne'].max())
-        
-        bars = ax.bar(df_weekday['Jour'], df_weekday['Moyenne'], 
-                     color=colors_gradient, edgecolor='black', linewidth=1.5)
-        
-        # Valeurs sur les barres
-        for bar in bars:
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height,
-                    f'{height:.1f}',
-                    ha='center', va='bottom', fontsize=11, weight='bold')
-        
-        ax.set_ylabel('Moyenne de conversations', fontsize=12, weight='bold')
-        ax.set_xlabel('Jour de la semaine', fontsize=12, weight='bold')
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.grid(axis='y', alpha=0.3)
-        
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        st.pyplot(fig)
-        plt.close()
-        
+    if not frames.by_weekday.empty:
+        st.image(render_figure("by_weekday", frames.version, draw_by_weekday, figsize=(10, 5)),
+                 use_container_width=True)
+
         # Jour le plus actif
-        jour_max = df_weekday.loc[df_weekday['Moyenne'].idxmax(), 'Jour']
-        st.success(f"🏆 Jour le plus actif : **{jour_max}** ({df_weekday['Moyenne'].max():.1f} conversations en moyenne)")
+        busiest = frames.by_weekday.loc[frames.by_weekday['avg_convs'].idxmax()]
+        st.success(f"🏆 Jour le plus actif : **{busiest['day_name']}** ({busiest['avg_convs']:.1f} conversations en moyenne)")
     else:
         st.info("Aucune donnée de conversation disponible")
 
@@ -367,15 +335,9 @@ st.divider()
 # === 6. STATISTIQUES PAR UTILISATEUR ===
 st.subheader("👥 Statistiques par utilisateur")
 
-if user_stats:
-    df_users = pd.DataFrame(user_stats)
-    df_users['total_feedbacks'] = df_users['positive_feedbacks'] + df_users['negative_feedbacks']
-    df_users['satisfaction_rate'] = df_users.apply(
-        lambda row: (row['positive_feedbacks'] / row['total_feedbacks'] * 100)
-        if row['total_feedbacks'] > 0 else 0, axis=1
-    )
-    df_users['avg_questions_per_conv'] = (df_users['total_questions'] / df_users['total_conversations']).round(1)
-    
+if not frames.users.empty:
+    df_users = frames.users
+
     col1, col2 = st.columns([2, 2])
     with col1:
         sort_by = st.selectbox(
@@ -384,20 +346,19 @@ if user_stats:
         )
     with col2:
         min_questions = st.number_input("Questions minimum", min_value=0, value=0)
-    
-    df_filtered = df_users[df_users['total_questions'] >= min_questions].copy()
-    
-    if sort_by == "Questions (↓)":
-        df_filtered = df_filtered.sort_values('total_questions', ascending=False)
-    elif sort_by == "Conversations (↓)":
-        df_filtered = df_filtered.sort_values('total_conversations', ascending=False)
-    elif sort_by == "Satisfaction (↓)":
-        df_filtered = df_filtered.sort_values('satisfaction_rate', ascending=False)
-    else:
-        df_filtered = df_filtered.sort_values('last_activity', ascending=False)
-    
+
+    sort_columns = {
+        "Questions (↓)": 'total_questions',
+        "Conversations (↓)": 'total_conversations',
+        "Satisfaction (↓)": 'satisfaction_rate',
+        "Dernière activité (↓)": 'last_activity'
+    }
+    df_filtered = df_users[df_users['total_questions'] >= min_questions].sort_values(
+        sort_columns[sort_by], ascending=False
+    )
+
     st.caption(f"Affichage de {len(df_filtered)} utilisateur(s)")
-    
+
     cols = st.columns([1.5, 1, 1, 1, 1.5, 1.5, 1.5])
     cols[0].markdown("**👤 Matricule**")
     cols[1].markdown("**❓ Questions**")
@@ -406,52 +367,50 @@ if user_stats:
     cols[4].markdown("**👍/👎 Feedbacks**")
     cols[5].markdown("**📈 Satisfaction**")
     cols[6].markdown("**🕐 Dernière activité**")
-    
+
     st.divider()
-    
-    for _, row in df_filtered.iterrows():
+
+    for row in df_filtered.itertuples(index=False):
         cols = st.columns([1.5, 1, 1, 1, 1.5, 1.5, 1.5])
-        cols[0].markdown(f"**{row['matricule']}**")
-        cols[1].markdown(f"{row['total_questions']}")
-        cols[2].markdown(f"{row['total_conversations']}")
-        cols[3].markdown(f"{row['avg_questions_per_conv']}")
-        cols[4].markdown(f"👍 {row['positive_feedbacks']} / 👎 {row['negative_feedbacks']}")
-        
-        sat_rate = row['satisfaction_rate']
-        if row['total_feedbacks'] > 0:
+        cols[0].markdown(f"**{row.matricule}**")
+        cols[1].markdown(f"{row.total_questions}")
+        cols[2].markdown(f"{row.total_conversations}")
+        cols[3].markdown(f"{row.avg_questions_per_conv}")
+        cols[4].markdown(f"👍 {row.positive_feedbacks} / 👎 {row.negative_feedbacks}")
+
+        if row.total_feedbacks > 0:
+            sat_rate = row.satisfaction_rate
             color = "🟢" if sat_rate >= 90 else "🟡" if sat_rate >= 50 else "🔴"
             cols[5].markdown(f"{color} {sat_rate:.1f}%")
         else:
             cols[5].markdown("⚪ N/A")
-        
-        if row['last_activity']:
-            last_act = datetime.strptime(row['last_activity'], "%Y-%m-%d %H:%M:%S")
-            time_diff = datetime.now() - last_act
-            
-            if time_diff.days == 0:
-                cols[6].markdown("🟢 Aujourd'hui")
-            elif time_diff.days == 1:
-                cols[6].markdown("🟡 Hier")
-            elif time_diff.days <= 7:
-                cols[6].markdown(f"🟡 Il y a {time_diff.days}j")
-            else:
-                cols[6].markdown(f"🔴 Il y a {time_diff.days}j")
-        else:
+
+        days = row.days_since_activity
+        if pd.isna(days):
             cols[6].markdown("⚪ Jamais")
+        elif days == 0:
+            cols[6].markdown("🟢 Aujourd'hui")
+        elif days == 1:
+            cols[6].markdown("🟡 Hier")
+        elif days <= 7:
+            cols[6].markdown(f"🟡 Il y a {int(days)}j")
+        else:
+            cols[6].markdown(f"🔴 Il y a {int(days)}j")
 else:
     st.info("Aucun utilisateur n'a encore utilisé le chatbot")
 
 st.divider()
 
 # === 7. EXPORT DES DONNÉES ===
-all_feedbacks = get_all_feedbacks()
 st.subheader("💾 Export des données")
 
 col1, col2, col3 = st.columns(3)
 
 with col1:
-    if user_stats:
-        csv_users = pd.DataFrame(user_stats).to_csv(index=False)
+    if not frames.users.empty:
+        csv_users = frames.users.drop(
+            columns=['total_feedbacks', 'satisfaction_rate', 'avg_questions_per_conv', 'days_since_activity']
+        ).to_csv(index=False)
         st.download_button(
             label="📥 Stats utilisateurs (CSV)",
             data=csv_users,
@@ -460,9 +419,10 @@ with col1:
         )
 
 with col2:
-    if all_feedbacks:
-        csv_feedbacks = pd.DataFrame(all_feedbacks,
-                                     columns=['Matricule', 'Conversation', 'Index', 'Type', 'Date']).to_csv(index=False)
+    if not frames.feedbacks.empty:
+        csv_feedbacks = frames.feedbacks.set_axis(
+            ['Matricule', 'Conversation', 'Index', 'Type', 'Date'], axis=1
+        ).to_csv(index=False)
         st.download_button(
             label="📥 Feedbacks (CSV)",
             data=csv_feedbacks,
@@ -471,8 +431,10 @@ with col2:
         )
 
 with col3:
-    if conversations_by_day:
-        csv_conv = pd.DataFrame(conversations_by_day, columns=['Date', 'Conversations', 'Jour']).to_csv(index=False)
+    if not frames.by_day.empty:
+        csv_conv = frames.by_day[['date', 'conv_count', 'day_name']].set_axis(
+            ['Date', 'Conversations', 'Jour'], axis=1
+        ).to_csv(index=False, date_format='%Y-%m-%d')
         st.download_button(
             label="📥 Conversations (CSV)",
             data=csv_conv,
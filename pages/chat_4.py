@@ -7,8 +7,14 @@ from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from src.vectorstore import get_vector_store
+from embeddings_backend import bind_collection_embeddings
 from src import CONFIG
 from src.utils import format_docs, chat_stream
+from retrieval import CachedRetriever
+from rerank import get_reranker
+from compression import get_context_compressor
+from docstore import parent_expander
+from embedding_cache import get_query_embedding_cache
 from chat_db import init_chat_table, load_conversations, save_message, rename_conversation,get_feedback,save_feedback
 
 OPENAI_API_KEY = CONFIG["OPENAI_API_KEY"]
@@ -174,7 +180,7 @@ with st.sidebar:
                 st.rerun()
 
 # --- Préparation du modèle et du retriever ---
-vector_store = get_vector_store()
+vector_store = bind_collection_embeddings(get_vector_store())
 llm = ChatOpenAI(model="gpt-4.1-mini", api_key=OPENAI_API_KEY, temperature=0.7)
 
 
@@ -202,17 +208,23 @@ else:
     st.error("🚫 Rôle non reconnu pour le chatbot.")
     st.stop()
 
-retriever = vector_store.as_retriever(
-    search_type="similarity_score_threshold",
-    search_kwargs={"score_threshold": 0.5, "k": 5}
-)
+# Recherche avec cache (question normalisée / embedding quantifié), invalidé à chaque ajout/suppression
+# Embeddings de questions mémoïsés (LRU + store disque, préchauffés depuis l'historique)
+query_embeddings = get_query_embedding_cache(vector_store.embeddings)
+# Reranker optionnel (RERANKER=gap|cross-encoder) : sur-échantillonne 20 chunks puis coupe adaptativement
+# Chaque chunk trouvé est étendu à sa section parente (PARENT_EXPANSION=0 pour désactiver)
+retriever = CachedRetriever(vector_store, department=role, k=5, score_threshold=0.5,
+                            embed_query=query_embeddings.embed_query, reranker=get_reranker(),
+                            expander=parent_expander)
+# Compression : seules les phrases proches de la question, dans un budget de tokens (CONTEXT_TOKEN_BUDGET)
+compressor = get_context_compressor(vector_store, embed_query=query_embeddings.embed_query)
 
 
 # --- Fonction pour construire la chaîne avec mémoire ---
 def build_chain(prompt, retriever, llm, history):
     return (
             {
-                "context": retriever | format_docs,
+                "context": compressor.as_runnable(retriever) | format_docs,
                 "question": RunnablePassthrough(),
                 "history": lambda _: history,
             }
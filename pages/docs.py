@@ -1,20 +1,18 @@
 import streamlit as st
-import tempfile
-from uuid import uuid4
 from datetime import datetime
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from src.vectorstore import get_vector_store
-from langchain_openai import OpenAIEmbeddings
+from embeddings_backend import bind_collection_embeddings
 from src import CONFIG
 import pandas as pd
 from auth import logout_user
+from ingestion import delete_chunks
+from docstore import section_store
+from dedup import ChunkIndex, file_hash, find_file, find_document_by_name
+from ingestion_jobs import ingestion_queue, start_background_workers, ACTIVE_STATES, STATE_LABELS
 
 OPENAI_API_KEY = CONFIG["OPENAI_API_KEY"]
 BASE_DIR = "./collections"
 
-embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
-
 # --- Configuration de la page ---
 st.set_page_config(
     page_title="Gestion des Documents",
@@ -44,7 +42,10 @@ with col2:
 st.divider()
 
 # Initialisation du vector store
-vector_store = get_vector_store()
+vector_store = bind_collection_embeddings(get_vector_store())
+chunk_index = ChunkIndex()
+# Workers d'indexation en arrière-plan (une seule fois par processus)
+start_background_workers()
 
 
 with st.sidebar:
@@ -53,6 +54,16 @@ with st.sidebar:
         st.rerun()
 
 # === FONCTIONS UTILITAIRES ===
+def flash(kind, message):
+    """Message affiché à l'exécution suivante (un `st.rerun()` effacerait un message immédiat)"""
+    st.session_state.setdefault("docs_flash", []).append((kind, message))
+
+
+def show_flash():
+    for kind, message in st.session_state.pop("docs_flash", []):
+        getattr(st, kind)(message)
+
+
 def get_user_department():
     """Retourne le département de l'utilisateur (RH ou Juridique)"""
     role = st.session_state.role.lower()
@@ -101,46 +112,7 @@ def filter_documents_by_permission(metadatas, ids):
     return filtered_metadatas, filtered_ids
 
 
-# === FONCTION DE TRAITEMENT DES FICHIERS ===
-def process_file(uploaded_file):
-    """Traite un fichier et retourne les documents splittés."""
-    ext = uploaded_file.name.split(".")[-1].lower()
-    docs = []
-
-    try:
-        if ext == "pdf":
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                tmp_file.write(uploaded_file.getbuffer())
-                tmp_path = tmp_file.name
-
-            loader = PyPDFLoader(tmp_path)
-            pages = loader.load()
-
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=520,
-                chunk_overlap=20,
-                length_function=len
-            )
-            docs = text_splitter.split_documents(pages)
-
-        elif ext in ["xlsx", "xls", "csv"]:
-            if ext == "csv":
-                df = pd.read_csv(uploaded_file)
-            else:
-                df = pd.read_excel(uploaded_file)
-
-            text_content = df.to_csv(index=False)
-            docs = [type("Doc", (), {"page_content": text_content, "metadata": {}})]
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=50
-            )
-            docs = text_splitter.split_documents(docs)
-
-        return docs, None
-    except Exception as e:
-        return None, str(e)
-
+show_flash()
 
 # === SECTION UPLOAD (admin et éditeurs) ===
 if can_upload_documents():
@@ -159,6 +131,12 @@ if can_upload_documents():
             department = user_dept
             st.info(f"📁 Département : **{department}**")
 
+        merge_same_name = st.checkbox(
+            "🔄 Mettre à jour les documents existants portant le même nom",
+            value=True,
+            help="Un fichier déjà présent sous le même nom est traité comme une nouvelle version"
+        )
+
         uploaded_files = st.file_uploader(
             "Sélectionnez un ou plusieurs fichiers",
             type=["pdf", "xlsx", "xls", "csv"],
@@ -170,52 +148,102 @@ if can_upload_documents():
             col1, col2 = st.columns([1, 4])
             with col1:
                 if st.button("✅ Ajouter à la base", type="primary", use_container_width=True):
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    success_count = 0
-                    error_count = 0
+                    queued_count = 0
+                    report = []
+
+                    for uploaded_file in uploaded_files:
+                        # Fichier déjà indexé ou en cours d'indexation : rejet sans parsing ni embedding
+                        fhash = file_hash(uploaded_file.getbuffer())
+                        existing = find_file(vector_store, fhash)
+                        pending = ingestion_queue.find_active(fhash)
+                        if existing or pending:
+                            reason = f"fichier identique à '{existing.get('filename', 'N/A')}'" if existing \
+                                else "fichier déjà en cours d'indexation"
+                            report.append({
+                                "Fichier": uploaded_file.name,
+                                "Raison": reason,
+                                "Similarité": 1.0,
+                                "Extrait": ""
+                            })
+                            continue
+
+                        date_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                        uploader = f"{st.session_state.nom} {st.session_state.prenom}"
+                        metadata = {
+                            "filename": uploaded_file.name,
+                            "date_added": date_str,
+                            "uploaded_by_role": st.session_state.role,
+                            "uploader": uploader,
+                            "department": department,  # Nouveau champ
+                            "file_hash": fhash
+                        }
+
+                        # Un document du même nom est mis à jour (nouvelle version) plutôt que dupliqué
+                        previous_id = find_document_by_name(vector_store, uploaded_file.name, department) \
+                            if merge_same_name else None
+                        ingestion_queue.enqueue(uploaded_file.getvalue(), uploaded_file.name, metadata,
+                                                department=department, doc_id=previous_id, file_hash=fhash)
+                        queued_count += 1
+
+                    if queued_count > 0:
+                        flash("success", f"📥 {queued_count} document(s) en file d'indexation : "
+                                         f"suivez l'avancement dans « Indexations en cours ».")
+                    if report:
+                        st.session_state.dedup_report = report
 
-                    for idx, uploaded_file in enumerate(uploaded_files):
-                        status_text.text(f"Traitement de {uploaded_file.name}...")
+                    st.rerun()
 
-                        docs, error = process_file(uploaded_file)
+        # Fichiers écartés au dernier chargement
+        dedup_report = st.session_state.pop("dedup_report", None)
+        if dedup_report:
+            st.warning(f"♻️ {len(dedup_report)} fichier(s) ignoré(s) car déjà présents dans la base")
+            st.dataframe(pd.DataFrame(dedup_report), use_container_width=True, hide_index=True)
+
+    # === SUIVI DES INDEXATIONS ===
+    with st.expander("🏭 Indexations en cours", expanded=True):
+        jobs = ingestion_queue.jobs(
+            limit=30,
+            department=None if st.session_state.role == "admin" else get_user_department()
+        )
+        if not jobs:
+            st.caption("Aucune indexation récente.")
+        else:
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                active = sum(job["state"] in ACTIVE_STATES for job in jobs)
+                st.caption(f"{active} en attente ou en cours · les fichiers sont traités en arrière-plan, "
+                           f"même si cette page est fermée.")
+            with col2:
+                if st.button("🔄 Actualiser", use_container_width=True):
+                    st.rerun()
 
-                        if error:
-                            st.error(f"❌ Erreur avec '{uploaded_file.name}': {error}")
-                            error_count += 1
+            st.dataframe(pd.DataFrame([{
+                "Fichier": job["filename"],
+                "État": STATE_LABELS.get(job["state"], job["state"]),
+                "Type": "Mise à jour" if job["mode"] == "update" else "Nouveau",
+                "Tentatives": job["attempts"],
+                "Mis à jour": str(job["updated_at"])[:19],
+                "Détail": job["error"] if job["state"] == "failed" else (job["report"] or ""),
+            } for job in jobs]), use_container_width=True, hide_index=True)
+
+            failed = [job for job in jobs if job["state"] == "failed"]
+            if failed:
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    job_to_retry = st.selectbox(
+                        "Indexation en échec",
+                        [job["job_id"] for job in failed],
+                        format_func=lambda x: next(job["filename"] for job in failed if job["job_id"] == x),
+                        key="retry_job_select"
+                    )
+                with col2:
+                    st.write("")
+                    if st.button("🔁 Relancer", use_container_width=True):
+                        if ingestion_queue.retry(job_to_retry):
+                            flash("success", "✅ Indexation relancée à partir de la dernière étape terminée")
                         else:
-                            # Ajout des métadonnées
-                            doc_id = str(uuid4())
-                            date_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            uploader = f"{st.session_state.nom} {st.session_state.prenom}"
-
-                            for d in docs:
-                                d.metadata.update({
-                                    "doc_id": doc_id,
-                                    "filename": uploaded_file.name,
-                                    "date_added": date_str,
-                                    "uploaded_by_role": st.session_state.role,
-                                    "uploader": uploader,
-                                    "department": department  # Nouveau champ
-                                })
-
-                            vector_store.add_documents(
-                                ids=[str(uuid4()) for _ in range(len(docs))],
-                                documents=docs
-                            )
-                            success_count += 1
-
-                        progress_bar.progress((idx + 1) / len(uploaded_files))
-
-                    status_text.empty()
-                    progress_bar.empty()
-
-                    if success_count > 0:
-                        st.success(f"✅ {success_count} document(s) ajouté(s) avec succès !")
-                    if error_count > 0:
-                        st.warning(f"⚠️ {error_count} document(s) en erreur.")
-
-                    st.rerun()
+                            flash("error", "❌ Fichier source introuvable : veuillez le téléverser à nouveau")
+                        st.rerun()
 else:
     st.info("ℹ️ Vous n'avez pas les permissions pour charger des documents.")
 
@@ -244,7 +272,8 @@ try:
                     "Date": meta.get("date_added", "N/A"),
                     "Rôle": meta.get("uploaded_by_role", "N/A"),
                     "Username": meta.get("uploader", "N/A"),
-                    "Département": meta.get("department", "N/A")
+                    "Département": meta.get("department", "N/A"),
+                    "Version": meta.get("version", 1)
                 }
             chunk_map.setdefault(doc_id, []).append(ids[i])
 
@@ -369,12 +398,45 @@ try:
                 with col1:
                     if st.button(f"🗑️ Supprimer ({len(selected)})", type="primary", use_container_width=True):
                         for doc_id in selected:
-                            vector_store.delete(ids=chunk_map[doc_id])
-                        st.success(f"✅ {len(selected)} document(s) supprimé(s) avec succès !")
+                            delete_chunks(vector_store, chunk_map[doc_id])
+                            chunk_index.remove_document(doc_id)
+                            section_store.delete_document(doc_id)
+                        flash("success", f"✅ {len(selected)} document(s) supprimé(s) avec succès !")
                         st.rerun()
                 with col2:
                     if st.button("❌ Annuler", use_container_width=True):
                         st.rerun()
+
+            # Mise à jour incrémentale (admin et éditeurs)
+            if can_upload_documents():
+                st.divider()
+                with st.expander("🔄 Mettre à jour un document", expanded=False):
+                    st.caption("Seuls les passages modifiés sont ré-indexés ; le document garde le même identifiant.")
+                    doc_to_update = st.selectbox(
+                        "Document à mettre à jour",
+                        list(filtered_docs.keys()),
+                        format_func=lambda x: f"{filtered_docs[x]['Nom']} (v{filtered_docs[x]['Version']})",
+                        key="update_doc_select"
+                    )
+                    new_version_file = st.file_uploader(
+                        "Nouvelle version du fichier",
+                        type=["pdf", "xlsx", "xls", "csv"],
+                        key="update_doc_uploader"
+                    )
+
+                    if new_version_file and st.button("🔄 Mettre à jour", type="primary"):
+                        infos = filtered_docs[doc_to_update]
+                        fhash = file_hash(new_version_file.getbuffer())
+                        ingestion_queue.enqueue(new_version_file.getvalue(), new_version_file.name, {
+                            "filename": new_version_file.name,
+                            "date_added": infos["Date"],
+                            "uploaded_by_role": st.session_state.role,
+                            "uploader": f"{st.session_state.nom} {st.session_state.prenom}",
+                            "department": infos["Département"],
+                            "file_hash": fhash
+                        }, department=infos["Département"], doc_id=doc_to_update, file_hash=fhash)
+                        flash("success", f"📥 Mise à jour de {infos['Nom']} en file d'indexation")
+                        st.rerun()
         else:
             st.info("Aucun document ne correspond aux filtres sélectionnés.")
     else:
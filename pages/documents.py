@@ -1,19 +1,15 @@
 import streamlit as st
-import tempfile
 from uuid import uuid4
 from datetime import datetime
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from document_pipeline import load_pages, split_pages
 from src.vectorstore import get_vector_store
-from langchain_openai import OpenAIEmbeddings
+from embeddings_backend import bind_collection_embeddings
 from src import CONFIG
-import pandas as pd
+from ingestion import add_chunks, delete_chunks
 
 OPENAI_API_KEY = CONFIG["OPENAI_API_KEY"]
 BASE_DIR = "./collections"
 
-embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
-
 # --- Configuration de la page ---
 st.set_page_config(
     page_title="Gestion des Documents",
@@ -43,7 +39,7 @@ with col2:
 st.divider()
 
 # Initialisation du vector store
-vector_store = get_vector_store()
+vector_store = bind_collection_embeddings(get_vector_store())
 
 
 # === FONCTION DE TRAITEMENT DES FICHIERS ===
@@ -53,34 +49,9 @@ def process_file(uploaded_file):
     docs = []
 
     try:
-        if ext == "pdf":
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                tmp_file.write(uploaded_file.getbuffer())
-                tmp_path = tmp_file.name
-
-            loader = PyPDFLoader(tmp_path)
-            pages = loader.load()
-
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=520,
-                chunk_overlap=20,
-                length_function=len
-            )
-            docs = text_splitter.split_documents(pages)
-
-        elif ext in ["xlsx", "xls", "csv"]:
-            if ext == "csv":
-                df = pd.read_csv(uploaded_file)
-            else:
-                df = pd.read_excel(uploaded_file)
-
-            text_content = df.to_csv(index=False)
-            docs = [type("Doc", (), {"page_content": text_content, "metadata": {}})]
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=50
-            )
-            docs = text_splitter.split_documents(docs)
+        if ext in ["pdf", "xlsx", "xls", "csv"]:
+            # Lecture en mémoire, sans fichier temporaire
+            docs = split_pages(uploaded_file.name, load_pages(uploaded_file.getvalue(), uploaded_file.name))
 
         return docs, None
     except Exception as e:
@@ -131,10 +102,7 @@ if st.session_state.role == "admin":
                                     "uploader": uploader
                                 })
 
-                            vector_store.add_documents(
-                                ids=[str(uuid4()) for _ in range(len(docs))],
-                                documents=docs
-                            )
+                            add_chunks(vector_store, docs)
                             success_count += 1
 
                         progress_bar.progress((idx + 1) / len(uploaded_files))
@@ -279,7 +247,7 @@ try:
                 with col1:
                     if st.button(f"🗑️ Supprimer ({len(selected)})", type="primary", use_container_width=True):
                         for doc_id in selected:
-                            vector_store.delete(ids=chunk_map[doc_id])
+                            delete_chunks(vector_store, chunk_map[doc_id])
                         st.success(f"✅ {len(selected)} document(s) supprimé(s) avec succès !")
                         st.rerun()
                 with col2:
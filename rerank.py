@@ -0,0 +1,102 @@
+"""
+Reclassement optionnel des chunks récupérés, avec coupure adaptative.
+
+Le retriever sur-échantillonne (`RERANK_FETCH_K` candidats) puis un reranker
+rescore les candidats et ne garde que ceux qui passent une coupure adaptative :
+au moins `min_k`, au plus `max_k`, et on s'arrête au premier décrochage de
+score. Deux rerankers :
+- `gap` : heuristique sur les scores de similarité déjà calculés (aucun coût) ;
+- `cross-encoder` : modèle local CPU (sentence-transformers), plus précis.
+
+Choix par la variable d'environnement RERANKER (`none` par défaut).
+"""
+
+import math
+import os
+import threading
+
+RERANKER = os.getenv("RERANKER", "none")
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", 20))
+RERANK_MIN_K = int(os.getenv("RERANK_MIN_K", 1))
+RERANK_MAX_K = int(os.getenv("RERANK_MAX_K", 5))
+CROSS_ENCODER_MODEL = os.getenv("CROSS_ENCODER_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+
+
+def adaptive_cutoff(scored, min_k=RERANK_MIN_K, max_k=RERANK_MAX_K, margin=0.1, max_gap=0.05):
+    """
+    Garde les meilleurs (doc, score) : les `min_k` premiers, puis tant que le
+    score reste à moins de `margin` du meilleur et qu'aucun écart entre deux
+    candidats consécutifs ne dépasse `max_gap`.
+    """
+    ranked = sorted(scored, key=lambda item: item[1], reverse=True)
+    if not ranked:
+        return []
+
+    top = ranked[0][1]
+    kept = ranked[:min_k]
+    for previous, current in zip(ranked[min_k - 1:], ranked[min_k:max_k]):
+        if top - current[1] > margin or previous[1] - current[1] > max_gap:
+            break
+        kept.append(current)
+    return kept
+
+
+class ScoreGapReranker:
+    """Coupure adaptative sur les scores de pertinence du vector store (0..1)"""
+
+    name = "gap"
+
+    def __init__(self, min_k=RERANK_MIN_K, max_k=RERANK_MAX_K, margin=0.1, max_gap=0.05):
+        self.min_k = min_k
+        self.max_k = max_k
+        self.margin = margin
+        self.max_gap = max_gap
+
+    def rerank(self, query, scored):
+        return adaptive_cutoff(scored, self.min_k, self.max_k, self.margin, self.max_gap)
+
+
+class CrossEncoderReranker:
+    """Rescoring (question, chunk) par un cross-encoder local, puis coupure adaptative"""
+
+    name = "cross-encoder"
+    _models = {}
+    _lock = threading.Lock()
+
+    def __init__(self, model_name=CROSS_ENCODER_MODEL, min_k=RERANK_MIN_K, max_k=RERANK_MAX_K,
+                 margin=0.3, max_gap=0.15):
+        self.model_name = model_name
+        self.min_k = min_k
+        self.max_k = max_k
+        self.margin = margin
+        self.max_gap = max_gap
+
+    @property
+    def model(self):
+        # Chargé une fois par processus (quelques secondes au premier appel)
+        with self._lock:
+            if self.model_name not in self._models:
+                from sentence_transformers import CrossEncoder
+                self._models[self.model_name] = CrossEncoder(self.model_name, device="cpu")
+            return self._models[self.model_name]
+
+    def rerank(self, query, scored):
+        if not scored:
+            return []
+        logits = self.model.predict([(query, doc.page_content) for doc, _ in scored])
+        # Logits ramenés dans 0..1 pour que `margin` et `max_gap` gardent un sens stable
+        rescored = [(doc, 1 / (1 + math.exp(-float(logit)))) for (doc, _), logit in zip(scored, logits)]
+        return adaptive_cutoff(rescored, self.min_k, self.max_k, self.margin, self.max_gap)
+
+
+RERANKERS = {
+    "gap": ScoreGapReranker,
+    "cross-encoder": CrossEncoderReranker,
+}
+
+
+def get_reranker(name=RERANKER):
+    """Instancie le reranker configuré, ou None si désactivé"""
+    if not name or name == "none":
+        return None
+    return RERANKERS[name]()
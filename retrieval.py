@@ -0,0 +1,194 @@
+"""
+Recherche de contexte pour le chat, avec cache de résultats.
+
+Deux niveaux de clé, tous deux limités au département de l'utilisateur et à
+la version courante de la collection (cf. `ingestion.collection_version`) :
+- L1 : texte normalisé de la question -> aucune requête d'embedding ni recherche ;
+- L2 : embedding quantifié -> la recherche ANN est évitée pour des questions
+  formulées différemment mais au vecteur quasi identique.
+
+Le cache est un LRU commun au processus, borné en nombre d'entrées et en mémoire.
+"""
+
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.runnables import RunnableLambda
+
+from ingestion import collection_version, normalize_text
+from rerank import RERANK_FETCH_K
+
+RETRIEVAL_CACHE_MAX_BYTES = int(os.getenv("RETRIEVAL_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", 2048))
+# Pas de quantification des composantes de l'embedding pour la clé L2
+EMBEDDING_QUANT_STEP = float(os.getenv("EMBEDDING_QUANT_STEP", 1 / 128))
+
+
+def quantize(embedding, step=EMBEDDING_QUANT_STEP) -> str:
+    """Clé stable d'un embedding : composantes arrondies au pas `step`"""
+    levels = np.clip(np.round(np.asarray(embedding, dtype=np.float32) / step), -127, 127).astype(np.int8)
+    return hashlib.blake2b(levels.tobytes(), digest_size=16).hexdigest()
+
+
+def _docs_size(docs) -> int:
+    """Estimation de l'empreinte mémoire d'une liste de documents"""
+    return sum(sys.getsizeof(d.page_content) + sys.getsizeof(repr(d.metadata)) for d in docs) + 64
+
+
+class RetrievalCache:
+    """LRU à deux niveaux : texte normalisé -> clé d'embedding -> documents"""
+
+    def __init__(self, max_bytes=RETRIEVAL_CACHE_MAX_BYTES, max_entries=RETRIEVAL_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._texts = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits_text = 0
+        self.hits_embedding = 0
+        self.misses = 0
+
+    def _check_version(self, version):
+        # Une nouvelle version rend toutes les entrées inaccessibles : on libère la mémoire
+        if version != self._version:
+            self._results.clear()
+            self._texts.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get_by_text(self, scope, version, text):
+        with self._lock:
+            self._check_version(version)
+            emb_key = self._texts.get((scope, text))
+            if emb_key is None or (scope, emb_key) not in self._results:
+                return None
+            self._texts.move_to_end((scope, text))
+            self._results.move_to_end((scope, emb_key))
+            self.hits_text += 1
+            return list(self._results[(scope, emb_key)][0])
+
+    def get_by_embedding(self, scope, version, text, emb_key):
+        with self._lock:
+            self._check_version(version)
+            entry = self._results.get((scope, emb_key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end((scope, emb_key))
+            self._texts[(scope, text)] = emb_key
+            self.hits_embedding += 1
+            return list(entry[0])
+
+    def put(self, scope, version, text, emb_key, docs):
+        size = _docs_size(docs)
+        with self._lock:
+            self._check_version(version)
+            previous = self._results.pop((scope, emb_key), None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._results[(scope, emb_key)] = (list(docs), size)
+            self._texts[(scope, text)] = emb_key
+            self._bytes += size
+
+            while self._results and (self._bytes > self.max_bytes or len(self._results) > self.max_entries):
+                _, (_, evicted_size) = self._results.popitem(last=False)
+                self._bytes -= evicted_size
+            # Les clés texte orphelines sont purgées paresseusement (get_by_text vérifie L2)
+            while len(self._texts) > self.max_entries * 4:
+                self._texts.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits_text + self.hits_embedding + self.misses
+            return {
+                "entries": len(self._results),
+                "bytes": self._bytes,
+                "hits_text": self.hits_text,
+                "hits_embedding": self.hits_embedding,
+                "misses": self.misses,
+                "hit_rate": (self.hits_text + self.hits_embedding) / lookups if lookups else 0,
+            }
+
+
+# Cache partagé par toutes les sessions du processus
+retrieval_cache = RetrievalCache()
+
+
+class CachedRetriever:
+    """
+    Équivalent du retriever `similarity_score_threshold` de Chroma, avec cache,
+    reclassement optionnel (cf. `rerank`) et expansion des chunks en sections
+    parentes (cf. `docstore`).
+    `as_runnable()` s'insère dans une chaîne LCEL (`retriever.as_runnable() | format_docs`).
+    """
+
+    def __init__(self, vector_store, department, k=5, score_threshold=0.5, cache=retrieval_cache,
+                 embed_query=None, reranker=None, fetch_k=RERANK_FETCH_K, expander=None):
+        self.vector_store = vector_store
+        self.department = department
+        self.k = k
+        self.score_threshold = score_threshold
+        self.cache = cache
+        self._embed_query = embed_query
+        self.reranker = reranker
+        self.expander = expander
+        # Sur-échantillonnage uniquement si un reranker fait le tri ensuite
+        self.fetch_k = max(fetch_k, k) if reranker is not None else k
+
+    @property
+    def scope(self):
+        reranker = self.reranker.name if self.reranker is not None else None
+        return self.department, self.k, self.score_threshold, reranker, self.expander is not None
+
+    def embed(self, query):
+        embed_query = self._embed_query or self.vector_store.embeddings.embed_query
+        return embed_query(query)
+
+    def search(self, embedding):
+        """Recherche ANN par vecteur ; retourne les (doc, score de pertinence) au-dessus du seuil"""
+        results = self.vector_store.similarity_search_by_vector_with_relevance_scores(embedding, k=self.fetch_k)
+        relevance = self.vector_store._select_relevance_score_fn()
+        scored = [(doc, relevance(distance)) for doc, distance in results]
+        return [(doc, score) for doc, score in scored if score >= self.score_threshold]
+
+    def select(self, query, scored):
+        """Chunks transmis au prompt : top-k direct, ou coupure adaptative du reranker"""
+        if self.reranker is None:
+            return [doc for doc, _ in scored[:self.k]]
+        return [doc for doc, _ in self.reranker.rerank(query, scored)]
+
+    def retrieve(self, query, embedding=None):
+        """Recherche sans cache (utilisée aussi par les benchmarks)"""
+        embedding = embedding if embedding is not None else self.embed(query)
+        docs = self.select(query, self.search(embedding))
+        return self.expander.expand(docs) if self.expander is not None else docs
+
+    def invoke(self, query, config=None):
+        if self.cache is None:
+            return self.retrieve(query)
+
+        text = normalize_text(query)
+        version = collection_version()
+
+        docs = self.cache.get_by_text(self.scope, version, text)
+        if docs is not None:
+            return docs
+
+        embedding = self.embed(query)
+        emb_key = quantize(embedding)
+        docs = self.cache.get_by_embedding(self.scope, version, text, emb_key)
+        if docs is not None:
+            return docs
+
+        docs = self.retrieve(query, embedding)
+        self.cache.put(self.scope, version, text, emb_key, docs)
+        return docs
+
+    def as_runnable(self):
+        return RunnableLambda(self.invoke)
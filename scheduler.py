@@ -0,0 +1,225 @@
+"""
+Planificateur de maintenance en tâche de fond.
+
+Chaque processus Streamlit possède un planificateur, mais seules les tâches
+`leader_only=False` tournent partout : les autres (expiration des sessions
+fantômes, rollups, préchauffage de caches, GC) ne sont exécutées que par le
+processus qui détient le verrou de leader.
+"""
+
+import fcntl
+import os
+import threading
+import time
+import traceback
+from datetime import datetime
+
+TICK_SECONDS = 1
+LOCK_FILE = os.getenv("SCHEDULER_LOCK_FILE", "/tmp/chatbot_scheduler.lock")
+
+
+# ===== VERROUS DE LEADER =====
+
+class FileLeaderLock:
+    """Verrou de leader par fichier (processus d'une même machine)"""
+
+    def __init__(self, path=LOCK_FILE):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class PostgresLeaderLock:
+    """
+    Verrou de leader via `pg_try_advisory_lock` (plusieurs machines).
+    Le verrou est lié à une connexion dédiée, gardée ouverte tant qu'on est leader.
+    Elle est vérifiée à chaque tentative : `closed` reste à 0 quand le serveur
+    coupe la session, alors que le verrou est déjà libéré pour les autres.
+    """
+
+    def __init__(self, connect, key=827_001):
+        self._connect = connect
+        self.key = key
+        self._conn = None
+
+    def _alive(self) -> bool:
+        try:
+            cursor = self._conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception as e:
+            print(f"⚠️ Connexion du verrou de leader perdue : {e}")
+            self.release()
+            return False
+
+    def try_acquire(self) -> bool:
+        if self._conn is not None and not self._conn.closed and self._alive():
+            return True
+        self.release()
+        conn = self._connect()
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (self.key,))
+            acquired = cursor.fetchone()[0]
+            cursor.close()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    def release(self):
+        if self._conn is not None and not self._conn.closed:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._conn = None
+
+
+# ===== PLANIFICATEUR =====
+
+class Scheduler:
+    """Exécute des tâches périodiques dans un thread démon et mesure leurs durées"""
+
+    def __init__(self, lock=None):
+        self.lock = lock or FileLeaderLock()
+        self._jobs = {}
+        self._mutex = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        # Protège le verrou de leader (remplacement pendant une tentative d'acquisition)
+        self._lock_guard = threading.Lock()
+        self.is_leader = False
+
+    def set_lock(self, lock):
+        """Remplace le verrou de leader, en libérant l'ancien s'il était détenu"""
+        with self._lock_guard:
+            previous, self.lock = self.lock, lock
+            self.is_leader = False
+            previous.release()
+
+    def register(self, name, func, interval, leader_only=True, run_at_start=False):
+        """Enregistre (ou remplace) une tâche exécutée toutes les `interval` secondes"""
+        with self._mutex:
+            previous = self._jobs.get(name, {})
+            self._jobs[name] = {
+                "func": func,
+                "interval": interval,
+                "leader_only": leader_only,
+                "next_run": time.monotonic() if run_at_start else time.monotonic() + interval,
+                "runs": previous.get("runs", 0),
+                "failures": previous.get("failures", 0),
+                "total_duration": previous.get("total_duration", 0.0),
+                "last_duration": previous.get("last_duration"),
+                "last_run": previous.get("last_run"),
+                "last_error": previous.get("last_error"),
+            }
+
+    def run_now(self, name):
+        """Exécute immédiatement une tâche (hors planning), ex. depuis l'admin"""
+        with self._mutex:
+            job = self._jobs[name]
+        self._execute(name, job)
+
+    def _execute(self, name, job):
+        start = time.perf_counter()
+        try:
+            job["func"]()
+            job["last_error"] = None
+        except Exception as e:
+            job["failures"] += 1
+            job["last_error"] = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+        finally:
+            duration = time.perf_counter() - start
+            job["runs"] += 1
+            job["last_duration"] = duration
+            job["total_duration"] += duration
+            job["last_run"] = datetime.now()
+            job["next_run"] = time.monotonic() + job["interval"]
+
+    def _due_jobs(self):
+        now = time.monotonic()
+        with self._mutex:
+            return [(name, job) for name, job in self._jobs.items() if job["next_run"] <= now]
+
+    def _run(self):
+        while not self._stop.wait(TICK_SECONDS):
+            due = self._due_jobs()
+            if not due:
+                continue
+
+            if any(job["leader_only"] for _, job in due):
+                with self._lock_guard:
+                    try:
+                        self.is_leader = self.lock.try_acquire()
+                    except Exception as e:
+                        print(f"⚠️ Verrou de leader indisponible : {e}")
+                        self.is_leader = False
+
+            for name, job in due:
+                if job["leader_only"] and not self.is_leader:
+                    job["next_run"] = time.monotonic() + job["interval"]
+                    continue
+                self._execute(name, job)
+
+    def start(self):
+        """Démarre le thread du planificateur (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="maintenance-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock_guard:
+            self.lock.release()
+            self.is_leader = False
+
+    def stats(self):
+        """Durées et état des tâches, pour affichage dans l'administration"""
+        with self._mutex:
+            return [
+                {
+                    "job": name,
+                    "interval": job["interval"],
+                    "leader_only": job["leader_only"],
+                    "runs": job["runs"],
+                    "failures": job["failures"],
+                    "last_run": job["last_run"],
+                    "last_duration": job["last_duration"],
+                    "avg_duration": job["total_duration"] / job["runs"] if job["runs"] else None,
+                    "last_error": job["last_error"],
+                }
+                for name, job in self._jobs.items()
+            ]
+
+
+# Planificateur partagé par tous les modules du processus
+scheduler = Scheduler()
@@ -0,0 +1,149 @@
+"""
+Vecteurs de phrases des chunks, calculés à l'indexation.
+
+Chaque chunk est découpé en phrases dont les embeddings sont stockés (SQLite,
+float32) sous l'empreinte du chunk (`chunk_hash`) : un chunk identique dans
+deux documents ou conservé lors d'une mise à jour n'est embeddé qu'une fois.
+Utilisé par `compression` pour ne garder que les phrases utiles d'un contexte.
+"""
+
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+
+import numpy as np
+
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "1") == "1"
+SENTENCE_INDEX_PATH = os.getenv("SENTENCE_INDEX_PATH", os.path.join("./collections", "sentence_vectors.db"))
+SENTENCE_WRITE_BATCH = 1000
+MIN_SENTENCE_LENGTH = 15
+
+# Fin de phrase suivie d'une majuscule, d'un chiffre ou d'une puce ; ou saut de ligne
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;:])\s+(?=[A-ZÀ-Ý0-9«\"(•\-])|\n+")
+
+
+def split_sentences(text: str) -> list:
+    """
+    Découpe un chunk en phrases. Les fragments trop courts (titres, « Article 12 : »)
+    sont rattachés à la phrase suivante, ou à la précédente en fin de chunk.
+    """
+    sentences, pending = [], ""
+    for part in _SENTENCE_BOUNDARY.split(text):
+        part = " ".join(part.split())
+        if not part:
+            continue
+        part = f"{pending} {part}".strip()
+        if len(part) < MIN_SENTENCE_LENGTH:
+            pending = part
+            continue
+        sentences.append(part)
+        pending = ""
+    if pending:
+        if sentences:
+            sentences[-1] = f"{sentences[-1]} {pending}"
+        else:
+            sentences.append(pending)
+    return sentences
+
+
+def model_key(embeddings) -> str:
+    """Identifiant du modèle d'embeddings (les vecteurs de modèles différents ne se mélangent pas)"""
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+
+class SentenceIndex:
+    """Phrases et vecteurs par (modèle, empreinte de chunk)"""
+
+    def __init__(self, path=SENTENCE_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_sentences (
+                    model TEXT NOT NULL,
+                    chunk_hash TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    sentence TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, chunk_hash, position)
+                )
+            """)
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, model, chunk_hashes) -> dict:
+        """{chunk_hash: [(phrase, vecteur numpy), ...]} pour les chunks indexés"""
+        chunk_hashes = list(set(chunk_hashes))
+        if not chunk_hashes:
+            return {}
+        with self._conn() as conn:
+            rows = conn.execute(
+                f"SELECT chunk_hash, sentence, vector FROM chunk_sentences WHERE model = ? "
+                f"AND chunk_hash IN ({','.join('?' * len(chunk_hashes))}) ORDER BY chunk_hash, position",
+                [model] + chunk_hashes
+            ).fetchall()
+        result = {}
+        for h, sentence, vector in rows:
+            result.setdefault(h, []).append((sentence, np.frombuffer(vector, dtype=np.float32)))
+        return result
+
+    def missing(self, model, chunk_hashes) -> set:
+        chunk_hashes = list(set(chunk_hashes))
+        if not chunk_hashes:
+            return set()
+        with self._conn() as conn:
+            present = {row[0] for row in conn.execute(
+                f"SELECT DISTINCT chunk_hash FROM chunk_sentences WHERE model = ? "
+                f"AND chunk_hash IN ({','.join('?' * len(chunk_hashes))})",
+                [model] + chunk_hashes
+            )}
+        return set(chunk_hashes) - present
+
+    def index(self, embeddings, chunks) -> int:
+        """
+        Embedde les phrases des chunks (liste de (chunk_hash, texte)) non encore indexés,
+        en un seul appel (le découpage en lots revient à `embeddings`, cf. `embedding_scheduler`).
+        Retourne le nombre de phrases ajoutées.
+        """
+        model = model_key(embeddings)
+        todo = self.missing(model, [h for h, _ in chunks])
+        rows = []
+        for h, text in chunks:
+            if h in todo:
+                todo.discard(h)
+                rows.extend((h, position, sentence) for position, sentence in enumerate(split_sentences(text)))
+
+        if not rows:
+            return 0
+        vectors = embeddings.embed_documents([sentence for _, _, sentence in rows])
+        with self._conn() as conn:
+            for i in range(0, len(rows), SENTENCE_WRITE_BATCH):
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_sentences VALUES (?, ?, ?, ?, ?)",
+                    [(model, h, position, sentence, np.asarray(vector, dtype=np.float32).tobytes())
+                     for (h, position, sentence), vector in zip(rows[i:i + SENTENCE_WRITE_BATCH],
+                                                                vectors[i:i + SENTENCE_WRITE_BATCH])]
+                )
+        return len(rows)
+
+    def prune(self, live_hashes) -> int:
+        """Supprime les phrases des chunks qui ne sont plus dans la collection"""
+        with self._conn() as conn:
+            conn.execute("CREATE TEMP TABLE live (chunk_hash TEXT PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO live VALUES (?)", [(h,) for h in live_hashes])
+            return conn.execute(
+                "DELETE FROM chunk_sentences WHERE chunk_hash NOT IN (SELECT chunk_hash FROM live)"
+            ).rowcount
+
+
+# Index partagé du processus (None si la compression est désactivée)
+sentence_index = SentenceIndex() if CONTEXT_COMPRESSION else None
@@ -0,0 +1,302 @@
+"""
+Store de sessions côté serveur.
+
+Les sessions vivent en mémoire et sont identifiées par un jeton opaque (le
+seul élément stocké dans le cookie). Un backend optionnel (SQLite ou
+PostgreSQL) permet de retrouver les sessions après un redémarrage.
+Les mises à jour de `last_activity` sont regroupées et écrites toutes les
+`flush_interval` secondes ; les sessions inactives expirent en tâche de fond.
+"""
+
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+IDLE_TIMEOUT = int(os.getenv("SESSION_IDLE_TIMEOUT", 8 * 3600))
+FLUSH_INTERVAL = int(os.getenv("SESSION_FLUSH_INTERVAL", 30))
+
+
+def _token_key(token: str) -> str:
+    """Le backend ne stocke jamais le jeton brut, seulement son empreinte"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# ===== BACKENDS DE PERSISTANCE =====
+
+class _SQLBackend:
+    """Base commune SQLite / PostgreSQL (seul le style de paramètre change)"""
+
+    placeholder = "?"
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def _sql(self, query: str) -> str:
+        return query.replace("?", self.placeholder)
+
+    def init_schema(self):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS server_sessions (
+                    token_hash VARCHAR(64) PRIMARY KEY,
+                    matricule VARCHAR(50) NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at TIMESTAMP NOT NULL,
+                    last_activity TIMESTAMP NOT NULL
+                )
+            """)
+            cursor.close()
+
+    def save(self, token_hash, session):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self._sql("DELETE FROM server_sessions WHERE token_hash = ?"), (token_hash,))
+            cursor.execute(
+                self._sql("""INSERT INTO server_sessions (token_hash, matricule, payload, created_at, last_activity)
+                             VALUES (?, ?, ?, ?, ?)"""),
+                (token_hash, session["matricule"], json.dumps(session["user"]),
+                 datetime.fromtimestamp(session["created_at"]),
+                 datetime.fromtimestamp(session["last_activity"]))
+            )
+            cursor.close()
+
+    def load(self, token_hash):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql("""SELECT matricule, payload, created_at, last_activity
+                             FROM server_sessions WHERE token_hash = ?"""),
+                (token_hash,)
+            )
+            row = cursor.fetchone()
+            cursor.close()
+
+        if not row:
+            return None
+        matricule, payload, created_at, last_activity = tuple(row)
+        return {
+            "matricule": matricule,
+            "user": json.loads(payload),
+            "created_at": _to_epoch(created_at),
+            "last_activity": _to_epoch(last_activity),
+        }
+
+    def touch_many(self, updates):
+        """updates : liste de (token_hash, matricule, last_activity)"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                self._sql("UPDATE server_sessions SET last_activity = ? WHERE token_hash = ?"),
+                [(datetime.fromtimestamp(ts), token_hash) for token_hash, _, ts in updates]
+            )
+            cursor.executemany(
+                self._sql("UPDATE user_sessions SET last_activity = ? WHERE matricule = ? AND is_active = 1"),
+                [(datetime.fromtimestamp(ts), matricule) for _, matricule, ts in updates]
+            )
+            cursor.close()
+
+    def delete_many(self, token_hashes, matricules=()):
+        """Supprime les sessions et marque les utilisateurs correspondants comme déconnectés"""
+        now = datetime.now()
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                self._sql("DELETE FROM server_sessions WHERE token_hash = ?"),
+                [(token_hash,) for token_hash in token_hashes]
+            )
+            cursor.executemany(
+                self._sql("""UPDATE user_sessions SET is_active = 0, logout_time = ?
+                             WHERE matricule = ? AND is_active = 1"""),
+                [(now, matricule) for matricule in matricules]
+            )
+            cursor.close()
+
+    def delete_idle(self, cutoff):
+        """Purge les sessions persistées inactives depuis `cutoff` (epoch)"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql("DELETE FROM server_sessions WHERE last_activity < ?"),
+                (datetime.fromtimestamp(cutoff),)
+            )
+            cursor.close()
+
+
+class SQLiteSessionBackend(_SQLBackend):
+    """Persistance des sessions dans la base SQLite de l'application"""
+
+    def __init__(self, db_path="users.db"):
+        self.db_path = db_path
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class PostgresSessionBackend(_SQLBackend):
+    """Persistance des sessions dans PostgreSQL via le context manager de connexion existant"""
+
+    placeholder = "%s"
+
+    def __init__(self, get_connection):
+        self._get_connection = get_connection
+
+    def _connect(self):
+        return self._get_connection()
+
+
+def _to_epoch(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+
+# ===== STORE EN MÉMOIRE =====
+
+class SessionStore:
+    """
+    Sessions en mémoire indexées par jeton opaque.
+    `touch` ne fait qu'une écriture mémoire ; la persistance est différée.
+    """
+
+    def __init__(self, backend=None, idle_timeout=IDLE_TIMEOUT, flush_interval=FLUSH_INTERVAL):
+        self.backend = backend
+        self.idle_timeout = idle_timeout
+        self.flush_interval = flush_interval
+        self._sessions = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+        if self.backend is not None:
+            self.backend.init_schema()
+
+    def create(self, user: dict) -> str:
+        """Ouvre une session pour `user` et retourne le jeton à placer dans le cookie"""
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        session = {
+            "matricule": user["matricule"],
+            "user": dict(user),
+            "created_at": now,
+            "last_activity": now,
+        }
+        with self._lock:
+            self._sessions[_token_key(token)] = session
+
+        if self.backend is not None:
+            self.backend.save(_token_key(token), session)
+        return token
+
+    def get(self, token: str):
+        """Retourne les informations utilisateur de la session, ou None si absente/expirée"""
+        if not token:
+            return None
+        key = _token_key(token)
+        now = time.time()
+
+        with self._lock:
+            session = self._sessions.get(key)
+
+        if session is None and self.backend is not None:
+            session = self.backend.load(key)
+            if session is not None:
+                with self._lock:
+                    self._sessions.setdefault(key, session)
+
+        if session is None or now - session["last_activity"] > self.idle_timeout:
+            return None
+        return session["user"]
+
+    def touch(self, token: str):
+        """Met à jour l'activité en mémoire ; l'écriture en base est regroupée"""
+        if not token:
+            return
+        key = _token_key(token)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                session["last_activity"] = time.time()
+                self._dirty.add(key)
+
+    def revoke(self, token: str):
+        """Ferme une session (déconnexion)"""
+        if not token:
+            return
+        key = _token_key(token)
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            self._dirty.discard(key)
+
+        if self.backend is not None:
+            matricules = [session["matricule"]] if session else []
+            self.backend.delete_many([key], matricules)
+
+    def flush(self) -> int:
+        """Écrit en un lot les `last_activity` modifiées depuis le dernier flush"""
+        with self._lock:
+            updates = [
+                (key, self._sessions[key]["matricule"], self._sessions[key]["last_activity"])
+                for key in self._dirty if key in self._sessions
+            ]
+            self._dirty.clear()
+
+        if updates and self.backend is not None:
+            self.backend.touch_many(updates)
+        return len(updates)
+
+    def expire_idle(self) -> int:
+        """Supprime les sessions inactives depuis plus de `idle_timeout` secondes"""
+        cutoff = time.time() - self.idle_timeout
+        with self._lock:
+            expired = {key: s for key, s in self._sessions.items() if s["last_activity"] < cutoff}
+            for key in expired:
+                self._sessions.pop(key, None)
+                self._dirty.discard(key)
+
+        if self.backend is not None:
+            if expired:
+                self.backend.delete_many(list(expired), {s["matricule"] for s in expired.values()})
+            self.backend.delete_idle(cutoff)
+        return len(expired)
+
+    def active_count(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    # --- Tâche de fond ---
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self.expire_idle()
+            except Exception as e:
+                print(f"⚠️ Maintenance des sessions en échec : {e}")
+
+    def start(self):
+        """Démarre le thread de flush/expiration (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="session-store", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
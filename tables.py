@@ -0,0 +1,161 @@
+"""
+Extraction des tableaux (tableurs et PDF) en chunks compacts.
+
+Chaque ligne d'un tableau devient un enregistrement autonome qui répète ses
+en-têtes (« Emploi : Technicien | Échelon : 2 | Salaire : 2 150 »), et les
+lignes consécutives sont regroupées en chunks d'au plus TABLE_GROUP_CHARS
+caractères, précédés du titre du tableau. Une grille de salaires ou un
+barème se retrouve ainsi avec un ou deux chunks, au lieu d'un CSV découpé
+arbitrairement ou d'un texte PDF en désordre.
+
+Les chunks portent des métadonnées structurées (`chunk_role="table_rows"`,
+`table_id`, `table_title`, `table_columns`, `row_start`, `row_end`) et ne sont
+pas redécoupés par `chunking`. Dans les PDF, les tableaux sont détectés avec
+PyMuPDF (`find_tables`) et retirés du texte de la page ; sans PyMuPDF, le
+découpeur par structure garde déjà les lignes alignées ensemble.
+"""
+
+import math
+import os
+from datetime import date, datetime, time
+
+import pandas as pd
+from langchain_core.documents import Document
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+TABLE_EXTRACTION = os.getenv("TABLE_EXTRACTION", "1") == "1"
+TABLE_GROUP_CHARS = int(os.getenv("TABLE_GROUP_CHARS", 800))
+MIN_TABLE_COLUMNS = 2
+MIN_TABLE_ROWS = 2
+TABLE_ROLE = "table_rows"
+
+
+def _cell(value) -> str:
+    """Valeur de cellule lisible : entiers sans décimale, dates ISO, vides ignorés"""
+    # NaT (date vide d'un tableur) est une instance de datetime sans heure : à tester avant
+    if value is None or value is pd.NaT or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime):
+        return value.date().isoformat() if value.time() == time.min else value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    return " ".join(str(value).split())
+
+
+def row_record(headers, row) -> str:
+    """« En-tête : valeur | ... » pour les cellules non vides"""
+    cells = []
+    for i, value in enumerate(row):
+        text = _cell(value)
+        if not text:
+            continue
+        header = headers[i] if i < len(headers) and headers[i] else f"Colonne {i + 1}"
+        cells.append(f"{header} : {text}")
+    return " | ".join(cells)
+
+
+def table_documents(headers, rows, title, table_id, metadata=None) -> list:
+    """Chunks d'un tableau : groupes de lignes consécutives, titre en tête"""
+    headers = [_cell(h) for h in headers]
+    base = dict(metadata or {})
+    base.update({
+        "chunk_role": TABLE_ROLE,
+        "table_id": table_id,
+        "table_title": title,
+        "table_columns": " | ".join(h for h in headers if h),
+    })
+
+    records = [(i, row_record(headers, row)) for i, row in enumerate(rows)]
+    records = [(i, record) for i, record in records if record]
+    docs, group = [], []
+
+    def flush():
+        if group:
+            content = "\n".join(([title] if title else []) + [record for _, record in group])
+            docs.append(Document(page_content=content, metadata=dict(
+                base, row_start=group[0][0], row_end=group[-1][0], row_count=len(group))))
+
+    size = len(title)
+    for i, record in records:
+        if group and size + len(record) + 1 > TABLE_GROUP_CHARS:
+            flush()
+            group, size = [], len(title)
+        group.append((i, record))
+        size += len(record) + 1
+    flush()
+    return docs
+
+
+def is_table_chunk(doc) -> bool:
+    return doc.metadata.get("chunk_role") == TABLE_ROLE
+
+
+# ===== TABLEURS =====
+
+def dataframe_documents(frames, filename) -> list:
+    """Chunks des feuilles d'un tableur ({nom de feuille: DataFrame})"""
+    docs = []
+    for sheet, df in frames.items():
+        df = df.dropna(how="all").dropna(axis=1, how="all")
+        if df.empty:
+            continue
+        headers = [str(c) if not str(c).startswith("Unnamed:") else "" for c in df.columns]
+        title = filename if len(frames) == 1 else f"{filename} — {sheet}"
+        metadata = {"sheet": str(sheet)} if len(frames) > 1 else {}
+        docs.extend(table_documents(headers, df.itertuples(index=False, name=None), title,
+                                    f"sheet:{sheet}", metadata))
+    return docs
+
+
+# ===== PDF =====
+
+def _page_tables(page):
+    """[(bbox, en-têtes, lignes)] des tableaux détectés sur la page"""
+    tables = []
+    for table in page.find_tables().tables:
+        rows = table.extract()
+        headers = list(table.header.names)
+        if not table.header.external and rows and rows[0] == headers:
+            rows = rows[1:]
+        if len(headers) >= MIN_TABLE_COLUMNS and len(rows) >= MIN_TABLE_ROWS:
+            tables.append((fitz.Rect(table.bbox), headers, rows))
+    return tables
+
+
+def split_pdf_tables(data, pages) -> tuple:
+    """
+    Sépare les tableaux du texte des pages d'un PDF.
+    Retourne (pages dont le texte exclut les tableaux, chunks des tableaux).
+    Les pages OCRisées sont laissées telles quelles.
+    """
+    if fitz is None or not TABLE_EXTRACTION:
+        return pages, []
+
+    by_page = {p.metadata.get("page"): p for p in pages if not p.metadata.get("ocr_processed")}
+    table_docs = []
+    with fitz.open(stream=data, filetype="pdf") as pdf:
+        for page_num, page in by_page.items():
+            if page_num is None or page_num >= len(pdf):
+                continue
+            tables = _page_tables(pdf[page_num])
+            if not tables:
+                continue
+
+            blocks = [b for b in pdf[page_num].get_text("blocks") if b[6] == 0]
+            outside = [b for b in blocks if not any(fitz.Rect(b[:4]).intersects(bbox) for bbox, _, _ in tables)]
+            page.page_content = "\n".join(b[4].strip() for b in outside)
+
+            for idx, (bbox, headers, rows) in enumerate(tables):
+                # Titre : dernier bloc de texte au-dessus du tableau
+                above = [b for b in outside if b[3] <= bbox.y0 + 1]
+                title = " ".join(max(above, key=lambda b: b[3])[4].split()) if above \
+                    else f"Tableau page {page_num + 1}"
+                table_docs.extend(table_documents(headers, rows, title, f"p{page_num}t{idx}",
+                                                  {"page": page_num, "ocr_processed": False}))
+    return pages, table_docs
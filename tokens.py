@@ -0,0 +1,22 @@
+"""
+Comptage de tokens pour les budgets de prompt et le dimensionnement des lots d'embedding.
+"""
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Nombre de tokens (tiktoken si disponible, sinon ~4 caractères par token)"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:max_tokens])
+    return text[:max_tokens * 4]
@@ -0,0 +1,253 @@
+"""
+Annuaire des utilisateurs pour les pages d'administration.
+
+Le filtrage, la recherche et le tri sont faits en SQL (et non plus en pandas
+sur la table complète) :
+- recherche par préfixe sur le matricule, le nom ou le prénom, servie par index ;
+- pagination par clé (keyset) : la page suivante repart de la dernière ligne
+  affichée, sans OFFSET ;
+- un seul GROUP BY alimente toutes les tuiles de comptage par rôle ;
+- la suppression groupée est une seule requête, l'import en masse un upsert par lot.
+"""
+
+import sqlite3
+from contextlib import contextmanager
+
+PAGE_SIZE = 50
+
+# Colonnes de tri (la dernière rend la clé unique) et sens de parcours
+SORTS = {
+    "nom": (("nom", "prenom", "matricule"), "ASC"),
+    "nom_desc": (("nom", "prenom", "matricule"), "DESC"),
+    "role": (("role", "nom", "matricule"), "ASC"),
+    "matricule": (("matricule",), "ASC"),
+}
+
+COLUMNS = ("matricule", "nom", "prenom", "email", "role")
+
+
+class _UserDirectory:
+    """Base commune SQLite / PostgreSQL (paramètres et recherche par préfixe diffèrent)"""
+
+    placeholder = "?"
+    indexes = ()
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def _sql(self, query: str) -> str:
+        return query.replace("?", self.placeholder)
+
+    def _prefix_clause(self, column, prefix):
+        """Retourne (condition SQL, paramètres) pour `column` commençant par `prefix`"""
+        raise NotImplementedError
+
+    def _folded(self, column, term):
+        """Retourne (expression, terme) à comparer sans tenir compte de la casse, repliés de la même façon"""
+        raise NotImplementedError
+
+    def ensure_indexes(self):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            for statement in self.indexes:
+                cursor.execute(statement)
+            cursor.close()
+
+    def _where(self, search=None, role=None):
+        clauses, params = [], []
+        if role:
+            clauses.append("role = ?")
+            params.append(role)
+
+        search = (search or "").strip()
+        if search:
+            parts = []
+            for column, term in (("matricule", search), self._folded("nom", search),
+                                 self._folded("prenom", search)):
+                clause, clause_params = self._prefix_clause(column, term)
+                parts.append(clause)
+                params.extend(clause_params)
+            clauses.append("(" + " OR ".join(parts) + ")")
+        return clauses, params
+
+    def list_users(self, search=None, role=None, sort="nom", after=None, limit=PAGE_SIZE):
+        """
+        Retourne (lignes, curseur de la page suivante ou None).
+        `after` est le curseur renvoyé par l'appel précédent.
+        """
+        columns, direction = SORTS[sort]
+        clauses, params = self._where(search, role)
+
+        if after is not None:
+            operator = ">" if direction == "ASC" else "<"
+            clauses.append(f"({', '.join(columns)}) {operator} ({', '.join('?' * len(columns))})")
+            params.extend(after)
+
+        query = f"SELECT {', '.join(COLUMNS)} FROM users"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += f" ORDER BY {', '.join(f'{c} {direction}' for c in columns)} LIMIT ?"
+        params.append(limit + 1)
+
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self._sql(query), params)
+            rows = [dict(zip(COLUMNS, row)) for row in cursor.fetchall()]
+            cursor.close()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = tuple(rows[-1][c] for c in columns)
+        return rows, next_cursor
+
+    def count_users(self, search=None, role=None) -> int:
+        clauses, params = self._where(search, role)
+        query = "SELECT COUNT(*) FROM users"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self._sql(query), params)
+            count = cursor.fetchone()[0]
+            cursor.close()
+        return count
+
+    def role_counts(self) -> dict:
+        """Nombre d'utilisateurs par rôle, en une requête (tuiles et vue par département)"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT role, COUNT(*) FROM users GROUP BY role")
+            counts = {role: count for role, count in cursor.fetchall()}
+            cursor.close()
+        return counts
+
+    def existing_matricules(self, matricules) -> set:
+        """Sous-ensemble de `matricules` déjà présents dans la table"""
+        matricules = list(matricules)
+        if not matricules:
+            return set()
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql(f"SELECT matricule FROM users WHERE matricule IN ({','.join('?' * len(matricules))})"),
+                matricules
+            )
+            found = {row[0] for row in cursor.fetchall()}
+            cursor.close()
+        return found
+
+    def upsert_users(self, rows):
+        """
+        Insère ou met à jour un lot de (matricule, nom, prenom, email, password_hash, role).
+        Un hash ou un rôle vide conserve la valeur existante.
+        """
+        raise NotImplementedError
+
+    def delete_users(self, matricules) -> int:
+        raise NotImplementedError
+
+
+UPSERT_SQL = """
+    INSERT INTO users (matricule, nom, prenom, email, password, role) VALUES {values}
+    ON CONFLICT (matricule) DO UPDATE SET
+        nom = excluded.nom,
+        prenom = excluded.prenom,
+        email = excluded.email,
+        role = COALESCE(NULLIF(excluded.role, ''), users.role),
+        password = COALESCE(NULLIF(excluded.password, ''), users.password)
+"""
+
+
+class SQLiteUserDirectory(_UserDirectory):
+    """Annuaire sur la base SQLite de l'application"""
+
+    indexes = (
+        "CREATE INDEX IF NOT EXISTS idx_users_nom ON users(nom, prenom, matricule)",
+        "CREATE INDEX IF NOT EXISTS idx_users_role_nom ON users(role, nom, matricule)",
+        "DROP INDEX IF EXISTS idx_users_nom_lower",
+        "DROP INDEX IF EXISTS idx_users_prenom_lower",
+        "CREATE INDEX IF NOT EXISTS idx_users_nom_nocase ON users(nom COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_users_prenom_nocase ON users(prenom COLLATE NOCASE)",
+    )
+
+    def __init__(self, db_path="users.db"):
+        self.db_path = db_path
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _prefix_clause(self, column, prefix):
+        # Intervalle [préfixe, préfixe + U+10FFFF) : utilisable par l'index, contrairement à LIKE
+        return f"({column} >= ? AND {column} < ?)", [prefix, prefix + "\U0010ffff"]
+
+    def _folded(self, column, term):
+        # lower() de SQLite ne replie que l'ASCII, contrairement à str.lower() : NOCASE des deux côtés
+        return f"{column} COLLATE NOCASE", term
+
+    def upsert_users(self, rows):
+        with self._connect() as conn:
+            conn.executemany(UPSERT_SQL.format(values="(?, ?, ?, ?, ?, ?)"), rows)
+
+    def delete_users(self, matricules) -> int:
+        matricules = list(matricules)
+        if not matricules:
+            return 0
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM users WHERE matricule IN ({','.join('?' * len(matricules))})",
+                matricules
+            )
+            return cursor.rowcount
+
+
+class PostgresUserDirectory(_UserDirectory):
+    """Annuaire PostgreSQL via le context manager de connexion existant"""
+
+    placeholder = "%s"
+    indexes = (
+        "CREATE INDEX IF NOT EXISTS idx_users_nom ON users(nom, prenom, matricule)",
+        "CREATE INDEX IF NOT EXISTS idx_users_role_nom ON users(role, nom, matricule)",
+        "CREATE INDEX IF NOT EXISTS idx_users_matricule_prefix ON users(matricule text_pattern_ops)",
+        "CREATE INDEX IF NOT EXISTS idx_users_nom_prefix ON users(lower(nom) text_pattern_ops)",
+        "CREATE INDEX IF NOT EXISTS idx_users_prenom_prefix ON users(lower(prenom) text_pattern_ops)",
+    )
+
+    def __init__(self, get_connection):
+        self._get_connection = get_connection
+
+    def _connect(self):
+        return self._get_connection()
+
+    def _prefix_clause(self, column, prefix):
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"{column} LIKE ?", [escaped + "%"]
+
+    def _folded(self, column, term):
+        return f"lower({column})", term.lower()
+
+    def upsert_users(self, rows):
+        from psycopg2.extras import execute_values
+
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            # Un seul INSERT multi-lignes par lot (executemany ferait un aller-retour par ligne)
+            execute_values(cursor, UPSERT_SQL.format(values="%s"), rows, page_size=max(len(rows), 1))
+            cursor.close()
+
+    def delete_users(self, matricules) -> int:
+        matricules = list(matricules)
+        if not matricules:
+            return 0
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM users WHERE matricule = ANY(%s)", (matricules,))
+            deleted = cursor.rowcount
+            cursor.close()
+        return deleted
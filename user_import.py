@@ -0,0 +1,269 @@
+"""
+Import en masse d'utilisateurs depuis un export CSV ou LDIF (annuaire LDAP).
+
+Le fichier est lu et validé en flux (une entrée à la fois) ; les lignes
+valides sont regroupées en lots de `batch_size`, dont les mots de passe sont
+hachés en parallèle avant un upsert unique par lot. Chaque ligne du fichier
+reçoit un statut dans le rapport (créé, mis à jour ou erreur).
+"""
+
+import base64
+import csv
+import io
+import os
+import re
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from credentials import hash_password
+
+IMPORT_BATCH_SIZE = int(os.getenv("USER_IMPORT_BATCH_SIZE", 500))
+# scrypt libère le GIL : un thread par cœur suffit à saturer le CPU
+HASH_WORKERS = int(os.getenv("USER_IMPORT_HASH_WORKERS", os.cpu_count() or 4))
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+MIN_MATRICULE_LENGTH = 4
+MIN_PASSWORD_LENGTH = 6
+MAX_LENGTHS = {"matricule": 50, "nom": 100, "prenom": 100, "email": 150}
+
+# Noms de colonnes / attributs LDAP acceptés pour chaque champ
+FIELD_ALIASES = {
+    "matricule": ("matricule", "uid", "employeenumber", "employeeid", "samaccountname"),
+    "nom": ("nom", "sn", "surname", "last_name"),
+    "prenom": ("prenom", "prénom", "givenname", "first_name"),
+    "email": ("email", "mail"),
+    "password": ("password", "mot_de_passe", "userpassword"),
+    "role": ("role", "rôle"),
+}
+
+
+@dataclass
+class ImportReport:
+    """Résultat d'un import : une entrée par ligne du fichier"""
+
+    rows: list = field(default_factory=list)
+    credentials: list = field(default_factory=list)
+    duration: float = 0.0
+
+    def _count(self, status) -> int:
+        return sum(1 for row in self.rows if row["statut"] == status)
+
+    @property
+    def created(self) -> int:
+        return self._count("créé")
+
+    @property
+    def updated(self) -> int:
+        return self._count("mis à jour")
+
+    @property
+    def errors(self) -> int:
+        return self._count("erreur")
+
+
+# ===== LECTURE DES FICHIERS =====
+
+def _normalize_record(raw: dict) -> dict:
+    lowered = {(key or "").strip().lower(): value for key, value in raw.items()}
+    record = {}
+    for name, aliases in FIELD_ALIASES.items():
+        value = next((lowered[a] for a in aliases if lowered.get(a)), "")
+        if isinstance(value, list):
+            value = value[0]
+        record[name] = (value or "").strip()
+
+    # Les mots de passe LDAP exportés sont déjà hachés ({SSHA}...) : inutilisables
+    if record["password"].startswith("{"):
+        record["password"] = ""
+    return record
+
+
+def read_csv(stream):
+    """Itère sur (numéro de ligne, enregistrement) d'un CSV (séparateur , ou ; détecté)"""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.DictReader(text, dialect=dialect)
+    for raw in reader:
+        yield reader.line_num, _normalize_record(raw)
+    text.detach()
+
+
+def read_ldif(stream):
+    """Itère sur (numéro de ligne, enregistrement) d'un export LDIF"""
+    text = io.TextIOWrapper(stream, encoding="utf-8")
+    entry, start, last = {}, None, None
+
+    def _decode(values):
+        return [base64.b64decode(v).decode("utf-8") if is_b64 else v for is_b64, v in values]
+
+    for line_num, raw in enumerate(text, start=1):
+        line = raw.rstrip("\r\n")
+        if line.startswith(" ") and last:
+            is_b64, value = entry[last][-1]
+            entry[last][-1] = (is_b64, value + line[1:])
+            continue
+        if not line:
+            if entry:
+                yield start, _normalize_record({k: _decode(v) for k, v in entry.items()})
+            entry, start, last = {}, None, None
+            continue
+        if line.startswith("#") or ":" not in line:
+            continue
+
+        attr, _, value = line.partition(":")
+        is_b64 = value.startswith(":")
+        value = value[1:].strip() if is_b64 else value.strip()
+        last = attr.strip().lower()
+        entry.setdefault(last, []).append((is_b64, value))
+        start = start or line_num
+
+    if entry:
+        yield start, _normalize_record({k: _decode(v) for k, v in entry.items()})
+    text.detach()
+
+
+def read_records(uploaded_file):
+    """Choisit le lecteur selon l'extension du fichier téléversé"""
+    if uploaded_file.name.lower().endswith(".ldif"):
+        return read_ldif(uploaded_file)
+    return read_csv(uploaded_file)
+
+
+# ===== VALIDATION =====
+
+def validate(records, roles, default_role):
+    """
+    Valide les enregistrements au fil de l'eau.
+    Itère sur (numéro de ligne, enregistrement, message d'erreur ou None).
+    """
+    seen_matricules, seen_emails = set(), set()
+
+    for line_num, record in records:
+        # Sans rôle dans le fichier : rôle par défaut pour un nouveau compte, rôle actuel conservé sinon
+        record["role"] = record["role"] or ""
+        error = None
+
+        missing = [name for name in ("matricule", "nom", "prenom", "email") if not record[name]]
+        too_long = [name for name, size in MAX_LENGTHS.items() if len(record[name]) > size]
+        if missing:
+            error = f"Champ(s) manquant(s) : {', '.join(missing)}"
+        elif too_long:
+            error = f"Champ(s) trop long(s) : {', '.join(too_long)}"
+        elif len(record["matricule"]) < MIN_MATRICULE_LENGTH:
+            error = f"Le matricule doit contenir au moins {MIN_MATRICULE_LENGTH} caractères"
+        elif not EMAIL_PATTERN.match(record["email"]):
+            error = "Format d'email invalide"
+        elif record["password"] and len(record["password"]) < MIN_PASSWORD_LENGTH:
+            error = f"Le mot de passe doit contenir au moins {MIN_PASSWORD_LENGTH} caractères"
+        elif (record["role"] or default_role) not in roles:
+            error = f"Rôle inconnu : {record['role']}"
+        elif record["matricule"] in seen_matricules:
+            error = "Matricule en double dans le fichier"
+        elif record["email"].lower() in seen_emails:
+            error = "Email en double dans le fichier"
+
+        if error is None:
+            seen_matricules.add(record["matricule"])
+            seen_emails.add(record["email"].lower())
+        yield line_num, record, error
+
+
+# ===== IMPORT =====
+
+def _upsert_batch(directory, batch, executor, generate_passwords, default_role, report):
+    """Hache les mots de passe du lot en parallèle puis l'écrit en une requête"""
+    existing = directory.existing_matricules(record["matricule"] for _, record in batch)
+
+    to_hash, ready = [], []
+    for line_num, record in batch:
+        is_new = record["matricule"] not in existing
+        password = record["password"]
+        if not password and is_new:
+            if not generate_passwords:
+                report.rows.append({"ligne": line_num, "matricule": record["matricule"], "statut": "erreur",
+                                    "message": "Mot de passe manquant"})
+                continue
+            password = secrets.token_urlsafe(9)
+            report.credentials.append({"matricule": record["matricule"], "email": record["email"],
+                                       "mot_de_passe": password})
+        if password:
+            to_hash.append((line_num, record, is_new, password))
+        else:
+            # Utilisateur existant sans mot de passe dans le fichier : on conserve l'actuel
+            ready.append((line_num, record, is_new, ""))
+
+    hashes = executor.map(hash_password, [password for *_, password in to_hash])
+    ready.extend((line_num, record, is_new, hashed)
+                 for (line_num, record, is_new, _), hashed in zip(to_hash, hashes))
+    if not ready:
+        return
+
+    def _row(record, is_new, hashed):
+        role = record["role"] or (default_role if is_new else "")
+        return (record["matricule"], record["nom"], record["prenom"], record["email"], hashed, role)
+
+    try:
+        directory.upsert_users([_row(record, is_new, hashed) for _, record, is_new, hashed in ready])
+        results = [(line_num, record, is_new, None) for line_num, record, is_new, _ in ready]
+    except Exception:
+        # Lot refusé (ex. email déjà pris par un autre matricule) : on isole les lignes fautives
+        results = []
+        for line_num, record, is_new, hashed in ready:
+            try:
+                directory.upsert_users([_row(record, is_new, hashed)])
+                results.append((line_num, record, is_new, None))
+            except Exception as e:
+                results.append((line_num, record, is_new, str(e).splitlines()[0]))
+
+    for line_num, record, is_new, error in results:
+        report.rows.append({
+            "ligne": line_num,
+            "matricule": record["matricule"],
+            "statut": "erreur" if error else ("créé" if is_new else "mis à jour"),
+            "message": error or "",
+        })
+    failed = {record["matricule"] for _, record, _, error in results if error}
+    report.credentials = [c for c in report.credentials if c["matricule"] not in failed]
+
+
+def import_users(records, directory, roles, default_role, batch_size=IMPORT_BATCH_SIZE,
+                 generate_passwords=True, progress=None) -> ImportReport:
+    """
+    Importe des utilisateurs (itérable de (ligne, enregistrement), cf. `read_records`).
+    Les mots de passe absents sont générés pour les nouveaux comptes si
+    `generate_passwords` ; ils figurent alors dans `report.credentials`.
+    `progress(n)` est appelé après chaque lot avec le nombre de lignes traitées.
+    """
+    report = ImportReport()
+    start = time.perf_counter()
+    batch = []
+
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="user-import") as executor:
+        for line_num, record, error in validate(records, roles, default_role):
+            if error:
+                report.rows.append({"ligne": line_num, "matricule": record["matricule"], "statut": "erreur",
+                                    "message": error})
+                continue
+            batch.append((line_num, record))
+            if len(batch) >= batch_size:
+                _upsert_batch(directory, batch, executor, generate_passwords, default_role, report)
+                batch = []
+                if progress:
+                    progress(len(report.rows))
+
+        if batch:
+            _upsert_batch(directory, batch, executor, generate_passwords, default_role, report)
+            if progress:
+                progress(len(report.rows))
+
+    report.rows.sort(key=lambda row: row["ligne"])
+    report.duration = time.perf_counter() - start
+    return report
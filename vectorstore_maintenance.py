@@ -0,0 +1,488 @@
+"""
+Maintenance de la base vectorielle Chroma (`./collections`).
+
+- Statistiques : chunks, documents, chunks par département, taille de l'index
+  HNSW, fragmentation, latence de recherche mesurée avec des vecteurs de la
+  collection (aucun appel d'embedding).
+- Chunks orphelins (sans `doc_id`) : invisibles dans la gestion documentaire,
+  ils ne peuvent pas être supprimés depuis l'interface.
+- Compaction : une suppression ne fait que marquer le vecteur comme supprimé
+  dans l'index HNSW, qui grossit et ralentit au fil des mises à jour. La
+  collection est reconstruite dans `<nom>__compact` (vecteurs existants, sans
+  ré-embedding, orphelins retirés, paramètres HNSW éventuellement modifiés)
+  puis échangée avec l'originale, conservée sous `<nom>__old_<date>`. Les
+  phrases et sections des documents disparus sont purgées.
+  L'échange se fait application arrêtée (CLI uniquement) : un processus en
+  cours garde la collection d'origine (par identifiant) et continuerait d'y
+  écrire, sous son nouveau nom `__old_`, jusqu'à son redémarrage.
+- Instantanés : copie cohérente de `./collections` (bases SQLite via l'API de
+  sauvegarde), hors caches et file d'indexation, avec rotation. La
+  restauration se fait elle aussi application arrêtée.
+
+Les opérations qui écrivent refusent de tourner pendant une indexation.
+Le réglage de M / ef se mesure avec `benchmarks/hnsw_benchmark.py`.
+
+    python -m vectorstore_maintenance stats --collection documents
+    python -m vectorstore_maintenance compact --collection documents --search-ef 64
+    python -m vectorstore_maintenance snapshot --label avant-migration
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import struct
+import time
+from datetime import datetime
+
+import chromadb
+
+from docstore import section_store
+from embeddings_backend import collection_backend, set_collection_backend
+from ingestion import VERSION_FILE, bump_collection_version, collection_version
+from ingestion_jobs import ACTIVE_STATES, ingestion_queue
+from sentence_index import sentence_index
+
+BASE_DIR = "./collections"
+SNAPSHOT_DIR = os.getenv("VECTORSTORE_SNAPSHOT_DIR", "./snapshots")
+SNAPSHOT_KEEP = int(os.getenv("VECTORSTORE_SNAPSHOT_KEEP", 7))
+# Caches et file d'indexation : reconstruits ou propres au processus, pas sauvegardés
+SNAPSHOT_EXCLUDE = ("ocr_cache.db", "ingestion_jobs.db", "uploads")
+READ_BATCH = 1000
+LATENCY_QUERIES = 20
+LATENCY_K = 10
+# Collections intermédiaires laissées par la compaction et le ré-embedding
+LEFTOVER_MARKERS = ("__old_", "__compact", "__reembed")
+# Paramètres HNSW de Chroma (métadonnées de collection) et leurs valeurs par défaut
+HNSW_DEFAULTS = {"hnsw:space": "l2", "hnsw:M": 16, "hnsw:construction_ef": 100, "hnsw:search_ef": 10}
+# Fragmentation à partir de laquelle l'administration recommande une compaction
+COMPACTION_THRESHOLD = 0.2
+
+
+def get_client():
+    return chromadb.PersistentClient(path=BASE_DIR)
+
+
+def ingestion_busy() -> bool:
+    """Vrai si un travail d'indexation est en attente ou en cours"""
+    return any(job["state"] in ACTIVE_STATES for job in ingestion_queue.jobs(limit=200))
+
+
+def check_idle(force=False):
+    if not force and ingestion_busy():
+        raise RuntimeError("Indexation en cours : réessayez quand la file est vide (ou forcez)")
+
+
+def confirm_app_stopped() -> bool:
+    """
+    Échange de collections ou de répertoire : aucun processus ne doit garder
+    l'ancienne collection ouverte (CLI uniquement)
+    """
+    answer = input("⚠️ L'application (Streamlit et workers d'indexation) est-elle arrêtée ? [o/N] ")
+    if answer.strip().lower() in ("o", "oui", "y", "yes"):
+        return True
+    print("❌ Abandon : arrêtez l'application puis relancez la commande")
+    return False
+
+
+def directory_size(path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def iter_chunks(collection, include=("metadatas",)):
+    """Parcourt la collection par lots : (ids, {champ: valeurs})"""
+    total = collection.count()
+    for offset in range(0, total, READ_BATCH):
+        page = collection.get(offset=offset, limit=READ_BATCH, include=list(include))
+        if not page["ids"]:
+            break
+        yield page["ids"], page
+
+
+def is_orphan(metadata) -> bool:
+    return not (metadata or {}).get("doc_id")
+
+
+def hnsw_params(collection) -> dict:
+    metadata = collection.metadata or {}
+    return {key: metadata.get(key, default) for key, default in HNSW_DEFAULTS.items()}
+
+
+# ===== STATISTIQUES =====
+
+def _vector_segment_dir(collection):
+    """Répertoire de l'index HNSW de la collection, None s'il est introuvable"""
+    try:
+        conn = sqlite3.connect(f"file:{os.path.join(BASE_DIR, 'chroma.sqlite3')}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT id FROM segments WHERE collection = ? AND scope = 'VECTOR'",
+                               (str(collection.id),)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    path = os.path.join(BASE_DIR, row[0]) if row else None
+    return path if path and os.path.isdir(path) else None
+
+
+def _index_elements(segment_dir):
+    """Éléments de l'index HNSW, supprimés compris (en-tête hnswlib), None si non persisté"""
+    try:
+        with open(os.path.join(segment_dir, "header.bin"), "rb") as f:
+            # offsetLevel0, max_elements, cur_element_count (size_t)
+            _, _, elements = struct.unpack("<QQQ", f.read(24))
+        return elements
+    except (OSError, struct.error, TypeError):
+        return None
+
+
+def measure_latency(collection, ids, queries=LATENCY_QUERIES, k=LATENCY_K):
+    """(moyenne, médiane, p95) en ms de requêtes top-k avec des vecteurs de la collection"""
+    if not ids:
+        return None
+    sample = random.sample(ids, min(queries, len(ids)))
+    vectors = collection.get(ids=sample, include=["embeddings"])["embeddings"]
+    durations = []
+    for vector in vectors:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[list(vector)], n_results=k, include=[])
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return (statistics.mean(durations), statistics.median(durations),
+            durations[min(len(durations) - 1, int(len(durations) * 0.95))])
+
+
+def collection_stats(collection_name, latency=True) -> dict:
+    client = get_client()
+    collection = client.get_collection(collection_name)
+    ids, documents, departments, orphans = [], set(), {}, []
+    for page_ids, page in iter_chunks(collection):
+        ids.extend(page_ids)
+        for chunk_id, meta in zip(page_ids, page["metadatas"]):
+            meta = meta or {}
+            if is_orphan(meta):
+                orphans.append(chunk_id)
+            else:
+                documents.add(meta["doc_id"])
+            department = meta.get("department") or "(aucun)"
+            departments[department] = departments.get(department, 0) + 1
+
+    segment_dir = _vector_segment_dir(collection)
+    elements = _index_elements(segment_dir)
+    return {
+        "collection": collection_name,
+        "chunks": len(ids),
+        "documents": len(documents),
+        "orphans": len(orphans),
+        "departments": dict(sorted(departments.items(), key=lambda item: -item[1])),
+        "index_elements": elements,
+        # Part des éléments de l'index qui sont des vecteurs supprimés
+        "fragmentation": max(0.0, 1 - len(ids) / elements) if elements else None,
+        "index_bytes": directory_size(segment_dir) if segment_dir else None,
+        "disk_bytes": directory_size(BASE_DIR),
+        "hnsw": hnsw_params(collection),
+        "latency_ms": measure_latency(collection, ids) if latency else None,
+        "leftovers": leftover_collections(client),
+    }
+
+
+# ===== ORPHELINS =====
+
+def find_orphans(collection_name) -> list:
+    """Ids des chunks sans `doc_id`"""
+    collection = get_client().get_collection(collection_name)
+    orphans = []
+    for page_ids, page in iter_chunks(collection):
+        orphans.extend(i for i, meta in zip(page_ids, page["metadatas"]) if is_orphan(meta))
+    return orphans
+
+
+def delete_orphans(collection_name, force=False) -> int:
+    check_idle(force)
+    orphans = find_orphans(collection_name)
+    collection = get_client().get_collection(collection_name)
+    for i in range(0, len(orphans), READ_BATCH):
+        collection.delete(ids=orphans[i:i + READ_BATCH])
+    if orphans:
+        bump_collection_version()
+    return len(orphans)
+
+
+# ===== COMPACTION =====
+
+def leftover_collections(client=None) -> list:
+    client = client or get_client()
+    names = [c if isinstance(c, str) else c.name for c in client.list_collections()]
+    return sorted(name for name in names if any(marker in name for marker in LEFTOVER_MARKERS))
+
+
+def drop_leftovers(names=None) -> list:
+    """Supprime les collections intermédiaires (toutes par défaut)"""
+    client = get_client()
+    names = names or leftover_collections(client)
+    for name in names:
+        client.delete_collection(name)
+    return names
+
+
+def compact(collection_name, M=None, construction_ef=None, search_ef=None, drop_orphans=True,
+            swap=True, force=False) -> dict:
+    """
+    Reconstruit la collection sans les vecteurs supprimés (et sans les orphelins),
+    avec éventuellement d'autres paramètres HNSW, puis l'échange avec l'originale.
+    Avec `swap`, l'application doit être arrêtée (cf. docstring du module).
+    """
+    check_idle(force)
+    client = get_client()
+    source = client.get_collection(collection_name)
+    metadata = dict(source.metadata or {})
+    for key, value in (("hnsw:M", M), ("hnsw:construction_ef", construction_ef), ("hnsw:search_ef", search_ef)):
+        if value:
+            metadata[key] = int(value)
+
+    target_name = f"{collection_name}__compact"
+    try:
+        # Reprise après une compaction interrompue : on repart de zéro
+        client.delete_collection(target_name)
+    except Exception:
+        pass
+    target = client.create_collection(target_name, metadata=metadata or None)
+
+    start = time.perf_counter()
+    total, copied, dropped = source.count(), 0, 0
+    live_hashes, live_docs = set(), set()
+    print(f"📚 {total} chunks à recopier dans '{target_name}'")
+    for page_ids, page in iter_chunks(source, include=("documents", "metadatas", "embeddings")):
+        keep = [i for i, meta in enumerate(page["metadatas"]) if not (drop_orphans and is_orphan(meta))]
+        dropped += len(page_ids) - len(keep)
+        if keep:
+            target.add(
+                ids=[page_ids[i] for i in keep],
+                documents=[page["documents"][i] for i in keep],
+                metadatas=[page["metadatas"][i] for i in keep],
+                embeddings=[list(page["embeddings"][i]) for i in keep],
+            )
+        for i in keep:
+            meta = page["metadatas"][i] or {}
+            live_hashes.add(meta.get("chunk_hash"))
+            live_docs.add(meta.get("doc_id"))
+        copied += len(keep)
+        print(f"   {copied + dropped}/{total} chunks", end="\r", flush=True)
+    print()
+
+    if target.count() != copied:
+        raise RuntimeError(f"Copie incomplète ({target.count()}/{copied}) : '{collection_name}' inchangée")
+
+    backend = collection_backend(collection_name)
+    backup_name = None
+    if swap:
+        backup_name = f"{collection_name}__old_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        source.modify(name=backup_name)
+        target.modify(name=collection_name)
+        print(f"🔁 '{collection_name}' compactée ; ancienne collection conservée sous '{backup_name}'")
+    elif backend:
+        set_collection_backend(target_name, backend["backend"], backend.get("model"))
+
+    # Index annexes : phrases et sections des chunks et documents disparus
+    pruned_sections = section_store.prune(live_docs - {None})
+    # Les phrases des sections parentes (précalculées) restent vivantes avec leurs documents
+    live_hashes = (live_hashes - {None}) | section_store.live_hashes()
+    pruned_sentences = sentence_index.prune(live_hashes) if sentence_index is not None else 0
+    bump_collection_version()
+
+    report = {
+        "collection": collection_name if swap else target_name,
+        "backup": backup_name,
+        "chunks": copied,
+        "orphans_dropped": dropped,
+        "pruned_sentences": pruned_sentences,
+        "pruned_sections": pruned_sections,
+        "hnsw": hnsw_params(target),
+        "seconds": time.perf_counter() - start,
+    }
+    print(f"✅ {copied} chunks, {dropped} orphelin(s) retiré(s), {pruned_sentences} phrase(s) et "
+          f"{pruned_sections} section(s) purgée(s) en {report['seconds']:.1f} s")
+    return report
+
+
+# ===== INSTANTANÉS =====
+
+def _is_sqlite(path) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(16) == b"SQLite format 3\x00"
+    except OSError:
+        return False
+
+
+def _copy_file(source, destination):
+    if _is_sqlite(source):
+        # Copie cohérente même si la base est ouverte par l'application
+        src, dst = sqlite3.connect(source), sqlite3.connect(destination)
+        try:
+            src.backup(dst)
+        finally:
+            src.close()
+            dst.close()
+    else:
+        shutil.copy2(source, destination)
+
+
+def create_snapshot(label=None, force=False) -> str:
+    """Copie `./collections` dans SNAPSHOT_DIR, garde les SNAPSHOT_KEEP derniers instantanés"""
+    check_idle(force)
+    name = datetime.now().strftime("%Y%m%d-%H%M%S") + (f"_{label}" if label else "")
+    destination = os.path.join(SNAPSHOT_DIR, name)
+    files = 0
+    for root, dirs, filenames in os.walk(BASE_DIR):
+        if root == BASE_DIR:
+            dirs[:] = [d for d in dirs if d not in SNAPSHOT_EXCLUDE]
+            filenames = [f for f in filenames if f not in SNAPSHOT_EXCLUDE]
+        target_dir = os.path.join(destination, os.path.relpath(root, BASE_DIR))
+        os.makedirs(target_dir, exist_ok=True)
+        for filename in filenames:
+            if filename.endswith(("-wal", "-shm", "-journal")):
+                continue
+            _copy_file(os.path.join(root, filename), os.path.join(target_dir, filename))
+            files += 1
+
+    info = {"name": name, "label": label, "created_at": datetime.now().isoformat(timespec="seconds"),
+            "files": files, "bytes": directory_size(destination), "collection_version": collection_version()}
+    with open(os.path.join(destination, "snapshot.json"), "w") as f:
+        json.dump(info, f)
+
+    for old in list_snapshots()[SNAPSHOT_KEEP:]:
+        shutil.rmtree(os.path.join(SNAPSHOT_DIR, old["name"]), ignore_errors=True)
+    print(f"📸 Instantané '{name}' : {files} fichiers, {info['bytes'] / 1024 / 1024:.1f} Mo")
+    return destination
+
+
+def list_snapshots() -> list:
+    """Instantanés du plus récent au plus ancien"""
+    snapshots = []
+    if os.path.isdir(SNAPSHOT_DIR):
+        for name in os.listdir(SNAPSHOT_DIR):
+            try:
+                with open(os.path.join(SNAPSHOT_DIR, name, "snapshot.json")) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return sorted(snapshots, key=lambda s: s["created_at"], reverse=True)
+
+
+def restore_snapshot(name, force=False) -> str:
+    """
+    Remplace `./collections` par un instantané (application arrêtée). Le
+    répertoire courant est mis de côté ; caches et file d'indexation sont gardés.
+    """
+    check_idle(force)
+    source = os.path.join(SNAPSHOT_DIR, name)
+    if not os.path.isfile(os.path.join(source, "snapshot.json")):
+        raise ValueError(f"Instantané introuvable : {name}")
+
+    version = collection_version()
+    aside = f"{BASE_DIR.rstrip('/')}.before_restore_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    os.rename(BASE_DIR, aside)
+    shutil.copytree(source, BASE_DIR, ignore=shutil.ignore_patterns("snapshot.json"))
+    for entry in SNAPSHOT_EXCLUDE:
+        if os.path.exists(os.path.join(aside, entry)):
+            shutil.move(os.path.join(aside, entry), os.path.join(BASE_DIR, entry))
+
+    # Version au-delà de toutes celles déjà vues : les caches de recherche sont invalidés
+    with open(VERSION_FILE, "w") as f:
+        f.write(str(version))
+    bump_collection_version()
+    print(f"♻️ '{name}' restauré ; ancien répertoire conservé sous '{aside}'")
+    return aside
+
+
+# ===== CLI =====
+
+def print_stats(stats):
+    print(f"📚 Collection '{stats['collection']}'")
+    print(f"   Chunks : {stats['chunks']} · documents : {stats['documents']} · orphelins : {stats['orphans']}")
+    for department, count in stats["departments"].items():
+        print(f"   - {department} : {count}")
+    if stats["index_elements"] is not None:
+        print(f"   Index HNSW : {stats['index_elements']} éléments, {stats['index_bytes'] / 1024 / 1024:.1f} Mo, "
+              f"fragmentation {stats['fragmentation']:.0%}")
+    print(f"   Paramètres : {', '.join(f'{k}={v}' for k, v in stats['hnsw'].items())}")
+    print(f"   Répertoire {BASE_DIR} : {stats['disk_bytes'] / 1024 / 1024:.1f} Mo")
+    if stats["latency_ms"]:
+        mean, median, p95 = stats["latency_ms"]
+        print(f"   Latence top-{LATENCY_K} : moy. {mean:.1f} ms · méd. {median:.1f} ms · p95 {p95:.1f} ms")
+    if stats["leftovers"]:
+        print(f"   Collections intermédiaires : {', '.join(stats['leftovers'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintenance de la base vectorielle Chroma")
+    parser.add_argument("--force", action="store_true", help="Ignorer les indexations en cours")
+    parser.add_argument("--yes", action="store_true", help="Confirmer que l'application est arrêtée")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats_parser = commands.add_parser("stats", help="Statistiques de la collection")
+    stats_parser.add_argument("--collection", required=True)
+    stats_parser.add_argument("--no-latency", action="store_true", help="Ne pas mesurer la latence")
+
+    orphans_parser = commands.add_parser("orphans", help="Chunks sans doc_id")
+    orphans_parser.add_argument("--collection", required=True)
+    orphans_parser.add_argument("--delete", action="store_true", help="Supprimer les orphelins")
+
+    compact_parser = commands.add_parser("compact", help="Reconstruction de la collection")
+    compact_parser.add_argument("--collection", required=True)
+    compact_parser.add_argument("--M", type=int, help="Voisins par nœud HNSW")
+    compact_parser.add_argument("--construction-ef", type=int)
+    compact_parser.add_argument("--search-ef", type=int)
+    compact_parser.add_argument("--keep-orphans", action="store_true")
+    compact_parser.add_argument("--no-swap", action="store_true", help="Laisser la copie sous <nom>__compact")
+
+    commands.add_parser("cleanup", help="Supprimer les collections __old_ / __compact / __reembed")
+
+    snapshot_parser = commands.add_parser("snapshot", help="Instantané de ./collections")
+    snapshot_parser.add_argument("--label")
+
+    commands.add_parser("snapshots", help="Lister les instantanés")
+
+    restore_parser = commands.add_parser("restore", help="Restaurer un instantané (application arrêtée)")
+    restore_parser.add_argument("name")
+
+    args = parser.parse_args()
+    swapping = args.command == "restore" or (args.command == "compact" and not args.no_swap)
+    if swapping and not args.yes and not confirm_app_stopped():
+        raise SystemExit(1)
+    print("=" * 60)
+    if args.command == "stats":
+        print_stats(collection_stats(args.collection, latency=not args.no_latency))
+    elif args.command == "orphans":
+        if args.delete:
+            print(f"🗑️ {delete_orphans(args.collection, args.force)} chunk(s) orphelin(s) supprimé(s)")
+        else:
+            orphans = find_orphans(args.collection)
+            print(f"🔎 {len(orphans)} chunk(s) sans doc_id")
+            for chunk_id in orphans[:20]:
+                print(f"   - {chunk_id}")
+    elif args.command == "compact":
+        compact(args.collection, args.M, args.construction_ef, args.search_ef,
+                drop_orphans=not args.keep_orphans, swap=not args.no_swap, force=args.force)
+    elif args.command == "cleanup":
+        dropped = drop_leftovers()
+        print(f"🧹 {len(dropped)} collection(s) supprimée(s){' : ' + ', '.join(dropped) if dropped else ''}")
+    elif args.command == "snapshot":
+        create_snapshot(args.label, args.force)
+    elif args.command == "snapshots":
+        for snapshot in list_snapshots():
+            print(f"   {snapshot['name']} · {snapshot['created_at']} · {snapshot['bytes'] / 1024 / 1024:.1f} Mo")
+    elif args.command == "restore":
+        restore_snapshot(args.name, args.force)
+    print("=" * 60)